@@ -1,32 +1,35 @@
+import argparse
+import math
+import numpy as np
 import pygame
 import random
-import math
 import sys
-import os
-import base64
-from io import BytesIO
-
-pygame.init()
-
-# Constants
-SCREEN_WIDTH = 800
-SCREEN_HEIGHT = 600
-PLANE_WIDTH = 60
-PLANE_HEIGHT = 30
-GRAVITY = 0.2
-FLIGHT_POWER = 0.5
-ASTEROID_SIZE = 40
-FUEL_SIZE = 30
-STAR_SIZE = 25
-INITIAL_SCROLL_SPEED = 2
-MAX_BATTERY = 100
-BATTERY_DRAIN_RATE = 1      # Battery drain per second
-BATTERY_RECHARGE = 30
-COLLISION_COOLDOWN = 1000   # milliseconds
-SCORE_PER_SECOND = 10
-SCORE_PER_STAR = 100
-FPS = 60
-LEVEL_COUNT = 5             # Total levels
+import time
+
+import assets
+import background
+import replay
+import sim
+import solver
+import ui
+from collision import CollisionMasks
+from governor import QUALITY_LEVELS, QualityGovernor
+from particles import DEFAULT_CAPACITY, DEBRIS, EXHAUST, SPARKLE, ParticlePool
+from prefetch import LevelPrefetcher
+from profiler import NULL_PROFILER, FrameProfiler
+from rewind import Rewind
+from entities import TYPE_NAMES, ASTEROID, FUEL
+from endless import ChunkStreamer
+from levelfile import LevelFiles, LevelFileError
+from sim import (
+    SCREEN_WIDTH, SCREEN_HEIGHT, MAX_BATTERY, FPS, FRAME_MS,
+    INPUT_UP, INPUT_DOWN, INPUT_LEFT, INPUT_RIGHT,
+)
+
+# Most simulation steps to run per rendered frame before dropping the backlog
+MAX_STEPS_PER_FRAME = 5
+# Frame rate of the loop while the picture is not changing (menus, game over)
+IDLE_FPS = 15
 
 # Colors
 WHITE = (255, 255, 255)
@@ -38,441 +41,478 @@ RED = (244, 67, 54)
 GREEN = (76, 175, 80)
 YELLOW = (255, 215, 0)
 ORANGE = (255, 102, 0)
+PURPLE = (120, 60, 160)
+GRAY = (150, 150, 150)
 
-# Set up the display
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-pygame.display.set_caption("Sky Navigator")
-clock = pygame.time.Clock()
+# Particle colors, indexed as in emit()
+EFFECT_COLORS = [ORANGE, GRAY, GREEN, YELLOW]
+FLAME, DUST, FUEL_SPARK, STAR_SPARK = range(len(EFFECT_COLORS))
 
-# Load fonts
-font_small = pygame.font.SysFont("Arial", 14)
-font_medium = pygame.font.SysFont("Arial", 24)
-font_large = pygame.font.SysFont("Arial", 48)
+MENU_INSTRUCTIONS = [
+    "Navigate your plane through a dangerous asteroid field!",
+    "",
+    "CONTROLS:",
+    "↑ - Move Up",
+    "↓ - Move Down",
+    "← - Slow Down",
+    "→ - Speed Up",
+    "BACKSPACE (hold) - Rewind",
+    "",
+    "Collect fuel to recharge your battery and stars for bonus points!",
+    "Reach the finish line to complete the level.",
+    "",
+    "Press SPACE to start"
+]
 
-# Function to create embedded images (for standalone file)
-def create_image_from_base64(base64_string, size=None):
-    try:
-        image_data = base64.b64decode(base64_string)
-        image_file = BytesIO(image_data)
-        image = pygame.image.load(image_file)
-        if size:
-            image = pygame.transform.scale(image, size)
-        return image
-    except Exception as e:
-        print(f"Error loading image: {e}")
-        surf = pygame.Surface(size if size else (30, 30))
-        surf.fill(YELLOW)
-        return surf
-
-# Base64 encoded images
-plane_base64 = """
-PHN2ZyB4bWxucz0iaHR0cDovL3d3dy53My5vcmcvMjAwMC9zdmciIHZpZXdCb3g9IjAgMCA2MCAzMCI+PHBhdGggZD0iTTYwLDE1YzAtMi43LTYuMy01LTE1LTVIMzBMMCwzMGgzMGwxNSw5LDYtMTJjNS43LTAuMyw5LTIuMSw5LTUuNiIgZmlsbD0iI2ZmZiIvPjxwYXRoIGQ9Ik0zMCwzMGgxNWw2LTEyYzAtMS0xLTItMy0zSDMwbC02LDEyIiBmaWxsPSIjZmZkNzAwIi8+PHBhdGggZD0iTTYwLDE1YzAtMi43LTYuMy01LTE1LTVIMzBMMCwzMGgzMGwxNSw5LDYtMTJjNS43LTAuMyw5LTIuMSw5LTUuNiIgZmlsbD0ibm9uZSIgc3Ryb2tlPSIjMDAwIiBzdHJva2Utd2lkdGg9IjEuNSIvPjxlbGxpcHNlIGN4PSI0MyIgY3k9IjE1IiByeD0iMyIgcnk9IjIiIGZpbGw9IiMzMzMiLz48L3N2Zz4=
-"""
-
-asteroid_base64 = """
-PHN2ZyB4bWxucz0iaHR0cDovL3d3dy53My5vcmcvMjAwMC9zdmciIHZpZXdCb3g9IjAgMCA0MCA0MCI+PHBhdGggZD0iTTIwLDBjMyw1IDgsMyAxMCw1czIsOCA1LDEwLTMsOC01LDEwLTgsMi0xMCw1LTgsLTMtMTAsLTUtMi04LTUtMTAsMy04IDUtMTBDMTIsMiAxNyw1IDIwLDAiIGZpbGw9IiM4MDgwODAiIHN0cm9rZT0iIzMzMyIgc3Ryb2tlLXdpZHRoPSIxLjUiLz48Y2lyY2xlIGN4PSIxNSIgY3k9IjE1IiByPSIzIiBmaWxsPSIjNjY2Ii8+PGNpcmNsZSBjeD0iMjgiIGN5PSIyMCIgcj0iNCIgZmlsbD0iIzY2NiIvPjxjaXJjbGUgY3g9IjIwIiBjeT0iMjgiIHI9IjIiIGZpbGw9IiM2NjYiLz48L3N2Zz4=
-"""
-
-fuel_base64 = """
-PHN2ZyB4bWxucz0iaHR0cDovL3d3dy53My5vcmcvMjAwMC9zdmciIHZpZXdCb3g9IjAgMCAzMCAzMCI+PHJlY3QgeD0iNSIgeT0iNSIgd2lkdGg9IjIwIiBoZWlnaHQ9IjI1IiByeD0iMyIgcnk9IjMiIGZpbGw9IiNkZGQiIHN0cm9rZT0iIzMzMyIgc3Ryb2tlLXdpZHRoPSIxLjUiLz48cmVjdCB4PSI4IiB5PSI4IiB3aWR0aD0iMTQiIGhlaWdodD0iMTYiIGZpbGw9IiM0Y2FmNTAiLz48cmVjdCB4PSIxMiIgeT0iMCIgd2lkdGg9IjYiIGhlaWdodD0iNSIgZmlsbD0iIzY2NiIvPjwvc3ZnPg==
-"""
-
-star_base64 = """
-PHN2ZyB4bWxucz0iaHR0cDovL3d3dy53My5vcmcvMjAwMC9zdmciIHZpZXdCb3g9IjAgMCAyNSAyNSI+PHBhdGggZD0iTTEyLjUsMWw0LDgsOCwxLTYsNiwxLjUsOEwxMi41LDIwLDUsMjRsMS41LTgtNi02LDgtMVoiIGZpbGw9IiNmZmQ3MDAiIHN0cm9rZT0iI2ZmODYwMCIgc3Ryb2tlLXdpZHRoPSIxIi8+PC9zdmc+
-"""
-
-finish_base64 = """
-PHN2ZyB4bWxucz0iaHR0cDovL3d3dy53My5vcmcvMjAwMC9zdmciIHZpZXdCb3g9IjAgMCA2MCAzMDAiPjxyZWN0IHdpZHRoPSI2MCIgaGVpZ2h0PSIzMDAiIGZpbGw9IiMzMzMiLz48cGF0aCBkPSJNMCwwaDYwdjMwSDBWMzBoNjB2MzBIMFY2MGg2MHYzMEgwVjkwaDYwdjMwSDBWMTIwaDYwdjMwSDBWMTUwaDYwdjMwSDBWMTgwaDYwdjMwSDBWMjEwaDYwdjMwSDBWMjQwaDYwdjMwSDBWMjcwaDYwdjMwSDBWMzAwWiIgZmlsbD0ibm9uZSIgc3Ryb2tlPSIjZmZmIiBzdHJva2Utd2lkdGg9IjEuNSIgc3Ryb2tlLWRhc2hhcnJheT0iMzAsMzAiLz48dGV4dCB4PSI1IiB5PSIxNTAiIGZvbnQtZmFtaWx5PSJBcmlhbCIgZm9udC1zaXplPSIyMCIgZmlsbD0iI2ZmZiIgdHJhbnNmb3JtPSJyb3RhdGUoOTAsMzAsMTUwKSI+RklOSVNIPC90ZXh0Pjwvc3ZnPg==
-"""
-
-# Load images
-plane_img = create_image_from_base64(plane_base64, (PLANE_WIDTH, PLANE_HEIGHT))
-asteroid_img = create_image_from_base64(asteroid_base64, (ASTEROID_SIZE, ASTEROID_SIZE))
-fuel_img = create_image_from_base64(fuel_base64, (FUEL_SIZE, FUEL_SIZE))
-star_img = create_image_from_base64(star_base64, (STAR_SIZE, STAR_SIZE))
-finish_img = create_image_from_base64(finish_base64, (60, SCREEN_HEIGHT))
-
-# Game classes
-class Plane:
-    def __init__(self, x, y):
-        self.x = x
-        self.y = y
-        self.width = PLANE_WIDTH
-        self.height = PLANE_HEIGHT
-        self.velocity_y = 0
-        self.velocity_x = 0
-        self.max_velocity_x = 5
-        self.min_velocity_x = -2
-        self.rect = pygame.Rect(x, y, PLANE_WIDTH, PLANE_HEIGHT)
-    
-    def update(self, keys):
-        # Apply gravity
-        self.velocity_y += GRAVITY
-        
-        # Apply player input
-        if keys[pygame.K_UP]:
-            self.velocity_y -= FLIGHT_POWER
-        if keys[pygame.K_DOWN]:
-            self.velocity_y += FLIGHT_POWER / 2
-        if keys[pygame.K_RIGHT]:
-            self.velocity_x += 0.1
-            if self.velocity_x > self.max_velocity_x:
-                self.velocity_x = self.max_velocity_x
-        elif keys[pygame.K_LEFT]:
-            self.velocity_x -= 0.1
-            if self.velocity_x < self.min_velocity_x:
-                self.velocity_x = self.min_velocity_x
-        else:
-            # Gradually return to normal speed
-            if self.velocity_x > 0:
-                self.velocity_x -= 0.05
-            elif self.velocity_x < 0:
-                self.velocity_x += 0.05
-            if abs(self.velocity_x) < 0.1:
-                self.velocity_x = 0
-        
-        # Update position
-        self.y += self.velocity_y
-        
-        # Keep plane within top bound only; touching the bottom will trigger a crash
-        if self.y < 0:
-            self.y = 0
-            self.velocity_y = 0
-        
-        # Update rect for collision detection
-        self.rect.x = self.x
-        self.rect.y = self.y
-    
-    def draw(self, surface, is_colliding):
+
+EXTRA_LAYERS = ('stars', 'nebula')  # optional far background layers, for --layers
+
+
+def build_background(extra_layers=()):
+    # Optional far layers go behind the two cloud layers
+    layers = []
+    if 'nebula' in extra_layers:
+        layers.append(background.nebula_layer(0.1, PURPLE, DARK_BLUE))
+    if 'stars' in extra_layers:
+        layers.append(background.star_layer(0.25, WHITE))
+    layers.append(background.cloud_layer(0.5, LIGHT_BLUE, 30))
+    layers.append(background.cloud_layer(1, BLUE, 20))
+    return background.ParallaxBackground(DARK_BLUE, layers)
+
+
+def scale_image(image, scale):
+    return pygame.transform.smoothscale(image, (max(1, round(image.get_width() * scale)),
+                                                max(1, round(image.get_height() * scale))))
+
+
+def read_inputs():
+    # Translate the arrow keys into the simulation's input bitmask
+    keys = pygame.key.get_pressed()
+    inputs = 0
+    if keys[pygame.K_UP]:
+        inputs |= INPUT_UP
+    if keys[pygame.K_DOWN]:
+        inputs |= INPUT_DOWN
+    if keys[pygame.K_LEFT]:
+        inputs |= INPUT_LEFT
+    if keys[pygame.K_RIGHT]:
+        inputs |= INPUT_RIGHT
+    return inputs
+
+
+# Game rendering; the rules themselves live in sim.Game
+class Game(sim.Game):
+    def __init__(self, screen, seed=None, streamer=None, extra_layers=(), precise=True,
+                 particles=DEFAULT_CAPACITY):
+        super().__init__(seed, streamer)
+        self.screen = screen
+        # Sprites are fetched once the display exists so they come back converted
+        sprites = assets.SpriteCache()
+        self.plane_img = sprites.get('plane')
+        # Indexed by entity type code
+        self.object_images = [sprites.get(name) for name in TYPE_NAMES]
+        # Collide on sprite pixels rather than bounding boxes
+        if precise:
+            self.masks = CollisionMasks(sprites)
+        self.background = build_background(extra_layers)
+        # Render quality, lowered on slow machines (see governor.py).  Below
+        # full scale the world is drawn into a smaller surface, with
+        # sprites and background scaled to match, then stretched to the window.
+        self.quality = QUALITY_LEVELS[0]
+        self.world = screen
+        self.scaled_assets = {1.0: (self.plane_img, self.object_images, self.background, screen)}
+        # Exhaust, debris and sparkles; particles is the most alive at once
+        self.particles = ParticlePool(particles)
+        self.font_small = pygame.font.SysFont("Arial", 14)
+        self.font_medium = pygame.font.SysFont("Arial", 24)
+        self.font_large = pygame.font.SysFont("Arial", 48)
+        self.text_cache = ui.TextCache()
+        self.overlays = ui.OverlayCache()
+        self.drawn_key = None
+        # Area kept clean by keep_clean(), and its pixels as last drawn
+        self.clean_rect = None
+        self.clean_pixels = None
+
+    def set_quality(self, quality):
+        scale = quality.scale
+        if scale not in self.scaled_assets:
+            plane_img, object_images, background, _ = self.scaled_assets[1.0]
+            world = pygame.Surface((round(SCREEN_WIDTH * scale), round(SCREEN_HEIGHT * scale))).convert()
+            self.scaled_assets[scale] = (
+                scale_image(plane_img, scale), [scale_image(image, scale) for image in object_images],
+                background.scaled(scale), world)
+        self.plane_img, self.object_images, self.background, self.world = self.scaled_assets[scale]
+        self.quality = quality
+        self.invalidate()
+
+    def init_level(self, level_num):
+        super().init_level(level_num)
+        self.particles.clear()
+
+    def restore(self, state):
+        super().restore(state)
+        self.particles.clear()
+
+    def start_rewind(self):
+        # Called as rewinding begins.  Effects belong to the frames being
+        # undone: debris would keep flying over asteroids put back in place.
+        self.particles.clear()
+
+    def update(self, inputs=0):
+        frame = self.frame
+        super().update(inputs)
+        if self.frame == frame:
+            return
+        plane = self.plane
+        if plane.inputs & INPUT_RIGHT and self.quality.thrust:
+            # Exhaust leaves the tail slower than the plane flies, so it trails off behind
+            self.particles.emit(2, self.level_position + plane.x, plane.y + plane.height / 2, EXHAUST, FLAME,
+                                speed=(1, 3), vx=self.scroll_speed + plane.velocity_x,
+                                angle=(math.pi * 0.85, math.pi * 1.15))
+        self.particles.update()
+
+    def deactivate(self, indices):
+        # Debris where an asteroid was hit, sparkles where a pickup was collected
+        super().deactivate(indices)
+        entities = self.entities
+        for i in np.atleast_1d(indices).tolist():
+            x = self.level_position + entities.screen_x[i] + entities.width[i] / 2
+            y = entities.y[i] + entities.height[i] / 2
+            kind = entities.kind[i]
+            if kind == ASTEROID:
+                self.particles.emit(24, x, y, DEBRIS, DUST, speed=(1, 4))
+            else:
+                self.particles.emit(16, x, y, SPARKLE, FUEL_SPARK if kind == FUEL else STAR_SPARK,
+                                    speed=(0.5, 2.5))
+
+    def draw_plane(self):
+        plane = self.plane
+        scale = self.quality.scale
+        x = plane.x * scale
+        y = plane.y * scale
         # Draw thrust effect if accelerating
-        keys = pygame.key.get_pressed()
-        if keys[pygame.K_RIGHT]:
+        if plane.inputs & INPUT_RIGHT and self.quality.thrust:
+            middle = y + plane.height * scale / 2
             points = [
-                (self.x, self.y + self.height / 2),
-                (self.x - 15, self.y + self.height / 2 - 10),
-                (self.x - 25, self.y + self.height / 2),
-                (self.x - 15, self.y + self.height / 2 + 10),
+                (x, middle),
+                (x - 15 * scale, middle - 10 * scale),
+                (x - 25 * scale, middle),
+                (x - 15 * scale, middle + 10 * scale),
             ]
-            pygame.draw.polygon(surface, ORANGE, points)
+            pygame.draw.polygon(self.world, ORANGE, points)
         # Flash if colliding
-        if is_colliding:
-            if pygame.time.get_ticks() % 200 < 100:
-                surface.blit(plane_img, (self.x, self.y))
+        if self.is_colliding:
+            if self.time_ms % 200 < 100:
+                self.world.blit(self.plane_img, (x, y))
         else:
-            surface.blit(plane_img, (self.x, self.y))
-
-class GameObject:
-    def __init__(self, x, y, width, height, obj_type, image):
-        self.x = x
-        self.y = y
-        self.width = width
-        self.height = height
-        self.type = obj_type
-        self.image = image
-        self.active = True
-        self.rect = pygame.Rect(x, y, width, height)
-        # For moving asteroids (set later if needed)
-        self.moving = False
-
-    def update(self, level_position):
-        # If this is a moving asteroid, add an oscillating offset
-        if self.type == 'asteroid' and self.moving:
-            # Calculate oscillation offset using time elapsed since spawn
-            t = (pygame.time.get_ticks() - self.spawn_time) / 1000.0
-            offset = self.oscillation_amplitude * math.sin(t * self.oscillation_speed)
-            current_x = self.x + offset
-            self.rect.x = current_x - level_position
-        else:
-            self.rect.x = self.x - level_position
-        self.rect.y = self.y
-    
-    def draw(self, surface, level_position):
-        if self.active:
-            screen_x = self.x - level_position
-            # For moving asteroids, recalc using oscillation offset
-            if self.type == 'asteroid' and self.moving:
-                t = (pygame.time.get_ticks() - self.spawn_time) / 1000.0
-                offset = self.oscillation_amplitude * math.sin(t * self.oscillation_speed)
-                screen_x = (self.x + offset) - level_position
-            if -self.width <= screen_x <= SCREEN_WIDTH:
-                surface.blit(self.image, (screen_x, self.y))
-                
-    def check_collision(self, other_rect):
-        return self.active and self.rect.colliderect(other_rect)
-
-class Game:
-    def __init__(self):
-        self.reset()
-    
-    def reset(self):
-        self.plane = Plane(150, SCREEN_HEIGHT / 2)
-        self.level = 1
-        self.score = 0
-        self.battery_level = MAX_BATTERY
-        self.scroll_speed = INITIAL_SCROLL_SPEED
-        self.game_active = False
-        self.game_over = False
-        self.level_complete = False
-        self.level_position = 0
-        self.game_objects = []
-        self.is_colliding = False
-        self.last_collision_time = 0
-        self.start_time = 0
-        self.win = False  # Indicates completion of level 5
-    
-    def start_game(self):
-        self.reset()
-        self.game_active = True
-        self.init_level(self.level)
-        self.start_time = pygame.time.get_ticks()
-    
-    def next_level(self):
-        if self.level < LEVEL_COUNT:
-            self.level += 1
-            self.plane = Plane(150, SCREEN_HEIGHT / 2)
-            self.battery_level = MAX_BATTERY
-            self.scroll_speed = INITIAL_SCROLL_SPEED + (self.level * 0.5)
-            self.game_active = True
-            self.level_complete = False
-            self.init_level(self.level)
-        else:
-            # Already at final level: mark win (this state is set when finish line is reached)
-            self.win = True
+            self.world.blit(self.plane_img, (x, y))
 
-    def init_level(self, level_num):
-        self.game_objects = []
-        self.level_position = 0
-        level_length = 5000
-        
-        # Create asteroids (obstacles)
-        asteroid_count = 20 + (level_num * 5)
-        for i in range(asteroid_count):
-            x = random.random() * (level_length - 500) + 500  # Clear first 500px
-            y = random.random() * (SCREEN_HEIGHT - ASTEROID_SIZE)
-            asteroid = GameObject(x, y, ASTEROID_SIZE, ASTEROID_SIZE, 'asteroid', asteroid_img)
-            # For levels 3 and above, asteroids start moving
-            if level_num >= 3:
-                asteroid.moving = True
-                asteroid.oscillation_speed = random.uniform(1, 3)
-                asteroid.oscillation_amplitude = random.randint(10, 30)
-                asteroid.spawn_time = pygame.time.get_ticks()
-            self.game_objects.append(asteroid)
-        
-        # Create fuel canisters
-        fuel_count = 10 + level_num
-        for i in range(fuel_count):
-            x = random.random() * (level_length - 500) + 500
-            y = random.random() * (SCREEN_HEIGHT - FUEL_SIZE)
-            self.game_objects.append(GameObject(x, y, FUEL_SIZE, FUEL_SIZE, 'fuel', fuel_img))
-        
-        # Create stars (bonus points)
-        star_count = 15 + (level_num * 2)
-        for i in range(star_count):
-            x = random.random() * (level_length - 500) + 500
-            y = random.random() * (SCREEN_HEIGHT - STAR_SIZE)
-            self.game_objects.append(GameObject(x, y, STAR_SIZE, STAR_SIZE, 'star', star_img))
-        
-        # Create a finish line object at the end of the level
-        finish_line = GameObject(level_length + 200, 0, 60, SCREEN_HEIGHT, 'finish', finish_img)
-        self.game_objects.append(finish_line)
-    
-    def update(self):
-        if not self.game_active:
-            return
-        
-        current_time = pygame.time.get_ticks()
-        delta_time = (current_time - self.start_time) / 1000  # seconds
-        self.start_time = current_time
-        
-        # Update score based on time
-        self.score += math.floor(SCORE_PER_SECOND * delta_time)
-        
-        keys = pygame.key.get_pressed()
-        self.plane.update(keys)
-        
-        # Crash if the plane touches the bottom of the screen
-        if self.plane.y + self.plane.height >= SCREEN_HEIGHT:
-            self.game_active = False
-            self.game_over = True
-            return
-        
-        # Scroll the level
-        self.level_position += self.scroll_speed + self.plane.velocity_x
-        
-        # Update game objects
-        for obj in self.game_objects:
-            obj.update(self.level_position)
-        
-        self.check_collisions()
-        
-        # Drain battery over time
-        self.battery_level -= BATTERY_DRAIN_RATE * delta_time
-        if self.battery_level <= 0:
-            self.battery_level = 0
-            self.game_active = False
-            self.game_over = True
-
-    def check_collisions(self):
-        current_time = pygame.time.get_ticks()
-        if current_time - self.last_collision_time < COLLISION_COOLDOWN:
-            self.is_colliding = False
-            return
-        
-        for obj in self.game_objects:
-            if obj.check_collision(self.plane.rect):
-                if obj.type == 'asteroid':
-                    if not self.is_colliding:
-                        self.is_colliding = True
-                        self.last_collision_time = current_time
-                        self.battery_level -= 20
-                        if self.battery_level < 0:
-                            self.battery_level = 0
-                        obj.active = False
-                elif obj.type == 'fuel':
-                    self.battery_level += BATTERY_RECHARGE
-                    if self.battery_level > MAX_BATTERY:
-                        self.battery_level = MAX_BATTERY
-                    obj.active = False
-                elif obj.type == 'star':
-                    self.score += SCORE_PER_STAR
-                    obj.active = False
-                elif obj.type == 'finish':
-                    self.game_active = False
-                    if self.level < LEVEL_COUNT:
-                        self.level_complete = True
-                    else:
-                        self.win = True
+    def draw_objects(self):
+        entities = self.entities
+        shown = entities.visible(self.view_window.lo, self.view_window.hi, SCREEN_WIDTH)
+        images = self.object_images
+        xs = entities.screen_x[shown]
+        ys = entities.y[shown]
+        if self.quality.scale != 1:
+            xs = xs * self.quality.scale
+            ys = ys * self.quality.scale
+        self.world.blits([
+            (images[kind], (x, y)) for kind, x, y in zip(entities.kind[shown].tolist(), xs.tolist(), ys.tolist())
+        ], False)
 
     def draw_background(self):
-        screen.fill(DARK_BLUE)
-        self.draw_clouds(0.5, LIGHT_BLUE, 30)
-        self.draw_clouds(1, BLUE, 20)
-
-    def draw_clouds(self, depth, color, size):
-        offset = (self.level_position * depth) % (SCREEN_WIDTH * 2)
-        for i in range(10):
-            x = ((i * 200) - offset) % (SCREEN_WIDTH * 2) - 100
-            y = (math.sin(i * 0.5) * 100) + (SCREEN_HEIGHT / 2)
-            pygame.draw.circle(screen, color, (int(x), int(y)), size)
-            pygame.draw.circle(screen, color, (int(x + size), int(y - size / 2)), int(size * 0.8))
-            pygame.draw.circle(screen, color, (int(x - size), int(y - size / 2)), int(size * 0.7))
-            pygame.draw.circle(screen, color, (int(x + size / 2), int(y + size / 2)), int(size * 0.6))
-            pygame.draw.circle(screen, color, (int(x - size / 2), int(y + size / 2)), int(size * 0.6))
-    
+        self.background.draw(self.world, self.level_position, self.quality.layers)
+
     def draw_ui(self):
-        score_text = font_medium.render(f"Score: {self.score}", True, WHITE)
-        screen.blit(score_text, (10, 10))
-        
+        score_text = self.text_cache.render(self.font_medium, f"Score: {self.score}", WHITE)
+        self.screen.blit(score_text, (10, 10))
+
         battery_bar_width = 200
         battery_bar_height = 20
-        pygame.draw.rect(screen, WHITE, (10, 50, battery_bar_width, battery_bar_height), 2)
+        pygame.draw.rect(self.screen, WHITE, (10, 50, battery_bar_width, battery_bar_height), 2)
         fill_width = (self.battery_level / MAX_BATTERY) * battery_bar_width
-        pygame.draw.rect(screen, GREEN, (10, 50, fill_width, battery_bar_height))
-    
-    def draw(self):
-        self.draw_background()
-        for obj in self.game_objects:
-            obj.draw(screen, self.level_position)
-        self.plane.draw(screen, self.is_colliding)
-        self.draw_ui()
-        
-        # Draw start, game over, level complete, or win screens
+        pygame.draw.rect(self.screen, GREEN, (10, 50, fill_width, battery_bar_height))
+
+    def overlay_spec(self):
+        # Fill colour and (font, text, color, center) lines of the start,
+        # game over, level complete or win screen; None while playing
+        center_x = SCREEN_WIDTH // 2
+        center_y = SCREEN_HEIGHT // 2
         if not self.game_active and not self.game_over and not self.level_complete and not self.win:
-            overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
-            overlay.fill((0, 31, 84, 230))
-            screen.blit(overlay, (0, 0))
-            title_text = font_large.render("SKY NAVIGATOR", True, YELLOW)
-            title_rect = title_text.get_rect(center=(SCREEN_WIDTH//2, 150))
-            screen.blit(title_text, title_rect)
-            instructions = [
-                "Navigate your plane through a dangerous asteroid field!",
-                "",
-                "CONTROLS:",
-                "↑ - Move Up",
-                "↓ - Move Down",
-                "← - Slow Down",
-                "→ - Speed Up",
-                "",
-                "Collect fuel to recharge your battery and stars for bonus points!",
-                "Reach the finish line to complete the level.",
-                "",
-                "Press SPACE to start"
-            ]
-            y = 220
-            for line in instructions:
-                instruction_text = font_small.render(line, True, WHITE)
-                instruction_rect = instruction_text.get_rect(center=(SCREEN_WIDTH//2, y))
-                screen.blit(instruction_text, instruction_rect)
-                y += 25
+            lines = [(self.font_large, "SKY NAVIGATOR", YELLOW, (center_x, 150))]
+            for i, line in enumerate(MENU_INSTRUCTIONS):
+                lines.append((self.font_small, line, WHITE, (center_x, 220 + i * 25)))
+            return (0, 31, 84, 230), lines
         elif self.game_over:
-            overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
-            overlay.fill((0, 0, 0, 200))
-            screen.blit(overlay, (0, 0))
-            gameover_text = font_large.render("GAME OVER", True, RED)
-            gameover_rect = gameover_text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//2 - 50))
-            screen.blit(gameover_text, gameover_rect)
-            score_text = font_medium.render(f"Final Score: {self.score}", True, WHITE)
-            score_rect = score_text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//2))
-            screen.blit(score_text, score_rect)
-            restart_text = font_small.render("Press SPACE to try again", True, WHITE)
-            restart_rect = restart_text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//2 + 50))
-            screen.blit(restart_text, restart_rect)
+            return (0, 0, 0, 200), [
+                (self.font_large, "GAME OVER", RED, (center_x, center_y - 50)),
+                (self.font_medium, f"Final Score: {self.score}", WHITE, (center_x, center_y)),
+                (self.font_small, "Press SPACE to try again", WHITE, (center_x, center_y + 50)),
+            ]
         elif self.level_complete:
-            overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
-            overlay.fill((0, 0, 0, 200))
-            screen.blit(overlay, (0, 0))
-            complete_text = font_large.render("LEVEL COMPLETE!", True, GREEN)
-            complete_rect = complete_text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//2 - 50))
-            screen.blit(complete_text, complete_rect)
-            score_text = font_medium.render(f"Score: {self.score}", True, WHITE)
-            score_rect = score_text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//2))
-            screen.blit(score_text, score_rect)
-            next_text = font_small.render("Press SPACE to continue to the next level", True, WHITE)
-            next_rect = next_text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//2 + 50))
-            screen.blit(next_text, next_rect)
+            return (0, 0, 0, 200), [
+                (self.font_large, "LEVEL COMPLETE!", GREEN, (center_x, center_y - 50)),
+                (self.font_medium, f"Score: {self.score}", WHITE, (center_x, center_y)),
+                (self.font_small, "Press SPACE to continue to the next level", WHITE, (center_x, center_y + 50)),
+            ]
         elif self.win:
-            overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
-            overlay.fill((0, 0, 0, 220))
-            screen.blit(overlay, (0, 0))
-            win_text = font_large.render("YOU WIN!", True, GREEN)
-            win_rect = win_text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//2 - 50))
-            screen.blit(win_text, win_rect)
-            final_score = font_medium.render(f"Final Score: {self.score}", True, WHITE)
-            score_rect = final_score.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//2))
-            screen.blit(final_score, score_rect)
-            restart_text = font_small.render("Press SPACE to restart", True, WHITE)
-            restart_rect = restart_text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//2 + 50))
-            screen.blit(restart_text, restart_rect)
+            return (0, 0, 0, 220), [
+                (self.font_large, "YOU WIN!", GREEN, (center_x, center_y - 50)),
+                (self.font_medium, f"Final Score: {self.score}", WHITE, (center_x, center_y)),
+                (self.font_small, "Press SPACE to restart", WHITE, (center_x, center_y + 50)),
+            ]
+        return None
+
+    def draw_overlay(self):
+        spec = self.overlay_spec()
+        if spec is None:
+            return
+        fill, lines = spec
+        translucent = self.quality.overlay_alpha
+        key = (fill, translucent, tuple(text for _, text, _, _ in lines))
+        overlay = self.overlays.get(key, lambda: ui.build_overlay(
+            self.screen.get_size(), fill, lines, self.text_cache, translucent))
+        self.screen.blit(overlay, (0, 0))
+
+    def frame_key(self):
+        # While not playing nothing moves, so the picture only depends on
+        # which screen is up and the run it belongs to; None while playing
+        if self.game_active:
+            return None
+        return (self.game_over, self.level_complete, self.win, self.run_seed, self.level, self.frame)
+
+    def invalidate(self):
+        # Force the next draw() to repaint, e.g. after the window was uncovered
+        self.drawn_key = None
+
+    def keep_clean(self, rect):
+        # Save the game's own pixels under rect on every repaint, so whatever
+        # is drawn over them can be taken off again by uncover()
+        self.clean_rect = pygame.Rect(rect)
+        self.invalidate()
+
+    def uncover(self):
+        # Put back the game's pixels under the kept rect; returns the rect
+        self.screen.blit(self.clean_pixels, self.clean_rect)
+        return self.clean_rect
+
+    def draw(self):
+        # Returns the rectangles that changed, which is nothing at all when
+        # the frame would be identical to the one already on screen.  The
+        # level scrolls under everything, so any frame that changes at all
+        # while playing repaints the whole screen.
+        key = self.frame_key()
+        if key is not None and key == self.drawn_key:
+            return []
+        self.drawn_key = key
+
+        profiler = self.profiler
+        self.draw_background()
+        profiler.mark("background")
+        self.draw_objects()
+        self.particles.draw(self.world, EFFECT_COLORS, self.level_position, self.quality.scale)
+        self.draw_plane()
+        profiler.mark("objects")
+        if self.world is not self.screen:
+            pygame.transform.scale(self.world, self.screen.get_size(), self.screen)
+            profiler.mark("upscale")
+        self.draw_ui()
+        # Draw start, game over, level complete, or win screens
+        self.draw_overlay()
+        profiler.mark("ui")
+        if self.clean_rect is not None:
+            self.clean_pixels = self.screen.subsurface(self.clean_rect).copy()
+        return [self.screen.get_rect()]
 
 # Main game loop function (defined outside the Game class)
 def main():
-    game = Game()
+    parser = argparse.ArgumentParser(description="Sky Navigator")
+    parser.add_argument("--seed", type=int, help="seed for reproducible levels")
+    parser.add_argument("--endless", action="store_true", help="play one never-ending level")
+    parser.add_argument("--levels", nargs="+", metavar="FILE",
+                        help="play level files (see levelfile.py) instead of generated levels")
+    parser.add_argument("--layers", default="",
+                        help=f"extra background layers, comma-separated: {','.join(EXTRA_LAYERS)}")
+    parser.add_argument("--dirty-rects", action="store_true",
+                        help="push only changed areas with display.update() instead of flip()")
+    parser.add_argument("--record", metavar="FILE", help="record the session to a replay file")
+    parser.add_argument("--replay", metavar="FILE", help="play back a replay (LEFT/RIGHT seek 5 s)")
+    parser.add_argument("--seed-bank", metavar="FILE",
+                        help="only play run seeds from this bank (see solver.py --bank)")
+    levels = [str(level) for level in range(len(QUALITY_LEVELS))]
+    parser.add_argument("--quality", default="auto", choices=["auto"] + levels,
+                        help=f"render quality, 0 (best) to {levels[-1]}, or auto to adapt to the machine")
+    parser.add_argument("--particles", type=int, default=DEFAULT_CAPACITY, metavar="N",
+                        help=f"most particles alive at once (default {DEFAULT_CAPACITY}; 0 = no effects)")
+    parser.add_argument("--quality-log", metavar="FILE", help="write the quality changes made in auto mode here")
+    parser.add_argument("--profile", action="store_true",
+                        help="time each phase of the frame; F3 toggles the overlay")
+    parser.add_argument("--profile-trace", metavar="FILE",
+                        help="profile and write a Chrome trace (chrome://tracing, Perfetto) on exit")
+    args = parser.parse_args()
+    if args.levels and (args.endless or args.record or args.replay):
+        # Replays only store a seed, not the level files played
+        parser.error("--levels can't be combined with --endless, --record or --replay")
+    extra_layers = [name for name in args.layers.split(",") if name]
+    unknown = [name for name in extra_layers if name not in EXTRA_LAYERS]
+    if unknown:
+        parser.error(f"--layers: unknown layer {unknown[0]!r} (choose from {', '.join(EXTRA_LAYERS)})")
+
+    recording = player = None
+    seed = args.seed
+    endless = args.endless
+    precise = True
+    seed_bank = None
+    if args.seed_bank:
+        try:
+            seed_bank = solver.load_bank(args.seed_bank)
+        except (OSError, ValueError) as e:
+            sys.exit(f"Sky Navigator: {args.seed_bank}: {e}")
+    if args.replay:
+        try:
+            recorded = replay.Replay(args.replay)
+        except (OSError, replay.ReplayError) as e:
+            sys.exit(f"Sky Navigator: {e}")
+        seed, endless, precise = recorded.seed, recorded.endless, recorded.precise
+        seed_bank = recorded.seed_bank
+    elif args.record and seed is None:
+        # A replay is only reproducible from a known seed
+        seed = random.getrandbits(32)
+    streamer = ChunkStreamer() if endless else None
+    if args.levels:
+        try:
+            streamer = LevelFiles(args.levels)
+        except (OSError, LevelFileError) as e:
+            sys.exit(f"Sky Navigator: {e}")
+
+    pygame.init()
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    pygame.display.set_caption("Sky Navigator")
+    clock = pygame.time.Clock()
+
+    try:
+        game = Game(screen, seed, streamer, extra_layers, precise, max(args.particles, 0))
+    except assets.AssetError as e:
+        pygame.quit()
+        sys.exit(f"Sky Navigator: {e}")
+    game.seed_bank = seed_bank
+    # Levels after the first are built in the background during the level
+    # complete screen, so continuing doesn't wait on generation
+    prefetcher = LevelPrefetcher()
+    prefetcher.attach(game)
+    # Rewinding would make a replay diverge from its input log, so it is
+    # only available in normal play
+    rewind = None
+    if args.replay:
+        player = replay.ReplayPlayer(recorded, game)
+    elif args.record:
+        recording = replay.ReplayWriter(args.record, game)
+    else:
+        rewind = Rewind()
+        rewind.attach(game)
+
+    # Lower render quality whenever drawn frames run over budget
+    governor = None
+    if args.quality == "auto":
+        governor = QualityGovernor(game.set_quality)
+    else:
+        game.set_quality(QUALITY_LEVELS[int(args.quality)])
+
+    profiler = NULL_PROFILER
+    overlay = None
+    if args.profile or args.profile_trace:
+        profiler = FrameProfiler(trace=bool(args.profile_trace))
+        game.profiler = profiler
+        overlay = ui.ProfilerOverlay(profiler, pygame.font.SysFont("Courier New", 13),
+                                     (SCREEN_WIDTH - 290, 10, 280, 210), FRAME_MS,
+                                     text_cache=game.text_cache)
+        game.keep_clean(overlay.rect)
+    show_overlay = overlay is not None
     running = True
-    
+    idle = False
+    rewinding = False
+    # Real time not yet consumed by fixed simulation steps
+    accumulator = 0.0
+
     while running:
+        profiler.frame()
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
+            if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                game.invalidate()
             if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_SPACE:
-                    # If game has not started, start it.
-                    if not game.game_active and not game.game_over and not game.level_complete and not game.win:
-                        game.start_game()
-                    # If level is complete (and not the final win), go to next level.
-                    elif game.level_complete:
-                        game.next_level()
-                    # If game over or win, reset and start again.
-                    elif game.game_over or game.win:
-                        game.reset()
-                        game.start_game()
+                if event.key == pygame.K_SPACE and player is None:
+                    game.handle_space()
+                    if recording:
+                        recording.record(replay.INPUT_SPACE)
+                if event.key in (pygame.K_LEFT, pygame.K_RIGHT) and player is not None:
+                    step = FPS * 5 if event.key == pygame.K_RIGHT else -FPS * 5
+                    player.seek(player.tick + step)
+                    game.invalidate()
+                if event.key == pygame.K_F3 and overlay is not None:
+                    show_overlay = not show_overlay
+                    game.invalidate()
                 if event.key == pygame.K_ESCAPE:
                     running = False
-        
-        game.update()
-        game.draw()
-        pygame.display.flip()
-        clock.tick(FPS)
-    
+
+        inputs = read_inputs()
+        was_rewinding = rewinding
+        rewinding = rewind is not None and pygame.key.get_pressed()[pygame.K_BACKSPACE]
+        if rewinding and not was_rewinding:
+            game.start_rewind()
+        profiler.mark("events")
+        elapsed = clock.tick(IDLE_FPS if idle else FPS)
+        profiler.mark("tick")
+        busy_since = time.perf_counter()
+        # Time spent idling is not owed to the simulation
+        accumulator = 0.0 if idle else min(accumulator + elapsed, MAX_STEPS_PER_FRAME * FRAME_MS)
+        while accumulator >= FRAME_MS:
+            if player is not None:
+                player.advance()
+            elif rewinding:
+                rewind.step_back(game)
+            else:
+                game.update(inputs)
+                if recording:
+                    recording.record(inputs)
+                if rewind:
+                    rewind.record(game)
+            accumulator -= FRAME_MS
+        profiler.mark("update")
+
+        changed = game.draw()
+        if show_overlay:
+            # The overlay changes every frame and is translucent.  Over a
+            # screen that hasn't changed only the area under it is repainted.
+            if not changed:
+                changed = [game.uncover()]
+            overlay.draw(screen)
+            profiler.mark("profiler")
+        # A replay keeps playing through menus and overlays until it ends,
+        # and rewinding can leave the game over screen
+        idle = not changed and not rewinding and (player is None or player.done())
+        if changed:
+            if args.dirty_rects:
+                pygame.display.update(changed)
+            else:
+                pygame.display.flip()
+            if governor is not None:
+                governor.sample((time.perf_counter() - busy_since) * 1000)
+        profiler.mark("flip")
+
+    if recording:
+        recording.close()
+    prefetcher.close()
+    if args.quality_log and governor is not None:
+        governor.export(args.quality_log)
+    if profiler.enabled and prefetcher.handoffs:
+        print("level handoffs: " + ", ".join(
+            f"level {level} {ms:.2f} ms{'' if prefetched else ' (built on the spot)'}"
+            for level, ms, prefetched in prefetcher.handoffs))
+    if args.profile_trace:
+        count = profiler.export(args.profile_trace)
+        print(f"wrote {count} trace events to {args.profile_trace}")
     pygame.quit()
     sys.exit()
 
@@ -0,0 +1,131 @@
+"""Sprite loading with an on-disk raster cache.
+
+The sprites are embedded as base64 SVGs so the game runs without image
+files.  Rasterizing them is the slow part of startup, so each sprite is
+rasterized once and its pixels are stored in a cache directory, keyed by a
+hash of the SVG source and the target size.  Sprites are only loaded when
+first asked for and are converted to the display's pixel format once a
+display exists, so blits don't pay for a format conversion every frame.
+"""
+import base64
+import hashlib
+import os
+from io import BytesIO
+
+import pygame
+
+from sim import (
+    SCREEN_HEIGHT, PLANE_WIDTH, PLANE_HEIGHT, ASTEROID_SIZE, FUEL_SIZE,
+    STAR_SIZE, FINISH_WIDTH,
+)
+
+CACHE_VERSION = 1
+
+
+class AssetError(Exception):
+    pass
+
+
+# Base64 encoded images
+plane_base64 = """
+PHN2ZyB4bWxucz0iaHR0cDovL3d3dy53My5vcmcvMjAwMC9zdmciIHZpZXdCb3g9IjAgMCA2MCAzMCI+PHBhdGggZD0iTTYwLDE1YzAtMi43LTYuMy01LTE1LTVIMzBMMCwzMGgzMGwxNSw5LDYtMTJjNS43LTAuMyw5LTIuMSw5LTUuNiIgZmlsbD0iI2ZmZiIvPjxwYXRoIGQ9Ik0zMCwzMGgxNWw2LTEyYzAtMS0xLTItMy0zSDMwbC02LDEyIiBmaWxsPSIjZmZkNzAwIi8+PHBhdGggZD0iTTYwLDE1YzAtMi43LTYuMy01LTE1LTVIMzBMMCwzMGgzMGwxNSw5LDYtMTJjNS43LTAuMyw5LTIuMSw5LTUuNiIgZmlsbD0ibm9uZSIgc3Ryb2tlPSIjMDAwIiBzdHJva2Utd2lkdGg9IjEuNSIvPjxlbGxpcHNlIGN4PSI0MyIgY3k9IjE1IiByeD0iMyIgcnk9IjIiIGZpbGw9IiMzMzMiLz48L3N2Zz4=
+"""
+
+asteroid_base64 = """
+PHN2ZyB4bWxucz0iaHR0cDovL3d3dy53My5vcmcvMjAwMC9zdmciIHZpZXdCb3g9IjAgMCA0MCA0MCI+PHBhdGggZD0iTTIwLDBjMyw1IDgsMyAxMCw1czIsOCA1LDEwLTMsOC01LDEwLTgsMi0xMCw1LTgsLTMtMTAsLTUtMi04LTUtMTAsMy04IDUtMTBDMTIsMiAxNyw1IDIwLDAiIGZpbGw9IiM4MDgwODAiIHN0cm9rZT0iIzMzMyIgc3Ryb2tlLXdpZHRoPSIxLjUiLz48Y2lyY2xlIGN4PSIxNSIgY3k9IjE1IiByPSIzIiBmaWxsPSIjNjY2Ii8+PGNpcmNsZSBjeD0iMjgiIGN5PSIyMCIgcj0iNCIgZmlsbD0iIzY2NiIvPjxjaXJjbGUgY3g9IjIwIiBjeT0iMjgiIHI9IjIiIGZpbGw9IiM2NjYiLz48L3N2Zz4=
+"""
+
+fuel_base64 = """
+PHN2ZyB4bWxucz0iaHR0cDovL3d3dy53My5vcmcvMjAwMC9zdmciIHZpZXdCb3g9IjAgMCAzMCAzMCI+PHJlY3QgeD0iNSIgeT0iNSIgd2lkdGg9IjIwIiBoZWlnaHQ9IjI1IiByeD0iMyIgcnk9IjMiIGZpbGw9IiNkZGQiIHN0cm9rZT0iIzMzMyIgc3Ryb2tlLXdpZHRoPSIxLjUiLz48cmVjdCB4PSI4IiB5PSI4IiB3aWR0aD0iMTQiIGhlaWdodD0iMTYiIGZpbGw9IiM0Y2FmNTAiLz48cmVjdCB4PSIxMiIgeT0iMCIgd2lkdGg9IjYiIGhlaWdodD0iNSIgZmlsbD0iIzY2NiIvPjwvc3ZnPg==
+"""
+
+star_base64 = """
+PHN2ZyB4bWxucz0iaHR0cDovL3d3dy53My5vcmcvMjAwMC9zdmciIHZpZXdCb3g9IjAgMCAyNSAyNSI+PHBhdGggZD0iTTEyLjUsMWw0LDgsOCwxLTYsNiwxLjUsOEwxMi41LDIwLDUsMjRsMS41LTgtNi02LDgtMVoiIGZpbGw9IiNmZmQ3MDAiIHN0cm9rZT0iI2ZmODYwMCIgc3Ryb2tlLXdpZHRoPSIxIi8+PC9zdmc+
+"""
+
+finish_base64 = """
+PHN2ZyB4bWxucz0iaHR0cDovL3d3dy53My5vcmcvMjAwMC9zdmciIHZpZXdCb3g9IjAgMCA2MCAzMDAiPjxyZWN0IHdpZHRoPSI2MCIgaGVpZ2h0PSIzMDAiIGZpbGw9IiMzMzMiLz48cGF0aCBkPSJNMCwwaDYwdjMwSDBWMzBoNjB2MzBIMFY2MGg2MHYzMEgwVjkwaDYwdjMwSDBWMTIwaDYwdjMwSDBWMTUwaDYwdjMwSDBWMTgwaDYwdjMwSDBWMjEwaDYwdjMwSDBWMjQwaDYwdjMwSDBWMjcwaDYwdjMwSDBWMzAwWiIgZmlsbD0ibm9uZSIgc3Ryb2tlPSIjZmZmIiBzdHJva2Utd2lkdGg9IjEuNSIgc3Ryb2tlLWRhc2hhcnJheT0iMzAsMzAiLz48dGV4dCB4PSI1IiB5PSIxNTAiIGZvbnQtZmFtaWx5PSJBcmlhbCIgZm9udC1zaXplPSIyMCIgZmlsbD0iI2ZmZiIgdHJhbnNmb3JtPSJyb3RhdGUoOTAsMzAsMTUwKSI+RklOSVNIPC90ZXh0Pjwvc3ZnPg==
+"""
+
+
+# Sprite name -> (base64 SVG, size in pixels)
+SPRITES = {
+    'plane': (plane_base64, (PLANE_WIDTH, PLANE_HEIGHT)),
+    'asteroid': (asteroid_base64, (ASTEROID_SIZE, ASTEROID_SIZE)),
+    'fuel': (fuel_base64, (FUEL_SIZE, FUEL_SIZE)),
+    'star': (star_base64, (STAR_SIZE, STAR_SIZE)),
+    'finish': (finish_base64, (FINISH_WIDTH, SCREEN_HEIGHT)),
+}
+
+
+def default_cache_dir():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "sky-navigator", "sprites")
+
+
+def rasterize(name, base64_string, size):
+    try:
+        image = pygame.image.load(BytesIO(base64.b64decode(base64_string)), f"{name}.svg")
+    except Exception as e:
+        raise AssetError(f"Could not decode sprite {name!r}: {e}") from e
+    if image.get_size() != size:
+        image = pygame.transform.scale(image, size)
+    return image
+
+
+class SpriteCache:
+    def __init__(self, cache_dir=None, sprites=SPRITES):
+        # cache_dir=False disables the on-disk cache
+        self.cache_dir = default_cache_dir() if cache_dir is None else cache_dir
+        self.sprites = sprites
+        self.raw = {}         # name -> surface as rasterized
+        self.converted = {}   # name -> surface in the display's pixel format
+        self.disk_hits = 0
+        self.disk_misses = 0
+
+    def cache_path(self, name):
+        source, (width, height) = self.sprites[name]
+        digest = hashlib.sha256(f"{CACHE_VERSION}:{width}x{height}:{source.strip()}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{name}-{width}x{height}-{digest[:16]}.rgba")
+
+    def get(self, name):
+        surface = self.converted.get(name)
+        if surface is not None:
+            return surface
+        surface = self.raw.get(name)
+        if surface is None:
+            surface = self.raw[name] = self.load(name)
+        if pygame.display.get_surface() is None:
+            return surface
+        surface = self.converted[name] = surface.convert_alpha()
+        return surface
+
+    def load(self, name):
+        source, size = self.sprites[name]
+        path = self.cache_path(name) if self.cache_dir else None
+        if path:
+            try:
+                with open(path, "rb") as f:
+                    pixels = f.read()
+                if len(pixels) == size[0] * size[1] * 4:
+                    self.disk_hits += 1
+                    return pygame.image.frombytes(pixels, size, "RGBA")
+            except OSError:
+                pass
+        self.disk_misses += 1
+        surface = rasterize(name, source, size)
+        if path:
+            self.store(path, surface)
+        return surface
+
+    def store(self, path, surface):
+        # Write to a temporary file first so a crash never leaves a torn entry.
+        # The cache is only an optimisation, so an unwritable directory is not an error.
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(pygame.image.tobytes(surface, "RGBA"))
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
@@ -0,0 +1,127 @@
+"""Pre-rendered parallax background.
+
+Each layer is drawn once into a tile that wraps around horizontally; per
+frame a layer costs one or two blits at an offset proportional to
+level_position, whatever is painted on it.
+"""
+import math
+import random
+
+import pygame
+
+from sim import SCREEN_WIDTH, SCREEN_HEIGHT
+
+COLORKEY = (255, 0, 255)
+
+
+class ParallaxLayer:
+    def __init__(self, tile, depth, y=0, opaque=False):
+        # tile must be at least SCREEN_WIDTH wide so two blits always cover the screen.
+        # An opaque layer covers the whole screen, so nothing behind it needs drawing.
+        self.tile = tile
+        self.depth = depth
+        self.y = y
+        self.period = tile.get_width()
+        self.opaque = opaque
+
+    def draw(self, surface, level_position):
+        offset = int(level_position * self.depth) % self.period
+        surface.blit(self.tile, (-offset, self.y))
+        if self.period - offset < surface.get_width():
+            surface.blit(self.tile, (self.period - offset, self.y))
+
+    def scaled(self, scale):
+        # The same layer for a surface scale times the screen's size
+        width, height = self.tile.get_size()
+        tile = pygame.transform.scale(self.tile, (round(width * scale), round(height * scale)))
+        colorkey = self.tile.get_colorkey()
+        if colorkey is not None:
+            tile.set_colorkey(colorkey, pygame.RLEACCEL)
+        return ParallaxLayer(tile, self.depth * scale, round(self.y * scale), self.opaque)
+
+
+class ParallaxBackground:
+    def __init__(self, color, layers):
+        # layers are drawn in order, furthest first
+        self.color = color
+        self.layers = layers
+
+    def draw(self, surface, level_position, count=None):
+        # count limits drawing to the nearest layers, to save time on slow machines
+        layers = self.layers
+        if count is not None:
+            layers = layers[max(len(layers) - count, 0):] if count else []
+        if not (layers and layers[0].opaque):
+            surface.fill(self.color)
+        for layer in layers:
+            layer.draw(surface, level_position)
+
+    def scaled(self, scale):
+        return ParallaxBackground(self.color, [layer.scaled(scale) for layer in self.layers])
+
+
+def keyed_layer(tile, depth):
+    # Crop a colour-keyed tile to the band actually painted and make it
+    # blit fast on the display
+    tile.set_colorkey(COLORKEY)
+    band = tile.get_bounding_rect()
+    band.x, band.width = 0, tile.get_width()
+    cropped = tile.subsurface(band).copy()
+    if pygame.display.get_surface() is not None:
+        cropped = cropped.convert()
+    cropped.set_colorkey(COLORKEY, pygame.RLEACCEL)
+    return ParallaxLayer(cropped, depth, band.y)
+
+
+def cloud_layer(depth, color, size):
+    # The cloud row repeats every two screen widths; clouds straddling the
+    # seam are painted on both ends so the tile wraps cleanly
+    period = SCREEN_WIDTH * 2
+    tile = pygame.Surface((period, SCREEN_HEIGHT))
+    tile.fill(COLORKEY)
+    for i in range(10):
+        y = (math.sin(i * 0.5) * 100) + (SCREEN_HEIGHT / 2)
+        for wrap in (-period, 0, period):
+            x = (i * 200) % period - 100 + wrap
+            pygame.draw.circle(tile, color, (int(x), int(y)), size)
+            pygame.draw.circle(tile, color, (int(x + size), int(y - size / 2)), int(size * 0.8))
+            pygame.draw.circle(tile, color, (int(x - size), int(y - size / 2)), int(size * 0.7))
+            pygame.draw.circle(tile, color, (int(x + size / 2), int(y + size / 2)), int(size * 0.6))
+            pygame.draw.circle(tile, color, (int(x - size / 2), int(y + size / 2)), int(size * 0.6))
+    return keyed_layer(tile, depth)
+
+
+def star_layer(depth, color, count=150, seed=0):
+    period = SCREEN_WIDTH * 2
+    rng = random.Random(seed)
+    tile = pygame.Surface((period, SCREEN_HEIGHT))
+    tile.fill(COLORKEY)
+    for _ in range(count):
+        x = rng.randrange(period)
+        y = rng.randrange(SCREEN_HEIGHT)
+        radius = 1 if rng.random() < 0.8 else 2
+        pygame.draw.circle(tile, color, (x, y), radius)
+    return keyed_layer(tile, depth)
+
+
+def nebula_layer(depth, color, base_color, count=6, seed=0):
+    # Soft blobs built from stacked low-alpha circles, blended over the base
+    # colour up front: the result is an opaque backdrop that costs the same
+    # to draw as the plain fill it replaces
+    period = SCREEN_WIDTH * 2
+    rng = random.Random(seed)
+    tile = pygame.Surface((period, SCREEN_HEIGHT))
+    tile.fill(base_color)
+    for _ in range(count):
+        cx = rng.randrange(period)
+        cy = rng.randrange(SCREEN_HEIGHT)
+        radius = rng.randint(60, 140)
+        for step in range(8, 0, -1):
+            r = radius * step // 8
+            blob = pygame.Surface((r * 2, r * 2), pygame.SRCALPHA)
+            pygame.draw.circle(blob, (*color, 12), (r, r), r)
+            for wrap in (-period, 0, period):
+                tile.blit(blob, (cx - r + wrap, cy - r))
+    if pygame.display.get_surface() is not None:
+        tile = tile.convert()
+    return ParallaxLayer(tile, depth, opaque=True)
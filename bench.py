@@ -0,0 +1,930 @@
+"""Performance benchmarks for Sky Navigator.
+
+Run `python bench.py --help` for the list of benchmarks.  Everything runs
+under SDL's dummy video driver, so no window is opened.
+"""
+import argparse
+import functools
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import sim
+from profiler import percentile
+
+
+def summarize(samples):
+    # Frame times in milliseconds
+    return {
+        "mean": sum(samples) / len(samples),
+        "p50": percentile(samples, 50),
+        "p95": percentile(samples, 95),
+        "p99": percentile(samples, 99),
+    }
+
+
+def open_display():
+    import pygame
+    import app2
+
+    pygame.init()
+    screen = pygame.display.set_mode((sim.SCREEN_WIDTH, sim.SCREEN_HEIGHT))
+    return app2, screen
+
+
+def time_frames(game, frames, draw=False):
+    # Fly the autopilot for a number of frames and return per-frame times in ms.
+    # The battery is topped up so dense levels don't end the run early.
+    samples = []
+    for _ in range(frames):
+        inputs = sim.autopilot(game)
+        started = time.perf_counter()
+        game.update(inputs)
+        if draw:
+            game.draw()
+        samples.append((time.perf_counter() - started) * 1000)
+        game.battery_level = sim.MAX_BATTERY
+        if not game.game_active:
+            break
+    return samples
+
+
+def bench_spatial(args):
+    # Frame time against level length and object density.  With the sliding
+    # window, cost should follow what is near the screen, not level size;
+    # "full scan" times the old walk over every object for comparison.
+    app2, screen = open_display() if args.draw else (None, None)
+    cases = [
+        ("baseline", 1, 1),
+        ("10x longer", 10, 10),
+        ("100x longer", 100, 100),
+        ("10x denser", 1, 10),
+        ("100x denser", 1, 100),
+    ]
+    print(f"{'case':<14}{'objects':>9}{'frame ms':>10}{'p95 ms':>9}{'full scan ms':>14}")
+    for name, length_scale, density in cases:
+        game = app2.Game(screen, seed=args.seed) if args.draw else sim.Game(args.seed)
+        game.start_game()
+        entities = sim.generate_level(args.level, game.run_seed,
+                                      length=sim.LEVEL_LENGTH * length_scale, density=density)
+        game.set_entities(entities)
+        stats = summarize(time_frames(game, args.frames, draw=args.draw))
+
+        # Reference: touch every object each frame, as the game used to
+        plane = game.plane
+        started = time.perf_counter()
+        for frame in range(args.frames):
+            entities.update(0, len(entities), game.level_position, frame * sim.DT)
+            entities.overlaps(0, len(entities), plane.x, plane.y, plane.width, plane.height)
+        full_scan = (time.perf_counter() - started) * 1000 / args.frames
+
+        print(f"{name:<14}{len(entities):>9}{stats['mean']:>10.3f}{stats['p95']:>9.3f}{full_scan:>14.3f}")
+
+
+def bench_endless(args):
+    # Soak test for endless mode: per simulated minute, report the objects
+    # loaded, traced Python memory and frame time, which should all stay flat.
+    from endless import ChunkStreamer
+
+    game = sim.Game(args.seed, streamer=ChunkStreamer())
+    game.start_game()
+    frames_per_minute = sim.FPS * 60
+    tracemalloc.start()
+    print(f"{'minute':>6}{'distance px':>13}{'level':>7}{'objects':>9}{'memory KiB':>12}{'frame ms':>10}{'p99 ms':>9}")
+    for minute in range(1, args.minutes + 1):
+        samples = time_frames(game, frames_per_minute)
+        if not game.game_active:
+            print(f"run ended after {minute - 1} minutes (crashed)")
+            break
+        memory = tracemalloc.get_traced_memory()[0] / 1024
+        stats = summarize(samples)
+        print(f"{minute:>6}{game.level_position:>13.0f}{game.level:>7}{len(game.entities):>9}"
+              f"{memory:>12.1f}{stats['mean']:>10.3f}{stats['p99']:>9.3f}")
+    tracemalloc.stop()
+
+
+def python_objects_frame(rows, level_position, t, plane):
+    # One frame of per-object Python updates and rect tests, the way a list
+    # of GameObjects was processed before the entity store
+    hits = []
+    for row in rows:
+        x, y, width, height, speed, amplitude, active = row
+        if amplitude:
+            x += amplitude * math.sin(t * speed)
+        screen_x = x - level_position
+        if (active and screen_x < plane.x + plane.width and plane.x < screen_x + width
+                and y < plane.y + plane.height and plane.y < y + height):
+            hits.append(row)
+    return hits
+
+
+def bench_entities(args):
+    # Worst case for the entity store: every object of a dense level packed
+    # into the same screenful, so the whole store is in the window each
+    # frame.  The first row is a stock level flown by the autopilot, with
+    # its ten or so objects near the screen, which take the scalar path.
+    print(f"{'objects':>8}{'window':>8}{'python loop ms':>16}{'store ms':>10}{'Game.update ms':>16}{'p99 ms':>8}")
+    bench_entities_stock(args)
+    for count in args.counts:
+        game = sim.Game(args.seed)
+        game.start_game()
+        base_count = sum(sim.level_counts(3))
+        entities = sim.generate_level(3, game.run_seed, length=1300, density=count / base_count)
+        game.set_entities(entities)
+        n = len(entities)
+        plane = game.plane
+
+        rows = entity_rows(entities)
+        frames = max(5, args.frames * 1000 // max(count, 1000))
+        started = time.perf_counter()
+        for frame in range(frames):
+            python_objects_frame(rows, 100, frame * sim.DT, plane)
+        python_ms = (time.perf_counter() - started) * 1000 / frames
+
+        started = time.perf_counter()
+        for frame in range(args.frames):
+            entities.update(0, n, 100, frame * sim.DT)
+            entities.overlaps(0, n, plane.x, plane.y, plane.width, plane.height)
+        vector_ms = (time.perf_counter() - started) * 1000 / args.frames
+
+        samples = []
+        for frame in range(args.frames):
+            game.level_position = 100
+            game.entities.active[:n] = True
+            game.plane.y = sim.SCREEN_HEIGHT / 2
+            game.plane.velocity_y = 0
+            started = time.perf_counter()
+            game.update(sim.INPUT_UP if frame % 2 else 0)
+            samples.append((time.perf_counter() - started) * 1000)
+            game.battery_level = sim.MAX_BATTERY
+        stats = summarize(samples)
+        print(f"{n:>8}{n:>8}{python_ms:>16.3f}{vector_ms:>10.3f}{stats['mean']:>16.3f}{stats['p99']:>8.3f}")
+
+
+def entity_rows(entities):
+    n = len(entities)
+    return list(zip(entities.x[:n].tolist(), entities.y[:n].tolist(), entities.width[:n].tolist(),
+                    entities.height[:n].tolist(), entities.osc_speed[:n].tolist(),
+                    entities.osc_amp[:n].tolist(), entities.active[:n].tolist()))
+
+
+def bench_entities_stock(args):
+    # Stock level 3, replayed from the start whenever the autopilot crashes
+    python_s = store_s = 0
+    windows = 0
+    samples = []
+    game = None
+    for frame in range(args.frames * 10):
+        if game is None or not game.game_active:
+            game = sim.Game(args.seed)
+            game.start_game()
+            game.set_entities(sim.generate_level(3, game.run_seed))
+            entities = game.entities
+            plane = game.plane
+            rows = entity_rows(entities)
+        lo, hi = game.view_window.lo, game.view_window.hi
+        windows += hi - lo
+        t = game.level_frame * sim.DT
+        started = time.perf_counter()
+        python_objects_frame(rows[lo:hi], game.level_position, t, plane)
+        python_s += time.perf_counter() - started
+        started = time.perf_counter()
+        entities.update(lo, hi, game.level_position, t)
+        entities.overlaps(lo, hi, plane.x, plane.y, plane.width, plane.height)
+        store_s += time.perf_counter() - started
+        inputs = sim.autopilot(game)
+        started = time.perf_counter()
+        game.update(inputs)
+        samples.append((time.perf_counter() - started) * 1000)
+    frames = len(samples)
+    stats = summarize(samples)
+    print(f"{len(entities):>8}{windows / frames:>8.1f}{python_s * 1000 / frames:>16.4f}{store_s * 1000 / frames:>10.4f}"
+          f"{stats['mean']:>16.4f}{stats['p99']:>8.3f}")
+
+
+def draw_clouds_reference(surface, level_position, depth, color, size):
+    # The per-frame circle drawing the background used before it was pre-rendered
+    import pygame
+
+    offset = (level_position * depth) % (sim.SCREEN_WIDTH * 2)
+    for i in range(10):
+        x = ((i * 200) - offset) % (sim.SCREEN_WIDTH * 2) - 100
+        y = (math.sin(i * 0.5) * 100) + (sim.SCREEN_HEIGHT / 2)
+        pygame.draw.circle(surface, color, (int(x), int(y)), size)
+        pygame.draw.circle(surface, color, (int(x + size), int(y - size / 2)), int(size * 0.8))
+        pygame.draw.circle(surface, color, (int(x - size), int(y - size / 2)), int(size * 0.7))
+        pygame.draw.circle(surface, color, (int(x + size / 2), int(y + size / 2)), int(size * 0.6))
+        pygame.draw.circle(surface, color, (int(x - size / 2), int(y + size / 2)), int(size * 0.6))
+
+
+def bench_background(args):
+    # Per-frame cost of the background pass: circles drawn every frame
+    # versus pre-rendered tiles, with and without the optional extra layers
+    app2, screen = open_display()
+
+    def circles(level_position):
+        screen.fill(app2.DARK_BLUE)
+        draw_clouds_reference(screen, level_position, 0.5, app2.LIGHT_BLUE, 30)
+        draw_clouds_reference(screen, level_position, 1, app2.BLUE, 20)
+
+    cases = [
+        ("fill only", lambda lp: screen.fill(app2.DARK_BLUE)),
+        ("circles per frame", circles),
+        ("tiles", lambda lp: clouds.draw(screen, lp)),
+        ("tiles + stars, nebula", lambda lp: extras.draw(screen, lp)),
+    ]
+    clouds = app2.build_background()
+    extras = app2.build_background(("stars", "nebula"))
+    print(f"{'background pass':<24}{'mean ms':>9}{'p95 ms':>9}")
+    for name, draw in cases:
+        samples = []
+        for frame in range(args.frames):
+            started = time.perf_counter()
+            draw(frame * 7.5)
+            samples.append((time.perf_counter() - started) * 1000)
+        stats = summarize(samples)
+        print(f"{name:<24}{stats['mean']:>9.3f}{stats['p95']:>9.3f}")
+
+
+def bench_ui(args):
+    # Per-frame cost of the HUD and of an idle menu screen, with the text and
+    # overlay caches defeated (as the game used to render) and in use
+    import pygame
+
+    app2, screen = open_display()
+    game = app2.Game(screen, seed=args.seed)
+
+    def uncached():
+        game.text_cache = app2.ui.TextCache()
+        game.overlays = app2.ui.OverlayCache()
+        game.invalidate()
+
+    def time_draw(setup, draw):
+        samples = []
+        for _ in range(args.frames):
+            setup()
+            started = time.perf_counter()
+            draw()
+            samples.append((time.perf_counter() - started) * 1000)
+        return summarize(samples)
+
+    def frame():
+        if game.draw():
+            pygame.display.flip()
+
+    print(f"{'frame':<24}{'mean ms':>9}{'p95 ms':>9}")
+    for name, setup in [("menu, uncached", uncached), ("menu, cached + idle", lambda: None)]:
+        stats = time_draw(setup, frame)
+        print(f"{name:<24}{stats['mean']:>9.3f}{stats['p95']:>9.3f}")
+
+    game.start_game()
+    for name, setup in [("HUD, uncached", uncached), ("HUD, cached", lambda: None)]:
+        samples = []
+        for frame in range(args.frames):
+            setup()
+            game.score = frame // 6
+            started = time.perf_counter()
+            game.draw_ui()
+            samples.append((time.perf_counter() - started) * 1000)
+        stats = summarize(samples)
+        print(f"{name:<24}{stats['mean']:>9.3f}{stats['p95']:>9.3f}")
+
+
+def bench_assets(args):
+    # Sprite startup with an empty and a warm disk cache, and blit throughput
+    # of sprites as rasterized versus converted to the display format
+    import pygame
+    import assets
+
+    startup_script = (
+        "import time; started = time.perf_counter(); import pygame, assets; "
+        "pygame.display.init(); pygame.display.set_mode((800, 600)); "
+        "cache = assets.SpriteCache(); [cache.get(name) for name in assets.SPRITES]; "
+        "print((time.perf_counter() - started) * 1000)"
+    )
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env = dict(os.environ, XDG_CACHE_HOME=cache_dir)
+        for name in ("cold start", "warm start"):
+            result = subprocess.run([sys.executable, "-c", startup_script], env=env,
+                                    capture_output=True, text=True, check=True,
+                                    cwd=os.path.dirname(os.path.abspath(__file__)))
+            print(f"{name:<12}{float(result.stdout.split()[-1]):>9.1f} ms (import + display + sprites)")
+
+        for name in ("cold load", "warm load"):
+            started = time.perf_counter()
+            cache = assets.SpriteCache(os.path.join(cache_dir, "in-process"))
+            for sprite in assets.SPRITES:
+                cache.raw[sprite] = cache.load(sprite)
+            print(f"{name:<12}{(time.perf_counter() - started) * 1000:>9.2f} ms (sprites only)")
+
+    app2, screen = open_display()
+    cache = assets.SpriteCache(False)
+    print(f"{'sprite':<10}{'raw blits/s':>14}{'converted blits/s':>19}")
+    for sprite in ("plane", "asteroid", "fuel", "star"):
+        raw = cache.load(sprite)
+        rates = []
+        for surface in (raw, raw.convert_alpha()):
+            started = time.perf_counter()
+            for i in range(args.blits):
+                screen.blit(surface, (i % 700, i % 500))
+            rates.append(args.blits / (time.perf_counter() - started))
+        print(f"{sprite:<10}{rates[0]:>14.0f}{rates[1]:>19.0f}")
+
+
+def bench_vecenv(args):
+    # Aggregate env-steps/s of the vectorized environments with random
+    # actions, in-process and sharded over worker processes
+    import numpy as np
+    from vecenv import VectorEnv
+
+    rng = np.random.default_rng(args.seed)
+    actions = rng.integers(0, 16, size=(args.steps, args.envs), dtype=np.uint8)
+    print(f"{'workers':>7}{'envs':>7}{'env-steps/s':>14}{'episodes':>10}")
+    for workers in args.workers:
+        with VectorEnv(args.envs, num_workers=workers) as env:
+            env.reset(seeds=range(args.seed, args.seed + args.envs))
+            episodes = 0
+            started = time.perf_counter()
+            for step in range(args.steps):
+                dones = env.step(actions[step])[2]
+                episodes += int(dones.sum())
+            elapsed = time.perf_counter() - started
+        print(f"{workers:>7}{args.envs:>7}{args.envs * args.steps / elapsed:>14.0f}{episodes:>10}")
+
+
+def bench_rewind(args):
+    # Cost of recording and stepping back a frame with the rewind ring
+    # buffer, against a full snapshot per frame, at growing level lengths
+    from rewind import Rewind
+
+    print(f"{'length':>8}{'objects':>9}{'buffer KiB':>12}{'record us':>11}{'back us':>9}"
+          f"{'snapshot us':>13}{'snapshots KiB':>15}")
+    for length in args.lengths:
+        game = sim.Game(args.seed)
+        game.start_game()
+        game.set_entities(sim.generate_level(3, game.run_seed, length, length / sim.LEVEL_LENGTH))
+        rewind = Rewind(args.seconds)
+        rewind.attach(game)
+        frames = rewind.capacity
+        # Keep the plane flying while recording a full buffer
+        record = 0.0
+        for _ in range(frames):
+            game.battery_level = sim.MAX_BATTERY
+            game.update(sim.autopilot(game))
+            started = time.perf_counter()
+            rewind.record(game)
+            record += time.perf_counter() - started
+        started = time.perf_counter()
+        stepped = 0
+        while rewind.step_back(game):
+            stepped += 1
+        back = time.perf_counter() - started
+
+        # Naive alternative: a copy of the whole game state every frame
+        tracemalloc.start()
+        started = time.perf_counter()
+        snapshots = [game.snapshot() for _ in range(frames)]
+        snapshot = time.perf_counter() - started
+        memory = tracemalloc.get_traced_memory()[0] / 1024
+        tracemalloc.stop()
+        del snapshots
+        print(f"{length:>8}{len(game.entities):>9}{rewind.nbytes / 1024:>12.1f}"
+              f"{record / frames * 1e6:>11.2f}{back / max(stepped, 1) * 1e6:>9.2f}"
+              f"{snapshot / frames * 1e6:>13.2f}{memory:>15.0f}")
+
+
+def bench_prefetch(args):
+    # Latency of next_level() on SPACE: building the level on the spot
+    # against swapping in one the prefetcher built during the overlay
+    from prefetch import LevelPrefetcher
+
+    print(f"{'density':>8}{'objects':>9}{'on the spot ms':>16}{'prefetched ms':>15}{'handoff ms':>12}")
+    for density in args.densities:
+        prefetcher = LevelPrefetcher(build=functools.partial(sim.generate_level, density=density))
+        game = sim.Game(args.seed)
+        prefetcher.attach(game)
+        rows = [[], [], []]
+        for _ in range(args.repeats):
+            for prefetched in (False, True):
+                game.start_game()
+                game.game_active = False
+                game.level_complete = True
+                if prefetched:
+                    prefetcher.request(game.level + 1, game.run_seed)
+                    prefetcher.future.result()
+                started = time.perf_counter()
+                game.next_level()
+                rows[prefetched].append((time.perf_counter() - started) * 1000)
+                if prefetched:
+                    rows[2].append(prefetcher.handoffs[-1][1])
+        prefetcher.close()
+        spot, ahead, handoff = (min(row) for row in rows)
+        print(f"{density:>8}{len(game.entities):>9}{spot:>16.3f}{ahead:>15.3f}{handoff:>12.3f}")
+
+
+def bench_levelfile(args):
+    # Opening a long level from a level file against generating it, and the
+    # frame cost of streaming it in as it scrolls
+    from levelfile import LevelFiles, export
+
+    print(f"{'length':>9}{'objects':>9}{'file MiB':>10}{'generate ms':>13}{'open ms':>9}"
+          f"{'frame us':>10}{'streamed us':>13}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for length in args.lengths:
+            density = length / sim.LEVEL_LENGTH * args.density
+            started = time.perf_counter()
+            game = sim.Game(args.seed)
+            game.start_game()
+            game.set_entities(sim.generate_level(3, game.run_seed, length, density))
+            generate = time.perf_counter() - started
+            path = os.path.join(tmp, f"{length}.lvl")
+            export(path, game.entities)
+            resident = time_frames(game, args.frames)
+
+            started = time.perf_counter()
+            streamed_game = sim.Game(args.seed, LevelFiles([path]))
+            streamed_game.start_game()
+            opened = time.perf_counter() - started
+            streamed = time_frames(streamed_game, args.frames)
+            print(f"{length:>9}{len(game.entities):>9}{os.path.getsize(path) / 2**20:>10.1f}"
+                  f"{generate * 1000:>13.1f}{opened * 1000:>9.2f}"
+                  f"{summarize(resident)['mean'] * 1000:>10.1f}{summarize(streamed)['mean'] * 1000:>13.1f}")
+
+
+def bench_governor(args):
+    # Frame cost at each quality level on this machine, then the governor
+    # driving a simulated machine that many times slower
+    import random
+    from governor import QUALITY_LEVELS, QualityGovernor
+
+    app2, screen = open_display()
+    costs = []
+    print(f"{'level':>5}  {'quality':<44}{'frame ms':>9}")
+    for level, quality in enumerate(QUALITY_LEVELS):
+        game = app2.Game(screen, args.seed, extra_layers=("stars", "nebula"))
+        game.set_quality(quality)
+        game.start_game()
+        costs.append(summarize(time_frames(game, args.frames, draw=True))["mean"])
+        print(f"{level:>5}  {quality!r:<44}{costs[-1]:>9.3f}")
+
+    # The simulated clock runs at the slower of the frame cost and the frame rate
+    now = [0.0]
+    governor = QualityGovernor(lambda quality: None, clock=lambda: now[0])
+    rng = random.Random(args.seed)
+    budget = governor.policy.budget_ms
+    time_at = [0.0] * len(QUALITY_LEVELS)
+    late = 0
+    frames = 0
+    while now[0] < args.seconds:
+        ms = costs[governor.level] * args.slowdown * rng.lognormvariate(0, args.jitter)
+        time_at[governor.level] += max(ms, budget) / 1000
+        now[0] += max(ms, budget) / 1000
+        late += ms > budget
+        frames += 1
+        governor.sample(ms)
+    print(f"\nsimulated {args.seconds:g} s at {args.slowdown:g}x slower: "
+          f"{len(governor.log)} changes, {late / frames:.1%} of frames over budget")
+    for entry in governor.log:
+        print(f"  {entry['time']:7.2f} s  {entry['from']} -> {entry['to']}  {entry['reason']}")
+    print("  time at level: " + ", ".join(f"{level}: {seconds:.1f} s"
+                                          for level, seconds in enumerate(time_at) if seconds))
+
+
+class ReferenceParticle:
+    # The per-object alternative to the particle pool: one instance per
+    # particle, in a list rebuilt as particles die
+    __slots__ = ("x", "y", "vx", "vy", "weight", "drag", "life")
+
+    def __init__(self, rng):
+        self.x = self.y = 0.0
+        self.vx = rng.uniform(-2, 2)
+        self.vy = rng.uniform(-2, 2)
+        self.weight = 0.15
+        self.drag = 0.97
+        self.life = rng.randint(30, 50)
+
+
+def reference_particles_step(particles, rng, count):
+    for p in particles:
+        p.vy += p.weight
+        p.vx *= p.drag
+        p.vy *= p.drag
+        p.x += p.vx
+        p.y += p.vy
+        p.life -= 1
+    particles = [p for p in particles if p.life > 0]
+    particles.extend(ReferenceParticle(rng) for _ in range(count - len(particles)))
+    return particles
+
+
+def bench_particles(args):
+    # Cost of a particle step at steady state, dead particles replaced every
+    # step, against one Python object per particle; plus drawing
+    import random
+    from particles import DEBRIS, ParticlePool
+
+    app2, screen = open_display()
+    print(f"{'live':>7}{'pool step us':>14}{'objects step us':>17}{'draw us':>9}")
+    for count in args.counts:
+        pool = ParticlePool(count, seed=args.seed)
+
+        def refill():
+            # Bursts of debris spread over the screen, as after many hits
+            while len(pool) < count:
+                pool.emit(64, pool.rng.uniform(0, sim.SCREEN_WIDTH), pool.rng.uniform(0, sim.SCREEN_HEIGHT),
+                          DEBRIS, 1, speed=(1, 4))
+
+        refill()
+        for _ in range(50):
+            pool.update()
+            refill()
+        started = time.perf_counter()
+        for _ in range(args.steps):
+            pool.update()
+            refill()
+        pool_us = (time.perf_counter() - started) * 1e6 / args.steps
+
+        started = time.perf_counter()
+        for _ in range(args.steps):
+            pool.draw(screen, app2.EFFECT_COLORS, 0)
+        draw_us = (time.perf_counter() - started) * 1e6 / args.steps
+
+        rng = random.Random(args.seed)
+        particles = reference_particles_step([], rng, count)
+        steps = max(5, args.steps * 1000 // count)
+        started = time.perf_counter()
+        for _ in range(steps):
+            particles = reference_particles_step(particles, rng, count)
+        object_us = (time.perf_counter() - started) * 1e6 / steps
+        print(f"{count:>7}{pool_us:>14.1f}{object_us:>17.1f}{draw_us:>9.1f}")
+
+
+SUITE_METRICS = ("sim.p50", "sim.p95", "sim.p99", "render.p50", "render.p95", "render.p99")
+
+
+def suite_game(game, level, density):
+    # Put a fresh run on the given level, optionally with scaled object counts
+    game.start_game()
+    game.level = level
+    game.scroll_speed = sim.INITIAL_SCROLL_SPEED + level * 0.5
+    game.init_level(level)
+    if density != 1:
+        game.set_entities(sim.generate_level(level, game.run_seed, density=density))
+    return game
+
+
+def suite_frames(game, frames, render):
+    # Per-frame ms of update (and draw + flip) under the autopilot, battery
+    # topped up, and the net memory blocks each frame leaves behind
+    import pygame
+
+    samples = []
+    blocks = sys.getallocatedblocks()
+    for _ in range(frames):
+        if not game.game_active:
+            break
+        inputs = sim.autopilot(game)
+        started = time.perf_counter()
+        game.update(inputs)
+        if render:
+            game.draw()
+            pygame.display.flip()
+        samples.append((time.perf_counter() - started) * 1000)
+        game.battery_level = sim.MAX_BATTERY
+    return samples, (sys.getallocatedblocks() - blocks) / len(samples)
+
+
+def suite_allocations(game, frames):
+    # Average traced memory a frame allocates on top of what it started with
+    peaks = []
+    tracemalloc.start()
+    for _ in range(frames):
+        if not game.game_active:
+            break
+        inputs = sim.autopilot(game)
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        game.update(inputs)
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        game.battery_level = sim.MAX_BATTERY
+    tracemalloc.stop()
+    return sum(peaks) / len(peaks) / 1024
+
+
+def suite_startup(runs):
+    # Interpreter start to the first frame drawn, median of a few runs
+    script = (
+        "import time; started = time.perf_counter(); import pygame, app2; pygame.init(); "
+        "screen = pygame.display.set_mode((800, 600)); game = app2.Game(screen, 0); "
+        "game.draw(); pygame.display.flip(); print((time.perf_counter() - started) * 1000)"
+    )
+    times = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True,
+                                check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        times.append(float(result.stdout.split()[-1]))
+    return percentile(times, 50)
+
+
+def bench_suite(args):
+    # Frame-time regression suite: every level, then the last level with
+    # scaled-up object counts, simulated alone and with rendering.  Writes
+    # JSON and, given a baseline, fails on any metric slower than allowed.
+    import json
+    import platform
+    import pygame
+
+    app2, screen = open_display()
+    cases = [(f"level{level}", level, 1) for level in range(1, sim.LEVEL_COUNT + 1)]
+    cases += [(f"level{sim.LEVEL_COUNT}x{density}", sim.LEVEL_COUNT, density) for density in args.densities]
+
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "pygame": pygame.version.ver,
+            "platform": platform.platform(),
+            "frames": args.frames,
+            "seed": args.seed,
+        },
+        "startup_ms": suite_startup(args.startup_runs),
+        "cases": {},
+    }
+    print(f"{'case':<14}{'objects':>8}{'frames':>8}{'sim p50':>9}{'p95':>7}{'p99':>7}"
+          f"{'render p50':>12}{'p95':>7}{'p99':>7}{'alloc KiB':>11}{'blocks':>8}")
+    for name, level, density in cases:
+        # Timings are the best of a few repeats, which damps scheduler noise
+        sim_runs = []
+        render_runs = []
+        for _ in range(args.repeats):
+            game = suite_game(sim.Game(args.seed), level, density)
+            samples, blocks = suite_frames(game, args.frames, False)
+            sim_runs.append(summarize(samples))
+            game = suite_game(app2.Game(screen, args.seed), level, density)
+            render_runs.append(summarize(suite_frames(game, args.frames, True)[0]))
+        sim_stats = {stat: min(run[stat] for run in sim_runs) for stat in sim_runs[0]}
+        render_stats = {stat: min(run[stat] for run in render_runs) for stat in render_runs[0]}
+        game = suite_game(sim.Game(args.seed), level, density)
+        alloc_kib = suite_allocations(game, args.frames)
+        results["cases"][name] = {
+            "objects": len(game.entities),
+            "frames": len(samples),
+            "sim": sim_stats,
+            "render": render_stats,
+            "alloc_kib_per_frame": alloc_kib,
+            "net_blocks_per_frame": blocks,
+        }
+        print(f"{name:<14}{len(game.entities):>8}{len(samples):>8}{sim_stats['p50']:>9.3f}{sim_stats['p95']:>7.3f}"
+              f"{sim_stats['p99']:>7.3f}{render_stats['p50']:>12.3f}{render_stats['p95']:>7.3f}"
+              f"{render_stats['p99']:>7.3f}{alloc_kib:>11.2f}{blocks:>8.2f}")
+    print(f"startup {results['startup_ms']:.1f} ms")
+
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"results written to {args.out}")
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"baseline saved to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}; run with --save-baseline to create one")
+        return
+
+    # Compare against the baseline: any metric more than threshold (and
+    # min_delta ms) slower fails
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    limit = 1 + args.threshold
+
+    def regressed(before, after):
+        return after > before * limit and after - before > args.min_delta
+
+    regressions = []
+    if regressed(baseline["startup_ms"], results["startup_ms"]):
+        regressions.append(f"startup: {baseline['startup_ms']:.1f} -> {results['startup_ms']:.1f} ms")
+    for name, case in results["cases"].items():
+        old = baseline["cases"].get(name)
+        if old is None:
+            continue
+        for metric in SUITE_METRICS:
+            section, stat = metric.split(".")
+            before, after = old[section][stat], case[section][stat]
+            if regressed(before, after):
+                regressions.append(f"{name} {metric}: {before:.3f} -> {after:.3f} ms")
+    if regressions:
+        print(f"regressions over {args.threshold:.0%} against {args.baseline}:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print(f"no regressions over {args.threshold:.0%} against {args.baseline}")
+
+
+def collision_cost(game, frames, every_frame):
+    # Mean us per frame spent in check_collisions under the autopilot.  With
+    # every_frame the hit cooldown is cleared each frame and hits are undone
+    # after timing, so every frame runs the full test on the same objects.
+    spent = 0.0
+    played = 0
+    check_collisions = game.check_collisions
+    for _ in range(frames):
+        if not game.game_active:
+            break
+        game.battery_level = sim.MAX_BATTERY
+        if every_frame:
+            game.last_collision_time = -sim.COLLISION_COOLDOWN
+            game.is_colliding = False
+            active = game.entities.active.copy()
+        # Step without the collision pass, then time it on its own
+        game.check_collisions = lambda: None
+        game.update(sim.autopilot(game))
+        del game.check_collisions
+        started = time.perf_counter()
+        check_collisions()
+        spent += time.perf_counter() - started
+        if every_frame:
+            game.entities.active[:] = active
+        played += 1
+    return spent / played * 1e6
+
+
+def bench_collision(args):
+    # Per-frame cost of check_collisions with box-only hits versus boxes
+    # refined by sprite masks, at growing object counts: in normal play, and
+    # in the worst case where every frame runs the full test
+    from collision import CollisionMasks
+
+    masks = CollisionMasks()
+    # Warm up so the first case is not charged for it
+    game = sim.Game(args.seed)
+    game.start_game()
+    collision_cost(game, 300, True)
+    print(f"{'density':>8}{'objects':>9}{'play rect us':>14}{'masks us':>10}{'overhead':>10}"
+          f"{'worst rect us':>15}{'masks us':>10}{'overhead':>10}{'mask tests/frame':>18}")
+    for density in args.densities:
+        row = []
+        for every_frame in (False, True):
+            costs = [float("inf"), float("inf")]
+            # Best of a few runs, alternating the two paths
+            for _ in range(args.repeats):
+                for precise in (False, True):
+                    game = sim.Game(args.seed)
+                    game.start_game()
+                    game.set_entities(sim.generate_level(args.level, game.run_seed, density=density))
+                    game.masks = masks if precise else None
+                    masks.tests = 0
+                    costs[precise] = min(costs[precise], collision_cost(game, args.frames, every_frame))
+            row += [costs[0], costs[1], costs[1] / costs[0] - 1]
+        tests = masks.tests / args.frames
+        print(f"{density:>8}{len(game.entities):>9}{row[0]:>14.2f}{row[1]:>10.2f}{row[2]:>10.1%}"
+              f"{row[3]:>15.2f}{row[4]:>10.2f}{row[5]:>10.1%}{tests:>18.2f}")
+
+
+def bench_server(args):
+    # Server tick rate and per-session cost as sessions are added, against a
+    # server in its own process with the bots in this one
+    import asyncio
+    import socket
+    import server
+
+    print(f"{'sessions':>9}{'ticks/s':>9}{'tick p50 ms':>13}{'tick p95 ms':>13}{'skipped':>9}"
+          f"{'cpu us/session':>16}{'deltas/s':>10}{'B/delta':>9}")
+    for count in args.sessions:
+        with socket.socket() as s:
+            s.bind((server.HOST, 0))
+            port = s.getsockname()[1]
+        process = subprocess.Popen([sys.executable, "server.py", "serve", "--port", str(port), "--stats", "0"],
+                                   cwd=os.path.dirname(os.path.abspath(__file__)),
+                                   stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        try:
+            process.stdout.readline()   # "serving on ..."
+            bots = argparse.Namespace(host=server.HOST, port=port, unix=None, sessions=count,
+                                      seconds=args.seconds, seed=args.seed, lead=2, endless=False, boxes=False)
+            result = asyncio.run(server.play_bots(bots))
+        finally:
+            process.terminate()
+            process.wait()
+        m = result["server"]
+        print(f"{count:>9}{m['ticks_per_s']:>9.1f}{m['tick_ms']['50']:>13.2f}{m['tick_ms']['95']:>13.2f}"
+              f"{m['skipped']:>9}{m['session_cpu_us_per_tick']['mean']:>16.1f}"
+              f"{result['deltas_per_s']:>10.0f}{result['bytes_per_delta']:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    spatial = subparsers.add_parser("spatial", help="frame time vs level length and density")
+    spatial.add_argument("--seed", type=int, default=0)
+    spatial.add_argument("--level", type=int, default=3)
+    spatial.add_argument("--frames", type=int, default=600)
+    spatial.add_argument("--draw", action="store_true", help="include rendering in the frame time")
+    spatial.set_defaults(func=bench_spatial)
+
+    endless = subparsers.add_parser("endless", help="endless mode soak test")
+    endless.add_argument("--seed", type=int, default=0)
+    endless.add_argument("--minutes", type=int, default=60, help="simulated minutes of play")
+    endless.set_defaults(func=bench_endless)
+
+    entities = subparsers.add_parser("entities", help="entity store vs per-object Python at high object counts")
+    entities.add_argument("--seed", type=int, default=0)
+    entities.add_argument("--frames", type=int, default=300)
+    entities.add_argument("--counts", type=int, nargs="+", default=[1000, 10000, 50000])
+    entities.set_defaults(func=bench_entities)
+
+    background = subparsers.add_parser("background", help="background pass, before and after pre-rendering")
+    background.add_argument("--frames", type=int, default=1000)
+    background.set_defaults(func=bench_background)
+
+    ui = subparsers.add_parser("ui", help="HUD and menu screen rendering, with and without caching")
+    ui.add_argument("--seed", type=int, default=0)
+    ui.add_argument("--frames", type=int, default=600)
+    ui.set_defaults(func=bench_ui)
+
+    assets = subparsers.add_parser("assets", help="sprite startup time and blit throughput")
+    assets.add_argument("--blits", type=int, default=20000)
+    assets.set_defaults(func=bench_assets)
+
+    vecenv = subparsers.add_parser("vecenv", help="vectorized environment throughput")
+    vecenv.add_argument("--seed", type=int, default=0)
+    vecenv.add_argument("--envs", type=int, default=256)
+    vecenv.add_argument("--steps", type=int, default=500)
+    vecenv.add_argument("--workers", type=int, nargs="+", default=[0, os.cpu_count() or 1],
+                        help="worker process counts to try (0 = in-process)")
+    vecenv.set_defaults(func=bench_vecenv)
+
+    rewind = subparsers.add_parser("rewind", help="rewind buffer vs per-frame snapshots")
+    rewind.add_argument("--seed", type=int, default=0)
+    rewind.add_argument("--seconds", type=float, default=5)
+    rewind.add_argument("--lengths", type=int, nargs="+", default=[5000, 50000, 500000])
+    rewind.set_defaults(func=bench_rewind)
+
+    suite = subparsers.add_parser("suite", help="frame-time regression suite with JSON output")
+    suite.add_argument("--seed", type=int, default=0)
+    suite.add_argument("--frames", type=int, default=600)
+    suite.add_argument("--densities", type=int, nargs="+", default=[4, 16],
+                       help="object count multipliers run on the last level")
+    suite.add_argument("--repeats", type=int, default=3, help="runs per case; the best is kept")
+    suite.add_argument("--startup-runs", type=int, default=3)
+    suite.add_argument("--out", default="bench_results.json")
+    suite.add_argument("--baseline", default="bench_baseline.json")
+    suite.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    suite.add_argument("--threshold", type=float, default=0.25,
+                       help="allowed slowdown against the baseline (0.25 = 25%%)")
+    suite.add_argument("--min-delta", type=float, default=0.05,
+                       help="slowdowns smaller than this many ms never count as regressions")
+    suite.set_defaults(func=bench_suite)
+
+    collision = subparsers.add_parser("collision", help="box-only vs pixel-mask collision cost")
+    collision.add_argument("--seed", type=int, default=0)
+    collision.add_argument("--level", type=int, default=5)
+    collision.add_argument("--frames", type=int, default=2000)
+    collision.add_argument("--repeats", type=int, default=5)
+    collision.add_argument("--densities", type=int, nargs="+", default=[1, 10, 50, 100])
+    collision.set_defaults(func=bench_collision)
+
+    prefetch = subparsers.add_parser("prefetch", help="next-level latency, built on the spot vs prefetched")
+    prefetch.add_argument("--seed", type=int, default=0)
+    prefetch.add_argument("--repeats", type=int, default=5)
+    prefetch.add_argument("--densities", type=int, nargs="+", default=[1, 10, 100, 1000])
+    prefetch.set_defaults(func=bench_prefetch)
+
+    levelfile = subparsers.add_parser("levelfile", help="level files: open time and streaming cost")
+    levelfile.add_argument("--seed", type=int, default=0)
+    levelfile.add_argument("--frames", type=int, default=600)
+    levelfile.add_argument("--density", type=float, default=1, help="object density relative to level 3")
+    levelfile.add_argument("--lengths", type=int, nargs="+", default=[5000, 500000, 5000000])
+    levelfile.set_defaults(func=bench_levelfile)
+
+    governor = subparsers.add_parser("governor", help="cost of each quality level and a simulated slow machine")
+    governor.add_argument("--seed", type=int, default=0)
+    governor.add_argument("--frames", type=int, default=300)
+    governor.add_argument("--slowdown", type=float, default=30, help="how many times slower the simulated machine is")
+    governor.add_argument("--jitter", type=float, default=0.15, help="spread of the simulated frame costs")
+    governor.add_argument("--seconds", type=float, default=120, help="simulated seconds of play")
+    governor.set_defaults(func=bench_governor)
+
+    particles = subparsers.add_parser("particles", help="particle pool step and draw cost vs per-object particles")
+    particles.add_argument("--seed", type=int, default=0)
+    particles.add_argument("--steps", type=int, default=1000)
+    particles.add_argument("--counts", type=int, nargs="+", default=[1000, 10000, 50000])
+    particles.set_defaults(func=bench_particles)
+
+    server = subparsers.add_parser("server", help="game server tick rate and per-session cost by session count")
+    server.add_argument("--seed", type=int, default=0)
+    server.add_argument("--seconds", type=float, default=10, help="per session count")
+    server.add_argument("--sessions", type=int, nargs="+", default=[50, 100, 200, 400])
+    server.set_defaults(func=bench_server)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Pixel-accurate collision behind the rectangle broadphase.
+
+sim.Game finds the objects whose boxes overlap the plane's with one
+vectorized pass; when the game has CollisionMasks attached, only those few
+candidates are then checked pixel by pixel against the sprites' alpha
+masks, so transparent corners no longer count as hits.  Masks are built
+once per sprite.  The finish line stays a plain box: crossing it counts.
+"""
+import numpy as np
+import pygame
+
+import assets
+from entities import TYPE_NAMES, FINISH
+
+ALPHA_THRESHOLD = 127   # pixels more transparent than this never collide
+
+
+class CollisionMasks:
+    def __init__(self, sprites=None):
+        # sprites is an assets.SpriteCache, shared with the renderer if there is one
+        if sprites is None:
+            sprites = assets.SpriteCache()
+        self.plane = pygame.mask.from_surface(sprites.get('plane'), ALPHA_THRESHOLD)
+        # Indexed by type code; None means the box test is final
+        self.objects = [None if kind == FINISH else
+                        pygame.mask.from_surface(sprites.get(name), ALPHA_THRESHOLD)
+                        for kind, name in enumerate(TYPE_NAMES)]
+        self.tests = 0  # candidate pairs checked pixel by pixel
+
+    def filter(self, plane, entities, hits):
+        # Drop the box hits (as from EntityStore.overlaps) whose pixels miss
+        # the plane.  Positions are truncated to whole pixels, as when blitted.
+        plane_x = int(plane.x)
+        plane_y = int(plane.y)
+        kept = {}
+        for kind, indices in hits.items():
+            mask = self.objects[kind]
+            if mask is None:
+                kept[kind] = indices
+                continue
+            self.tests += len(indices)
+            overlap = self.plane.overlap
+            touching = [i for i, x, y in zip(indices.tolist(), entities.screen_x[indices].tolist(),
+                                             entities.y[indices].tolist())
+                        if overlap(mask, (int(x) - plane_x, int(y) - plane_y))]
+            if len(touching) == len(indices):
+                kept[kind] = indices
+            elif touching:
+                kept[kind] = np.array(touching)
+        return kept
@@ -0,0 +1,104 @@
+"""Endless mode: the level is streamed in chunks instead of built up front.
+
+A ChunkStreamer plugged into sim.Game generates fixed-length chunks just
+ahead of the screen and drops them once they have scrolled past, so memory
+and per-frame work stay flat however long a run lasts.  Difficulty follows
+the same per-level rules as `sim.generate_level`, interpolated over distance
+travelled, and stops climbing at ENDLESS_MAX_LEVEL.
+"""
+import random
+from collections import deque
+
+from entities import EntityStore, FUEL, STAR
+from sim import (
+    SCREEN_WIDTH, ASTEROID_SIZE, FUEL_SIZE, STAR_SIZE, MAX_OSCILLATION_AMPLITUDE,
+    INITIAL_SCROLL_SPEED, LEVEL_LENGTH, level_counts, spawn_asteroid, spawn_pickup,
+)
+
+CHUNK_LENGTH = 1000
+LOOKAHEAD = SCREEN_WIDTH + CHUNK_LENGTH     # keep this much level generated past the screen's left edge
+START_CLEARANCE = 500                       # Clear first 500px, as in fixed levels
+ENDLESS_MAX_LEVEL = 10                      # Difficulty stops ramping here
+WINDOW_PAD = ASTEROID_SIZE + MAX_OSCILLATION_AMPLITUDE
+
+
+def moving_odds(level):
+    # Fixed levels switch every asteroid to moving at level 3; ramp up to that over level 2
+    return min(max(level - 2, 0), 1)
+
+
+class ChunkStreamer:
+    def __init__(self, max_level=ENDLESS_MAX_LEVEL):
+        self.max_level = max_level
+        # Extra distance to keep behind the screen, e.g. for rewinding
+        self.keep_behind = 0
+        self.seed = None
+        self.next_chunk = 0
+        self.chunk_sizes = deque()  # object counts of the chunks currently loaded
+
+    def difficulty(self, x):
+        # Equivalent (fractional) level number at distance x
+        return min(1 + x / LEVEL_LENGTH, self.max_level)
+
+    def start(self, game):
+        self.seed = game.run_seed
+        self.next_chunk = 0
+        self.chunk_sizes = deque()
+        game.set_entities(EntityStore())
+        game.window_pad = WINDOW_PAD
+        self.advance(game)
+
+    def snapshot(self):
+        return self.seed, self.next_chunk, tuple(self.chunk_sizes)
+
+    def restore(self, state):
+        self.seed, self.next_chunk, chunk_sizes = state
+        self.chunk_sizes = deque(chunk_sizes)
+
+    def advance(self, game):
+        # Generate chunks ahead of the screen
+        while self.next_chunk * CHUNK_LENGTH < game.level_position + LOOKAHEAD:
+            chunk = self.generate_chunk(self.next_chunk)
+            game.entities.extend(chunk)
+            self.chunk_sizes.append(len(chunk))
+            self.next_chunk += 1
+
+        # Drop chunks that have scrolled out of reach
+        first_chunk = self.next_chunk - len(self.chunk_sizes)
+        while (first_chunk + 1) * CHUNK_LENGTH + game.window_pad + self.keep_behind < game.level_position:
+            count = self.chunk_sizes.popleft()
+            game.entities.drop_front(count)
+            game.view_window.shift(count)
+            game.collision_window.shift(count)
+            first_chunk += 1
+
+        # Speed up as fixed levels do on each new level
+        level = int(self.difficulty(game.level_position))
+        if level > game.level:
+            game.level = level
+            game.scroll_speed = INITIAL_SCROLL_SPEED + (level * 0.5)
+
+    def generate_chunk(self, index):
+        rng = random.Random(f"{self.seed}:chunk:{index}")
+        start = max(index * CHUNK_LENGTH, START_CLEARANCE)
+        end = (index + 1) * CHUNK_LENGTH
+        chunk = EntityStore()
+        if start >= end:
+            return chunk
+        level = self.difficulty((start + end) / 2)
+        # Share of a level's objects that falls in this chunk
+        share = (end - start) / (LEVEL_LENGTH - START_CLEARANCE)
+        asteroid_count, fuel_count, star_count = level_counts(level)
+        odds = moving_odds(level)
+
+        for i in range(int(asteroid_count * share + rng.random())):
+            x = start + rng.random() * (end - start)
+            spawn_asteroid(chunk, rng, x, rng.random() < odds)
+        for i in range(int(fuel_count * share + rng.random())):
+            x = start + rng.random() * (end - start)
+            spawn_pickup(chunk, rng, x, FUEL_SIZE, FUEL)
+        for i in range(int(star_count * share + rng.random())):
+            x = start + rng.random() * (end - start)
+            spawn_pickup(chunk, rng, x, STAR_SIZE, STAR)
+        chunk.sort_by_x()
+        return chunk
@@ -0,0 +1,186 @@
+"""Structure-of-arrays store for level objects.
+
+Every asteroid, fuel canister, star and finish line lives in one row of a
+set of parallel NumPy arrays instead of being a Python object of its own.
+Per frame, screen positions (including moving asteroids' oscillation) and
+the plane-versus-objects overlap test are each a single vectorized pass
+over the slice of rows near the screen.
+
+At stock density only ten or so rows are near the screen, and there the
+fixed cost of each NumPy call outweighs the work.  Windows smaller than
+SCALAR_ROWS are handled by plain Python loops instead, over `records()`:
+the fixed columns mirrored as one tuple per row, built on first use and
+kept in step as rows are added and dropped.  The sliding windows search
+the x column through the same mirror, `x_keys()`.  Both paths give the same
+results.
+"""
+import math
+
+import numpy as np
+
+# Type codes
+ASTEROID = 0
+FUEL = 1
+STAR = 2
+FINISH = 3
+TYPE_NAMES = ('asteroid', 'fuel', 'star', 'finish')
+
+SCALAR_ROWS = 64    # windows smaller than this skip the vectorized passes
+
+# Column name -> dtype
+COLUMNS = {
+    'x': np.float64,            # left edge at rest, in level coordinates
+    'y': np.float64,
+    'width': np.float64,
+    'height': np.float64,
+    'kind': np.int8,            # type code
+    'active': np.bool_,         # False once collected or hit
+    'osc_speed': np.float64,    # oscillation speed (radians per second)
+    'osc_amp': np.float64,      # oscillation amplitude in px; 0 for static objects
+    'screen_x': np.float64,     # left edge relative to the screen, set by update()
+}
+# Columns that never change once a row is added, in records() order
+RECORD = ('x', 'y', 'width', 'height', 'kind', 'osc_amp', 'osc_speed')
+
+
+class EntityStore:
+    def __init__(self, capacity=64):
+        self.count = 0
+        self.dropped = 0    # rows removed by drop_front(), so row ids survive it
+        self.rows = None    # RECORD tuples for records(), once asked for
+        self.row_xs = None  # and the x column as a list, for x_keys()
+        for name, dtype in COLUMNS.items():
+            setattr(self, name, np.zeros(capacity, dtype))
+
+    def __len__(self):
+        return self.count
+
+    def reserve(self, capacity):
+        if capacity <= len(self.x):
+            return
+        capacity = max(capacity, len(self.x) * 2)
+        for name in COLUMNS:
+            old = getattr(self, name)
+            new = np.zeros(capacity, old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def add(self, x, y, width, height, kind, osc_speed=0.0, osc_amp=0.0):
+        i = self.count
+        self.reserve(i + 1)
+        self.x[i] = x
+        self.y[i] = y
+        self.width[i] = width
+        self.height[i] = height
+        self.kind[i] = kind
+        self.active[i] = True
+        self.osc_speed[i] = osc_speed
+        self.osc_amp[i] = osc_amp
+        self.screen_x[i] = x
+        self.count += 1
+        if self.rows is not None:
+            self.rows.append((float(x), float(y), float(width), float(height), int(kind),
+                              float(osc_amp), float(osc_speed)))
+            self.row_xs.append(float(x))
+        return i
+
+    def extend(self, other):
+        n = other.count
+        self.reserve(self.count + n)
+        for name in COLUMNS:
+            getattr(self, name)[self.count:self.count + n] = getattr(other, name)[:n]
+        self.count += n
+        if self.rows is not None:
+            self.rows.extend(other.records(0, n))
+            self.row_xs.extend(other.x_keys())
+
+    def copy(self):
+        store = EntityStore(max(self.count, 1))
+        store.extend(self)
+        store.dropped = self.dropped
+        return store
+
+    def drop_front(self, n):
+        # Remove the first n rows, keeping the rest in order
+        keep = self.count - n
+        self.dropped += n
+        for name in COLUMNS:
+            column = getattr(self, name)
+            column[:keep] = column[n:self.count]
+        self.count = keep
+        if self.rows is not None:
+            del self.rows[:n]
+            del self.row_xs[:n]
+
+    def sort_by_x(self):
+        order = np.argsort(self.x[:self.count], kind='stable')
+        for name in COLUMNS:
+            column = getattr(self, name)
+            column[:self.count] = column[:self.count][order]
+        self.rows = None
+        self.row_xs = None
+
+    def records(self, lo, hi):
+        # Rows lo..hi as RECORD tuples of Python numbers
+        if self.rows is None:
+            self.rows = list(zip(*(getattr(self, name)[:self.count].tolist() for name in RECORD)))
+            self.row_xs = self.x[:self.count].tolist()
+        return self.rows[lo:hi]
+
+    def x_keys(self):
+        # The x column as a Python list, which bisects and compares faster
+        # than NumPy scalars
+        if self.rows is None:
+            self.records(0, 0)
+        return self.row_xs
+
+    def xs(self):
+        return self.x[:self.count]
+
+    def window_pad(self):
+        # How far beyond its rest x an object can reach: width plus swing
+        if self.count == 0:
+            return 0.0
+        return float((self.width[:self.count] + self.osc_amp[:self.count]).max())
+
+    def update(self, lo, hi, level_position, t):
+        # Screen positions of rows lo..hi; t is seconds since the level started
+        if hi - lo < SCALAR_ROWS:
+            self.screen_x[lo:hi] = [
+                x + amp * math.sin(t * speed) - level_position if amp else x - level_position
+                for x, _, _, _, _, amp, speed in self.records(lo, hi)]
+            return
+        self.screen_x[lo:hi] = (self.x[lo:hi] + self.osc_amp[lo:hi] * np.sin(t * self.osc_speed[lo:hi])
+                                - level_position)
+
+    def overlaps(self, lo, hi, x, y, width, height):
+        # Active rows in lo..hi whose box overlaps the given screen-space box,
+        # as {type code: indices in x order}; empty when nothing is hit
+        if lo == hi:
+            return {}
+        if hi - lo < SCALAR_ROWS:
+            hits = {}
+            right = x + width
+            bottom = y + height
+            for i, left, (_, top, w, h, kind, _, _) in zip(range(lo, hi), self.screen_x[lo:hi].tolist(),
+                                                          self.records(lo, hi)):
+                if left < right and left + w > x and top < bottom and top + h > y and self.active[i]:
+                    hits.setdefault(kind, []).append(i)
+            return {kind: np.array(indices) for kind, indices in hits.items()}
+        screen_x = self.screen_x[lo:hi]
+        top = self.y[lo:hi]
+        hit = (self.active[lo:hi]
+               & (screen_x < x + width) & (screen_x + self.width[lo:hi] > x)
+               & (top < y + height) & (top + self.height[lo:hi] > y))
+        indices = hit.nonzero()[0]
+        if indices.size == 0:
+            return {}
+        indices += lo
+        kinds = self.kind[indices]
+        return {int(kind): indices[kinds == kind] for kind in np.unique(kinds)}
+
+    def visible(self, lo, hi, screen_width):
+        # Active rows in lo..hi that are at least partly on screen
+        screen_x = self.screen_x[lo:hi]
+        shown = self.active[lo:hi] & (screen_x >= -self.width[lo:hi]) & (screen_x <= screen_width)
+        return shown.nonzero()[0] + lo
@@ -0,0 +1,156 @@
+"""Adaptive render quality.
+
+The simulation runs in fixed steps and catches up when frames run late,
+but only up to MAX_STEPS_PER_FRAME steps a frame; on hardware too slow to
+draw a frame within a few budgets, the game itself slows down.  The
+QualityGovernor watches how long each drawn frame took and walks a ladder
+of QUALITY_LEVELS, from everything on down to a half-resolution picture
+scaled up to the window, to keep frames inside the budget.
+
+The HysteresisPolicy decides when to move.  Costs are judged per window of
+frames by a high percentile, so one slow frame (a level load, a garbage
+collection) does not count.  Quality drops as soon as a window runs over
+`down` of the budget, but only rises again once a window comes in under
+`up` and the current level has been held for `up_hold` seconds.  A step up
+that has to be taken back soon after doubles that hold, so a machine right
+on the edge settles instead of flickering between two levels.
+
+Each step down is judged on the next window: one that made frames dearer
+rather than cheaper (stretching a small picture can cost more than it saves
+on a fast CPU) is taken back, and the ladder ends there from then on.
+
+Every change is kept in `log` with the measurement that caused it.
+"""
+import json
+import time
+from collections import deque
+
+from profiler import percentile
+from sim import FRAME_MS
+
+LOG_SIZE = 256
+
+
+class Quality:
+    def __init__(self, layers=None, thrust=True, overlay_alpha=True, scale=1.0):
+        self.layers = layers                # nearest background layers drawn; None = all
+        self.thrust = thrust                # thrust flame behind the plane
+        self.overlay_alpha = overlay_alpha  # translucent menu overlays over the game
+        self.scale = scale                  # world render resolution relative to the window
+
+    def __repr__(self):
+        layers = "all" if self.layers is None else self.layers
+        return (f"layers={layers} thrust={'on' if self.thrust else 'off'} "
+                f"alpha={'on' if self.overlay_alpha else 'off'} scale={self.scale:g}")
+
+
+# Best first; each step gives up one more thing
+QUALITY_LEVELS = (
+    Quality(),
+    Quality(layers=1),
+    Quality(layers=1, thrust=False),
+    Quality(layers=1, thrust=False, overlay_alpha=False),
+    Quality(layers=0, thrust=False, overlay_alpha=False),
+    # Half size: stretching back up by exactly 2 is far cheaper than by 4/3
+    Quality(layers=0, thrust=False, overlay_alpha=False, scale=0.5),
+)
+
+
+class HysteresisPolicy:
+    def __init__(self, budget_ms=FRAME_MS, window=30, pct=90, down=0.9, up=0.6,
+                 up_hold=3.0, backoff=2.0, max_up_hold=60.0, worse=1.1):
+        self.budget_ms = budget_ms
+        self.window = window            # frames per judgement
+        self.pct = pct                  # percentile of a window taken as its cost
+        self.down = down                # step down above this share of the budget
+        self.up = up                    # step up below this share of the budget...
+        self.up_hold = up_hold          # ...once the level has been held this many seconds
+        self.backoff = backoff          # hold multiplier after a step up is taken back
+        self.max_up_hold = max_up_hold
+        self.worse = worse              # a step down costing this much more than before is undone
+
+    def decide(self, cost_ms, held, hold):
+        # -1 to step down, 1 to step up, 0 to stay; held is seconds at the
+        # current level and hold the seconds required before stepping up
+        if cost_ms > self.budget_ms * self.down:
+            return -1
+        if cost_ms < self.budget_ms * self.up and held >= hold:
+            return 1
+        return 0
+
+
+class QualityGovernor:
+    def __init__(self, apply, levels=QUALITY_LEVELS, policy=None, level=0, clock=time.perf_counter):
+        # apply(quality) is called whenever the level changes, and once now
+        self.apply = apply
+        self.levels = levels
+        self.policy = policy if policy is not None else HysteresisPolicy()
+        self.clock = clock
+        self.level = level
+        self.samples = []
+        self.frames = 0
+        self.hold = self.policy.up_hold
+        self.origin = self.changed_at = clock()
+        self.stepped_up_at = None
+        self.stepped_down_from = None   # (level, cost) until the step down is judged
+        self.floor = len(levels) - 1    # lowest level worth going down to
+        self.log = deque(maxlen=LOG_SIZE)
+        apply(levels[level])
+
+    @property
+    def quality(self):
+        return self.levels[self.level]
+
+    def sample(self, ms):
+        # Cost of one drawn frame, in ms
+        self.frames += 1
+        self.samples.append(ms)
+        policy = self.policy
+        if len(self.samples) < policy.window:
+            return
+        cost = percentile(self.samples, policy.pct)
+        self.samples = []
+        now = self.clock()
+
+        if self.stepped_down_from is not None:
+            # First judgement since stepping down: a step that made frames
+            # dearer (e.g. scaling costing more than it saves) is undone and
+            # not tried again
+            level, before = self.stepped_down_from
+            self.stepped_down_from = None
+            if cost > before * policy.worse:
+                self.floor = level
+                self.change(level, now, f"p{policy.pct} {cost:.2f} ms dearer than level {level} at {before:.2f} ms")
+                return
+
+        step = policy.decide(cost, now - self.changed_at, self.hold)
+        if step < 0 and self.level < self.floor:
+            if self.stepped_up_at is not None and now - self.stepped_up_at < self.hold * 2:
+                # The last step up didn't hold; wait longer before the next
+                self.hold = min(self.hold * policy.backoff, policy.max_up_hold)
+            self.stepped_up_at = None
+            self.stepped_down_from = (self.level, cost)
+            self.change(self.level + 1, now,
+                        f"p{policy.pct} {cost:.2f} ms over {policy.budget_ms * policy.down:.2f} ms")
+        elif step > 0 and self.level > 0:
+            self.stepped_up_at = now
+            self.change(self.level - 1, now,
+                        f"p{policy.pct} {cost:.2f} ms under {policy.budget_ms * policy.up:.2f} ms "
+                        f"for {self.hold:g} s")
+
+    def change(self, level, now, reason):
+        self.log.append({
+            "frame": self.frames,
+            "time": round(now - self.origin, 3),
+            "from": self.level,
+            "to": level,
+            "reason": reason,
+            "quality": repr(self.levels[level]),
+        })
+        self.level = level
+        self.changed_at = now
+        self.apply(self.levels[level])
+
+    def export(self, path):
+        with open(path, "w") as f:
+            json.dump(list(self.log), f, indent=1)
@@ -0,0 +1,227 @@
+"""Binary level files.
+
+A level file holds one level's objects as x-sorted columns, so a level
+can be shipped as data instead of coming out of `random`:
+
+    header   MAGIC, then HEADER: version, flags (0), object count, window pad
+    x        float64 * count, ascending: left edge at rest, in level coordinates
+    y        float64 * count
+    speed    float64 * count: oscillation speed, radians per second
+    amp      float64 * count: oscillation amplitude in px; 0 for static objects
+    kind     int8 * count: entity type code
+
+Widths and heights follow from the type (SIZES).  The window pad is how far
+an object can reach past its x; sim.Game uses it to size the windows it
+keeps over the level.
+
+Opening a file maps it into memory and reads only the header and the
+one-byte kind column, which is checked there.  LevelFiles plugs into
+sim.Game as its streamer, like endless mode does.  As the level scrolls,
+it copies the rows coming within reach into the game's entity store and
+drops the rows left behind, so a level of any length opens almost
+instantly and is paged in as it is played.
+
+    python levelfile.py export --seed 42 levels/seed42    # levels/seed42-1.lvl .. -5.lvl
+    python levelfile.py info levels/seed42-3.lvl
+    python app2.py --levels levels/seed42-*.lvl
+
+An exported level plays exactly like the seeded level it came from.
+"""
+import argparse
+import mmap
+import struct
+
+import numpy as np
+
+import sim
+from entities import EntityStore, ASTEROID, FUEL, STAR, FINISH, TYPE_NAMES
+from sim import SCREEN_WIDTH
+
+MAGIC = b"SKYLEVEL"
+VERSION = 1
+HEADER = struct.Struct("<HHQd")     # version, flags, object count, window pad
+DATA_START = 32                     # columns start here, 8-byte aligned
+FLOAT_COLUMNS = ('x', 'y', 'osc_speed', 'osc_amp')
+
+# Type code -> (width, height)
+SIZES = {
+    ASTEROID: (sim.ASTEROID_SIZE, sim.ASTEROID_SIZE),
+    FUEL: (sim.FUEL_SIZE, sim.FUEL_SIZE),
+    STAR: (sim.STAR_SIZE, sim.STAR_SIZE),
+    FINISH: (sim.FINISH_WIDTH, sim.SCREEN_HEIGHT),
+}
+WIDTHS = np.array([SIZES[kind][0] for kind in range(len(TYPE_NAMES))], np.float64)
+HEIGHTS = np.array([SIZES[kind][1] for kind in range(len(TYPE_NAMES))], np.float64)
+
+DROP_BATCH = 256    # rows left behind before they are dropped from the store
+
+
+class LevelFileError(Exception):
+    pass
+
+
+def export(path, entities):
+    # Write an entity store, e.g. from sim.generate_level(), as a level file
+    n = entities.count
+    kinds = entities.kind[:n]
+    if n and (kinds.min() < 0 or kinds.max() >= len(TYPE_NAMES)):
+        raise LevelFileError("unknown object type")
+    if (entities.width[:n] != WIDTHS[kinds]).any() or (entities.height[:n] != HEIGHTS[kinds]).any():
+        raise LevelFileError("object sizes must follow their type")
+    xs = entities.xs()
+    if (xs[1:] < xs[:-1]).any():
+        raise LevelFileError("objects must be sorted by x")
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(HEADER.pack(VERSION, 0, n, entities.window_pad()))
+        f.write(bytes(DATA_START - f.tell()))
+        for name in FLOAT_COLUMNS:
+            f.write(np.ascontiguousarray(getattr(entities, name)[:n], '<f8').tobytes())
+        f.write(kinds.astype(np.int8).tobytes())
+
+
+class LevelFile:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            try:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise LevelFileError(f"{path}: empty file") from None
+        if self.map[:len(MAGIC)] != MAGIC:
+            raise LevelFileError(f"{path}: not a level file")
+        if len(self.map) < DATA_START:
+            raise LevelFileError(f"{path}: truncated header")
+        version, flags, self.count, self.window_pad = HEADER.unpack_from(self.map, len(MAGIC))
+        if version != VERSION:
+            raise LevelFileError(f"{path}: unsupported level version {version}")
+        if len(self.map) != DATA_START + self.count * (8 * len(FLOAT_COLUMNS) + 1):
+            raise LevelFileError(f"{path}: size does not match its {self.count} objects")
+        # Views into the mapping: nothing is read until rows are copied out
+        offset = DATA_START
+        for name in FLOAT_COLUMNS:
+            setattr(self, name, np.frombuffer(self.map, '<f8', self.count, offset))
+            offset += 8 * self.count
+        self.kind = np.frombuffer(self.map, np.int8, self.count, offset)
+        # One byte per object, so checking the whole column up front is cheap
+        if self.count and (self.kind.min() < 0 or self.kind.max() >= len(TYPE_NAMES)):
+            raise LevelFileError(f"{path}: unknown object type")
+
+    def __len__(self):
+        return self.count
+
+    def rows(self, lo, hi):
+        # Rows lo..hi as a new entity store
+        kinds = self.kind[lo:hi]
+        store = EntityStore(max(hi - lo, 1))
+        n = len(kinds)
+        for name in FLOAT_COLUMNS:
+            getattr(store, name)[:n] = getattr(self, name)[lo:hi]
+        store.kind[:n] = kinds
+        store.width[:n] = WIDTHS[kinds]
+        store.height[:n] = HEIGHTS[kinds]
+        store.active[:n] = True
+        store.screen_x[:n] = store.x[:n]
+        store.count = n
+        return store
+
+    def load(self):
+        # The whole level at once, as sim.generate_level() would return it
+        return self.rows(0, self.count)
+
+
+class LevelFiles:
+    # Streamer for sim.Game: level n plays files[n - 1], wrapping around
+    # when the run has more levels than there are files
+    def __init__(self, paths):
+        if not paths:
+            raise LevelFileError("no level files given")
+        # Only headers are read here, so bad files show up before play starts
+        self.files = [LevelFile(path) for path in paths]
+        # Extra distance to keep behind the screen, e.g. for rewinding
+        self.keep_behind = 0
+        self.index = 0
+        self.level = None
+
+    def start(self, game):
+        self.index = (game.level - 1) % len(self.files)
+        self.level = self.files[self.index]
+        game.set_entities(EntityStore(), self.level.window_pad)
+        self.advance(game)
+        game.update_objects()
+
+    def snapshot(self):
+        # Which rows are loaded follows from the entity store itself
+        return self.index
+
+    def restore(self, index):
+        self.index = index
+        self.level = self.files[index]
+
+    def advance(self, game):
+        level = self.level
+        entities = game.entities
+        # Rows in the store are level rows dropped .. dropped + count
+        first = entities.dropped
+        loaded = first + entities.count
+        x = level.x
+
+        # Copy in the rows that can reach the view window
+        reach = game.level_position + SCREEN_WIDTH + game.window_pad
+        if loaded < level.count and x[loaded] < reach:
+            end = loaded + int(np.searchsorted(x[loaded:], reach))
+            entities.extend(level.rows(loaded, end))
+
+        # Drop rows out of reach behind, a batch at a time
+        behind = game.level_position - game.window_pad - self.keep_behind
+        if entities.count > DROP_BATCH and x[first + DROP_BATCH - 1] < behind:
+            count = int(np.searchsorted(x[first:loaded], behind))
+            entities.drop_front(count)
+            game.view_window.shift(count)
+            game.collision_window.shift(count)
+
+
+def parse_levels(text):
+    # "1-5" or "2,4" or a mix of both
+    levels = []
+    for part in text.split(","):
+        if "-" in part:
+            first, last = part.split("-")
+            levels.extend(range(int(first), int(last) + 1))
+        elif part:
+            levels.append(int(part))
+    return levels
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export and inspect binary level files")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_cmd = commands.add_parser("export", help="write seeded levels as level files")
+    export_cmd.add_argument("--seed", type=int, required=True, help="run seed, as in sim.Game.run_seed")
+    export_cmd.add_argument("--levels", default=f"1-{sim.LEVEL_COUNT}", help="levels to export, e.g. 1-5 or 3")
+    export_cmd.add_argument("--length", type=int, default=sim.LEVEL_LENGTH)
+    export_cmd.add_argument("--density", type=float, default=1, help="object count multiplier")
+    export_cmd.add_argument("prefix", help="files are written to PREFIX-LEVEL.lvl")
+    info_cmd = commands.add_parser("info", help="summarize a level file")
+    info_cmd.add_argument("file")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "export":
+            for level in parse_levels(args.levels):
+                path = f"{args.prefix}-{level}.lvl"
+                entities = sim.generate_level(level, args.seed, args.length, args.density)
+                export(path, entities)
+                print(f"{path}: {len(entities)} objects")
+        else:
+            level = LevelFile(args.file)
+            kinds = np.bincount(level.kind, minlength=len(TYPE_NAMES))
+            print(f"{len(level)} objects over {level.x[-1] if len(level) else 0:.0f} px, "
+                  f"window pad {level.window_pad:g}")
+            print(", ".join(f"{count} {name}" for name, count in zip(TYPE_NAMES, kinds.tolist())))
+    except (OSError, LevelFileError) as e:
+        parser.exit(1, f"levelfile.py: {e}\n")
+
+
+if __name__ == "__main__":
+    main()
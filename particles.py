@@ -0,0 +1,133 @@
+"""Particle effects: engine exhaust, asteroid debris and pickup sparkles.
+
+All particles live in one fixed-capacity pool of NumPy arrays (position,
+velocity, weight, drag, life, color), allocated up front.  Live particles are
+kept packed at the front of the arrays, so a step is a handful of in-place
+vectorized operations over the first `count` rows; the holes particles
+leave when they expire are filled from the end, in work proportional to
+the number that expired.  No Python object is created per
+particle, ever: emitting fills rows, and drawing writes the pixels straight
+into the surface through a pixel array view.  When the pool is full new
+particles are simply not emitted, so the budget caps the cost.
+
+Particles are decoration only.  They are stepped with the simulation but
+kept out of its state and use their own random generator, so runs, replays
+and rewinds are unaffected.  Positions are in level coordinates, so debris
+stays where the asteroid was while the level scrolls past.
+"""
+import numpy as np
+import pygame
+
+DEFAULT_CAPACITY = 2048
+GRAVITY = 0.15
+
+# Kinds: (weight against gravity, drag per step, life in steps)
+EXHAUST = 0
+DEBRIS = 1
+SPARKLE = 2
+STYLES = (
+    (0.0, 0.92, (10, 20)),
+    (1.0, 0.97, (30, 50)),
+    (-0.2, 0.9, (20, 40)),
+)
+
+
+class ParticlePool:
+    def __init__(self, capacity=DEFAULT_CAPACITY, seed=None):
+        self.capacity = capacity
+        self.count = 0
+        self.dropped = 0    # particles not emitted because the pool was full
+        self.x = np.zeros(capacity, np.float32)
+        self.y = np.zeros(capacity, np.float32)
+        self.vx = np.zeros(capacity, np.float32)
+        self.vy = np.zeros(capacity, np.float32)
+        self.weight = np.zeros(capacity, np.float32)
+        self.drag = np.zeros(capacity, np.float32)
+        self.life = np.zeros(capacity, np.float32)      # steps left
+        self.color = np.zeros(capacity, np.uint8)       # index into the palette given to draw()
+        # Scratch for update()
+        self.alive = np.zeros(capacity, np.bool_)
+        self.dead = np.zeros(capacity, np.bool_)
+        self.rng = np.random.default_rng(seed)
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.count = 0
+
+    def emit(self, n, x, y, kind, color, speed=(0.5, 2.0), vx=0.0, vy=0.0, angle=(0, 2 * np.pi)):
+        # n particles of a kind from (x, y), flying off at random angles and
+        # speeds on top of a shared velocity (vx, vy)
+        wanted = n
+        n = min(n, self.capacity - self.count)
+        self.dropped += wanted - n
+        if n <= 0:
+            return 0
+        rows = slice(self.count, self.count + n)
+        rng = self.rng
+        weight, drag, life = STYLES[kind]
+        directions = rng.uniform(angle[0], angle[1], n)
+        speeds = rng.uniform(speed[0], speed[1], n)
+        self.x[rows] = x
+        self.y[rows] = y
+        self.vx[rows] = np.cos(directions) * speeds + vx
+        self.vy[rows] = np.sin(directions) * speeds + vy
+        self.weight[rows] = weight * GRAVITY
+        self.drag[rows] = drag
+        self.life[rows] = rng.integers(life[0], life[1], n, endpoint=True)
+        self.color[rows] = color
+        self.count += n
+        return n
+
+    def update(self):
+        # One simulation step for every live particle
+        n = self.count
+        if not n:
+            return
+        vx = self.vx[:n]
+        vy = self.vy[:n]
+        life = self.life[:n]
+        vy += self.weight[:n]
+        vx *= self.drag[:n]
+        vy *= self.drag[:n]
+        self.x[:n] += vx
+        self.y[:n] += vy
+        life -= 1
+        alive = np.greater(life, 0, out=self.alive[:n])
+        live = int(np.count_nonzero(alive))
+        if live < n:
+            # Fill the holes left in the first live rows with the survivors
+            # from the rows after them: work in proportion to the deaths
+            holes = np.flatnonzero(np.logical_not(alive[:live], out=self.dead[:live]))
+            movers = np.flatnonzero(alive[live:]) + live
+            for column in (self.x, self.y, self.vx, self.vy, self.weight, self.drag, self.life, self.color):
+                column[holes] = column[movers]
+            self.count = live
+
+    def draw(self, surface, palette, level_position, scale=1.0):
+        # palette holds one (r, g, b) per color index.  Particles are plotted
+        # as 2x2 pixel squares (1x1 in their last few steps), straight into
+        # the surface's pixels.
+        n = self.count
+        if not n:
+            return
+        width, height = surface.get_size()
+        xs = ((self.x[:n] - level_position) * scale).astype(np.intp)
+        ys = (self.y[:n] * scale).astype(np.intp)
+        shown = (xs >= 0) & (xs < width - 1) & (ys >= 0) & (ys < height - 1)
+        xs = xs[shown]
+        ys = ys[shown]
+        colors = np.array([surface.map_rgb(color) for color in palette], np.uint32)[self.color[:n][shown]]
+        big = self.life[:n][shown] > 4
+        pixels = pygame.surfarray.pixels2d(surface)
+        try:
+            pixels[xs, ys] = colors
+            xs = xs[big]
+            ys = ys[big]
+            colors = colors[big]
+            pixels[xs + 1, ys] = colors
+            pixels[xs, ys + 1] = colors
+            pixels[xs + 1, ys + 1] = colors
+        finally:
+            del pixels
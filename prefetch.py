@@ -0,0 +1,80 @@
+"""Background generation of the next level.
+
+Levels are built when the player presses SPACE on the level complete screen,
+so anything that makes generation heavier (denser levels, validation) would
+show up as a hitch right then.  With a LevelPrefetcher attached, the game
+asks for the next level as soon as the finish line is crossed, a worker
+builds it while the overlay is up, and pressing SPACE only swaps in the
+finished entity store: a handful of attribute assignments, however big the
+level is.
+
+The worker only fills NumPy arrays; it never touches pygame.  Sprites are
+looked up by type code on the main thread when objects are drawn, as for a
+level built in place.  Levels depend on nothing but (level, seed), so a
+prefetched level is identical to one built on the spot, and replays and the
+solver are unaffected.
+
+Each handoff is timed; `handoffs` keeps (level, ms, prefetched) for the last
+HISTORY levels loaded.
+"""
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import sim
+
+HISTORY = 64
+
+
+def build_level(level_num, seed, build=sim.generate_level):
+    # Runs on the worker: the level and its window padding, so the handoff
+    # doesn't have to scan the new level either
+    entities = build(level_num, seed)
+    return entities, entities.window_pad()
+
+
+class LevelPrefetcher:
+    def __init__(self, executor=None, build=sim.generate_level):
+        # Any concurrent.futures executor will do; levels pickle, so a
+        # ProcessPoolExecutor keeps generation off the main interpreter entirely
+        self.executor = executor if executor is not None else ThreadPoolExecutor(1, "level-prefetch")
+        self.build = build
+        self.key = None         # (level, seed) being built or ready
+        self.future = None
+        self.handoffs = deque(maxlen=HISTORY)
+
+    def attach(self, game):
+        game.prefetch = self
+
+    def request(self, level_num, seed):
+        # Start building a level in the background; repeat requests are free
+        if self.key == (level_num, seed):
+            return
+        if self.future is not None:
+            self.future.cancel()
+        self.key = (level_num, seed)
+        self.future = self.executor.submit(build_level, level_num, seed, self.build)
+
+    def ready(self):
+        return self.future is not None and self.future.done()
+
+    def load(self, game, level_num):
+        # Put a level in place for game.init_level(): the prefetched one,
+        # waiting for the worker if it is still busy, else one built on the spot
+        started = time.perf_counter()
+        seed = game.run_seed
+        prefetched = self.future is not None and self.key == (level_num, seed)
+        if prefetched:
+            entities, window_pad = self.future.result()
+        else:
+            if self.future is not None:
+                self.future.cancel()
+            entities, window_pad = build_level(level_num, seed, self.build)
+        self.key = self.future = None
+        game.set_entities(entities, window_pad)
+        self.handoffs.append((level_num, (time.perf_counter() - started) * 1000, prefetched))
+
+    def close(self):
+        if self.future is not None:
+            self.future.cancel()
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,101 @@
+"""Per-phase frame profiler.
+
+The main loop and the game call mark(phase) at the end of each phase of a
+frame (event polling, update, collisions, background, ...) and frame() at
+the top of every loop.  The time since the previous mark is charged to the
+named phase, so phases that run several times a frame (simulation steps)
+add up.  Frames are kept in a short rolling history for the on-screen
+overlay, and optionally every phase is kept for export as a Chrome trace
+(chrome://tracing or https://ui.perfetto.dev).
+
+When profiling is off the game holds NULL_PROFILER, whose methods do
+nothing, so instrumentation costs one empty method call per mark.
+"""
+import json
+import os
+import time
+from collections import deque
+
+HISTORY = 240                   # frames kept for the overlay
+TRACE_LIMIT = 1_000_000         # trace events kept for export; the oldest go first
+
+
+class NullProfiler:
+    enabled = False
+
+    def frame(self):
+        pass
+
+    def mark(self, phase):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+class FrameProfiler:
+    enabled = True
+
+    def __init__(self, history=HISTORY, trace=False, trace_limit=TRACE_LIMIT):
+        self.frames = deque(maxlen=history)     # (frame ns, {phase: ns})
+        self.events = deque(maxlen=trace_limit) if trace else None  # (name, start ns, end ns)
+        self.origin = time.perf_counter_ns()
+        self.frame_start = None
+        self.last = None
+        self.phases = {}
+
+    def frame(self):
+        # Close the frame in progress and start the next one
+        now = time.perf_counter_ns()
+        if self.frame_start is not None:
+            self.frames.append((now - self.frame_start, self.phases))
+            if self.events is not None:
+                self.events.append(("frame", self.frame_start, now))
+        self.frame_start = self.last = now
+        self.phases = {}
+
+    def mark(self, phase):
+        # Charge the time since the previous mark to phase
+        now = time.perf_counter_ns()
+        if self.last is None:
+            return
+        self.phases[phase] = self.phases.get(phase, 0) + now - self.last
+        if self.events is not None:
+            self.events.append((phase, self.last, now))
+        self.last = now
+
+    def frame_times(self):
+        return [ns / 1e6 for ns, _ in self.frames]
+
+    def summary(self, idle_phases=("tick",)):
+        # Percentiles in ms of whole frames and of busy time (frames minus
+        # time spent waiting in idle_phases), and mean ms per phase
+        if not self.frames:
+            return None
+        totals = self.frame_times()
+        busy = [(ns - sum(phases.get(name, 0) for name in idle_phases)) / 1e6
+                for ns, phases in self.frames]
+        means = {}
+        for _, phases in self.frames:
+            for name, ns in phases.items():
+                means[name] = means.get(name, 0) + ns
+        return {
+            "frame": {p: percentile(totals, p) for p in (50, 95, 99)},
+            "busy": {p: percentile(busy, p) for p in (50, 95, 99)},
+            "phases": {name: ns / 1e6 / len(self.frames) for name, ns in means.items()},
+        }
+
+    def export(self, path):
+        # Chrome trace event format: one complete ("X") event per phase, with
+        # frames enclosing their phases on the same track
+        events = [{"name": name, "ph": "X", "pid": os.getpid(), "tid": 0,
+                   "ts": (start - self.origin) / 1000, "dur": (end - start) / 1000}
+                  for name, start, end in self.events or ()]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        return len(events)
@@ -0,0 +1,327 @@
+"""Input-log replays.
+
+A replay is the game's seed plus everything the player did, one entry per
+tick: a tick is either a simulation step, stored as its arrow-key bitmask
+(sim.INPUT_*), or a SPACE press, stored as INPUT_SPACE.  Runs of identical
+ticks are run-length encoded and written as they close, so recording costs
+next to nothing per frame.  Since the simulation is deterministic, playing
+the ticks back against a fresh game reproduces the session exactly.
+
+Every KEYFRAME_INTERVAL ticks the recorder also stores a full snapshot of
+the game, so a player can seek to any tick by restoring the keyframe before
+it and simulating at most KEYFRAME_INTERVAL ticks.
+
+File layout: the header (MAGIC, version, flags, seed, then with
+FLAG_SEED_BANK the bank's size as a varint and its seeds as uint32), then
+records until the end of the file.  An input record is the tick value followed by the run
+length as a varint; a keyframe record is KEYFRAME_TAG, its tick and its
+length as varints, then the zlib-compressed snapshot.  A replay cut short by
+a crash is still readable up to its last complete record.
+
+    python replay.py info FILE     # seed, length, keyframes
+    python replay.py verify FILE   # play back headless at full speed
+    python app2.py --replay FILE   # watch it (LEFT/RIGHT seek 5 s)
+"""
+import argparse
+import json
+import struct
+import time
+import zlib
+from array import array
+
+import numpy as np
+
+import sim
+from collision import CollisionMasks
+from endless import ChunkStreamer
+from entities import COLUMNS, EntityStore
+
+MAGIC = b"SKYREPLAY"
+VERSION = 1
+HEADER = struct.Struct("<BBq")  # version, flags, seed (see sim.seed64)
+FLAG_ENDLESS = 1
+FLAG_PRECISE = 2    # pixel-accurate collision (collision.py)
+FLAG_SEED_BANK = 4  # runs draw their seeds from a bank (solver.py)
+
+INPUT_SPACE = 16
+KEYFRAME_TAG = 0xFF
+KEYFRAME_INTERVAL = 10 * sim.FPS
+
+
+class ReplayError(Exception):
+    pass
+
+
+def write_varint(out, value):
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        if pos >= len(data):
+            raise IndexError("truncated varint")
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def encode_state(state):
+    # Scalars as JSON, then the RNG's Mersenne Twister words and the entity
+    # columns as raw arrays
+    version, words, gauss = state['rng']
+    entities = state['entities']
+    header = json.dumps({
+        'game': state['game'],
+        'plane': state['plane'],
+        'rng': [version, gauss],
+        'streamer': state['streamer'],
+        'count': len(entities),
+    }, sort_keys=True).encode()
+    parts = [struct.pack("<I", len(header)), header, array('I', words).tobytes()]
+    for name in COLUMNS:
+        parts.append(getattr(entities, name)[:len(entities)].tobytes())
+    return b"".join(parts)
+
+
+def decode_state(data):
+    (size,) = struct.unpack_from("<I", data)
+    pos = 4 + size
+    header = json.loads(data[4:pos])
+    words = array('I')
+    words.frombytes(data[pos:pos + 625 * words.itemsize])
+    pos += 625 * words.itemsize
+    count = header['count']
+    entities = EntityStore(max(count, 1))
+    for name, dtype in COLUMNS.items():
+        column = np.frombuffer(data, dtype, count, pos)
+        getattr(entities, name)[:count] = column
+        pos += column.nbytes
+    entities.count = count
+    version, gauss = header['rng']
+    streamer = header['streamer']
+    return {
+        'game': header['game'],
+        'plane': header['plane'],
+        'rng': (version, tuple(words), gauss),
+        'entities': entities,
+        'streamer': tuple(streamer) if streamer is not None else None,
+    }
+
+
+class ReplayWriter:
+    # Attach to a game right after creating it and call record() after each
+    # game.update(inputs) with inputs, and after each game.handle_space()
+    # with INPUT_SPACE
+    def __init__(self, path, game, keyframe_interval=KEYFRAME_INTERVAL):
+        if game.seed is None:
+            raise ReplayError("recording needs a game created with an explicit seed")
+        self.game = game
+        self.keyframe_interval = keyframe_interval
+        self.file = open(path, "wb")
+        flags = ((FLAG_ENDLESS if game.streamer is not None else 0)
+                 | (FLAG_PRECISE if game.masks is not None else 0)
+                 | (FLAG_SEED_BANK if game.seed_bank else 0))
+        self.file.write(MAGIC + HEADER.pack(VERSION, flags, game.seed))
+        if game.seed_bank:
+            bank = bytearray()
+            write_varint(bank, len(game.seed_bank))
+            self.file.write(bank + array('I', game.seed_bank).tobytes())
+        self.tick = 0
+        self.value = None   # the run being counted
+        self.count = 0
+        self.write_keyframe()
+
+    def record(self, value):
+        if value == self.value:
+            self.count += 1
+        else:
+            self.flush_run()
+            self.value = value
+            self.count = 1
+        self.tick += 1
+        if self.tick % self.keyframe_interval == 0:
+            self.flush_run()
+            self.write_keyframe()
+
+    def flush_run(self):
+        if self.count:
+            record = bytearray((self.value,))
+            write_varint(record, self.count)
+            self.file.write(record)
+        self.value = None
+        self.count = 0
+
+    def write_keyframe(self):
+        payload = zlib.compress(encode_state(self.game.snapshot()), 1)
+        record = bytearray((KEYFRAME_TAG,))
+        write_varint(record, self.tick)
+        write_varint(record, len(payload))
+        self.file.write(record)
+        self.file.write(payload)
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.flush_run()
+        self.file.close()
+
+
+class Replay:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        if not data.startswith(MAGIC):
+            raise ReplayError(f"{path}: not a replay file")
+        pos = len(MAGIC)
+        if len(data) < pos + HEADER.size:
+            raise ReplayError(f"{path}: truncated header")
+        version, flags, self.seed = HEADER.unpack_from(data, pos)
+        if version != VERSION:
+            raise ReplayError(f"{path}: unsupported replay version {version}")
+        self.endless = bool(flags & FLAG_ENDLESS)
+        self.precise = bool(flags & FLAG_PRECISE)
+        pos += HEADER.size
+        self.seed_bank = None
+        if flags & FLAG_SEED_BANK:
+            try:
+                count, pos = read_varint(data, pos)
+            except IndexError:
+                raise ReplayError(f"{path}: truncated header")
+            bank = array('I')
+            bank.frombytes(data[pos:pos + count * bank.itemsize])
+            if len(bank) != count:
+                raise ReplayError(f"{path}: truncated header")
+            self.seed_bank = bank.tolist()
+            pos += count * bank.itemsize
+
+        # Expand the input runs to one byte per tick; keyframes stay
+        # compressed until a seek needs them
+        self.ticks = bytearray()
+        self.keyframes = []     # (tick, compressed snapshot), in tick order
+        try:
+            while pos < len(data):
+                value = data[pos]
+                if value == KEYFRAME_TAG:
+                    tick, pos = read_varint(data, pos + 1)
+                    size, pos = read_varint(data, pos)
+                    if pos + size > len(data):
+                        break
+                    self.keyframes.append((tick, data[pos:pos + size]))
+                    pos += size
+                else:
+                    count, pos = read_varint(data, pos + 1)
+                    self.ticks += bytes((value,)) * count
+        except IndexError:
+            pass    # cut short mid-record
+
+    def __len__(self):
+        return len(self.ticks)
+
+    def new_game(self):
+        game = sim.Game(self.seed, ChunkStreamer() if self.endless else None)
+        if self.precise:
+            game.masks = CollisionMasks()
+        game.seed_bank = self.seed_bank
+        return game
+
+    def keyframe_state(self, index):
+        return decode_state(zlib.decompress(self.keyframes[index][1]))
+
+
+class ReplayPlayer:
+    # Drives a game (sim.Game or app2.Game) created with the replay's seed
+    # and streamer, e.g. by Replay.new_game()
+    def __init__(self, replay, game):
+        self.replay = replay
+        self.game = game
+        self.tick = 0
+
+    def done(self):
+        return self.tick >= len(self.replay.ticks)
+
+    def step(self):
+        value = self.replay.ticks[self.tick]
+        if value & INPUT_SPACE:
+            self.game.handle_space()
+        else:
+            self.game.update(value)
+        self.tick += 1
+        return value
+
+    def advance(self):
+        # Play SPACE presses up to and including the next simulation step,
+        # i.e. one frame of game time; False once the replay has ended
+        while not self.done():
+            if not self.step() & INPUT_SPACE:
+                return True
+        return False
+
+    def seek(self, tick):
+        # Restore the last keyframe at or before tick (unless playing on from
+        # here is shorter), then simulate the rest of the way
+        tick = max(0, min(tick, len(self.replay.ticks)))
+        index = -1
+        for i, (keyframe_tick, _) in enumerate(self.replay.keyframes):
+            if keyframe_tick > tick:
+                break
+            index = i
+        if index >= 0:
+            keyframe_tick = self.replay.keyframes[index][0]
+            if tick < self.tick or keyframe_tick > self.tick:
+                self.game.restore(self.replay.keyframe_state(index))
+                self.tick = keyframe_tick
+        while self.tick < tick:
+            self.step()
+
+
+def verify(replay):
+    # Play the whole replay headless, checking the game against every
+    # keyframe on the way; returns the mismatched keyframe ticks
+    game = replay.new_game()
+    player = ReplayPlayer(replay, game)
+    mismatches = []
+    for tick, payload in replay.keyframes:
+        while player.tick < tick:
+            player.step()
+        if encode_state(game.snapshot()) != zlib.decompress(payload):
+            mismatches.append(tick)
+    while not player.done():
+        player.step()
+    return game, mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sky Navigator replays")
+    parser.add_argument("command", choices=("info", "verify"))
+    parser.add_argument("path")
+    args = parser.parse_args()
+
+    try:
+        replay = Replay(args.path)
+    except (OSError, ReplayError) as e:
+        raise SystemExit(f"replay: {e}")
+    steps = sum(1 for value in replay.ticks if not value & INPUT_SPACE)
+    print(f"seed {replay.seed}{' (endless)' if replay.endless else ''}: {len(replay)} ticks, "
+          f"{steps / sim.FPS:.1f} s of play, {len(replay.keyframes)} keyframes")
+    if args.command == "verify":
+        started = time.perf_counter()
+        game, mismatches = verify(replay)
+        elapsed = time.perf_counter() - started
+        print(f"played in {elapsed:.2f} s ({steps / elapsed:.0f} frames/s): "
+              f"level {game.level}, score {game.score}, battery {game.battery_level:.1f}, "
+              f"{'won' if game.win else 'game over' if game.game_over else 'in progress'}")
+        if mismatches:
+            raise SystemExit(f"state diverged from the recording at ticks {mismatches}")
+        print("all keyframes match")
+
+
+if __name__ == "__main__":
+    main()
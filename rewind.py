@@ -0,0 +1,127 @@
+"""Rewind: roll the game back frame by frame.
+
+Everything static about a level (object positions, sizes, types,
+oscillation) is already in the game's entity store and is not copied.  What
+changes from frame to frame is a handful of scalars (plane, battery, score,
+level_position, ...) plus the objects collected or hit that frame, so each
+frame is recorded as one fixed-size row: the scalars, and the row ids of
+any objects switched off.  Rows live in preallocated NumPy arrays used as a
+ring buffer, so memory is fixed up front, whatever the level size, and
+recording or stepping back a frame costs the same however much is stored.
+
+History starts over whenever a new level or run is loaded.
+"""
+import numpy as np
+
+from sim import FPS, MAX_OSCILLATION_AMPLITUDE
+
+REWIND_SECONDS = 5
+MAX_BYTES = 256 * 1024
+# Most objects switched off in one frame; a frame with more starts history over
+MAX_CHANGES = 8
+# Furthest the level can scroll in one frame: top scroll speed plus top plane speed
+MAX_FRAME_DISTANCE = 16
+
+# Per-frame game and plane attributes -> type to restore them as
+GAME_FIELDS = {
+    'level': int, 'score': int, 'battery_level': float, 'scroll_speed': float,
+    'game_active': bool, 'game_over': bool, 'level_complete': bool,
+    'level_position': float, 'is_colliding': bool, 'last_collision_time': float,
+    'frame': int, 'level_frame': int, 'win': bool,
+}
+PLANE_FIELDS = {'y': float, 'velocity_x': float, 'velocity_y': float, 'inputs': int}
+
+
+class Rewind:
+    def __init__(self, seconds=REWIND_SECONDS, max_bytes=MAX_BYTES):
+        fields = len(GAME_FIELDS) + len(PLANE_FIELDS)
+        frame_bytes = fields * 8 + MAX_CHANGES * 8 + 1
+        self.capacity = max(2, min(int(seconds * FPS), max_bytes // frame_bytes))
+        self.values = np.zeros((self.capacity, fields), np.float64)
+        self.changes = np.zeros((self.capacity, MAX_CHANGES), np.int64)
+        self.change_counts = np.zeros(self.capacity, np.uint8)
+        self.entities = None
+        self.head = 0       # slot the next frame is written to
+        self.size = 0       # frames held, the oldest being the base we can't go behind
+        self.pending = []   # row ids switched off since the last record()
+        self.frame = None   # game.frame of the latest frame held
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.changes.nbytes + self.change_counts.nbytes
+
+    @property
+    def seconds(self):
+        # How far back the game can currently be rewound
+        return max(self.size - 1, 0) / FPS
+
+    def attach(self, game):
+        game.rewind = self
+        if game.streamer is not None:
+            # Keep chunks loaded for as far back as the buffer reaches
+            game.streamer.keep_behind = self.capacity * MAX_FRAME_DISTANCE + MAX_OSCILLATION_AMPLITUDE
+        self.clear(game)
+
+    def clear(self, game):
+        self.entities = game.entities
+        self.size = 0
+        self.pending = []
+        self.record(game)
+
+    def deactivated(self, entities, indices):
+        self.pending.extend((np.atleast_1d(indices) + entities.dropped).tolist())
+
+    def record(self, game):
+        # Call after every game.update(); updates that did not advance the
+        # game (menus, overlays) are not recorded
+        if game.entities is not self.entities or len(self.pending) > MAX_CHANGES:
+            self.clear(game)
+            return
+        if game.frame == self.frame and self.size:
+            return
+        self.frame = game.frame
+        slot = self.head
+        row = self.values[slot]
+        i = 0
+        for name in GAME_FIELDS:
+            row[i] = getattr(game, name)
+            i += 1
+        plane = game.plane
+        for name in PLANE_FIELDS:
+            row[i] = getattr(plane, name)
+            i += 1
+        count = len(self.pending)
+        self.change_counts[slot] = count
+        if count:
+            self.changes[slot, :count] = self.pending
+            self.pending = []
+        self.head = (slot + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def step_back(self, game):
+        # Restore the frame before the latest one; False once out of history
+        if game.entities is not self.entities or self.size < 2:
+            return False
+        # Switch back on whatever the latest frame switched off
+        latest = (self.head - 1) % self.capacity
+        count = self.change_counts[latest]
+        if count:
+            entities = game.entities
+            indices = self.changes[latest, :count] - entities.dropped
+            entities.active[indices[indices >= 0]] = True
+        self.head = latest
+        self.size -= 1
+        self.pending = []
+
+        row = self.values[(latest - 1) % self.capacity].tolist()
+        i = 0
+        for name, kind in GAME_FIELDS.items():
+            setattr(game, name, kind(row[i]))
+            i += 1
+        plane = game.plane
+        for name, kind in PLANE_FIELDS.items():
+            setattr(plane, name, kind(row[i]))
+            i += 1
+        self.frame = game.frame
+        game.update_objects()
+        return True
@@ -0,0 +1,532 @@
+"""Authoritative game server.
+
+The server, not the client, plays each run: clients send the arrow keys
+they hold, one small packet per frame, and the server steps its own
+headless sim.Game for them at a fixed TICK_RATE and streams back what
+changed.  Hundreds of sessions share one asyncio event loop.  Each tick
+they are stepped in batches of BATCH_SIZE, with the loop let back in
+between, so incoming packets are read while a big tick is still in
+progress.
+
+Every message is framed with a uint16 length.  Client to server:
+
+    HELLO    seed (int64), flags (replay.FLAG_ENDLESS | FLAG_PRECISE)
+    INPUT    tick (uint32), bits (sim.INPUT_* | replay.INPUT_SPACE)
+    METRICS  (no body): ask for the server metrics
+
+Server to client:
+
+    WELCOME  session id (uint32)
+    DELTA    tick (uint32), mask (uint16), then the FIELDS whose bit is set
+             in mask, in order; with EVENTS set, a count (uint8) and the
+             row ids (uint32) of the objects hit or collected that tick
+    METRICS  JSON
+
+The input for a tick is the last packet tagged with that tick or earlier.
+When none has arrived, the previous input is held.  A session's deltas are
+against the last state sent to it.  When a client reads too slowly its
+deltas are held back, and the next one sent covers everything since.
+
+Metrics cover:
+- ticks per second;
+- tick duration against the budget;
+- per-session CPU time per tick (thread CPU time around each step);
+- late and missing inputs;
+- traffic.
+
+--record DIR keeps a replay of every session, so a run can be verified
+later with `python replay.py verify`.
+
+    python server.py serve                       # 127.0.0.1:7777
+    python server.py bot --sessions 200 --seconds 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import struct
+import time
+from collections import deque
+
+import numpy as np
+
+import sim
+from endless import ChunkStreamer
+from profiler import percentile
+from replay import FLAG_ENDLESS, FLAG_PRECISE, INPUT_SPACE, ReplayWriter
+
+HOST = "127.0.0.1"
+PORT = 7777
+TICK_RATE = sim.FPS
+BATCH_SIZE = 64
+MAX_CATCH_UP = 5                # ticks run back to back before the rest are skipped
+MAX_PENDING = TICK_RATE         # input packets buffered per session
+SEND_LIMIT = 64 * 1024          # bytes queued to a client before its deltas are held back
+METRICS_WINDOW = 5              # seconds of ticks the rates are taken over
+
+FRAME = struct.Struct("<H")
+# Client to server
+HELLO = 1
+INPUT = 2
+METRICS = 3
+HELLO_BODY = struct.Struct("<BqB")
+INPUT_BODY = struct.Struct("<BIB")
+# Server to client
+WELCOME = 1
+DELTA = 2
+WELCOME_BODY = struct.Struct("<BI")
+DELTA_HEADER = struct.Struct("<BIH")
+
+# State flags
+ACTIVE = 1
+GAME_OVER = 2
+LEVEL_COMPLETE = 4
+WIN = 8
+COLLIDING = 16
+
+# Streamed state: (name, struct format), one mask bit each in this order
+FIELDS = (
+    ('run_seed', 'I'),
+    ('level', 'B'),
+    ('flags', 'B'),
+    ('inputs', 'B'),        # bits applied this tick, so a client can replay the run
+    ('score', 'I'),
+    ('battery_level', 'f'),
+    ('level_position', 'f'),
+    ('y', 'f'),
+    ('velocity_y', 'f'),
+    ('velocity_x', 'f'),
+)
+FIELD_STRUCTS = [struct.Struct("<" + fmt) for _, fmt in FIELDS]
+EVENTS = 1 << 15
+MAX_EVENTS = 255
+
+
+def frame(payload):
+    return FRAME.pack(len(payload)) + payload
+
+
+def state_of(game, applied):
+    plane = game.plane
+    flags = ((ACTIVE if game.game_active else 0) | (GAME_OVER if game.game_over else 0)
+             | (LEVEL_COMPLETE if game.level_complete else 0) | (WIN if game.win else 0)
+             | (COLLIDING if game.is_colliding else 0))
+    return (game.run_seed or 0, game.level, flags, applied, game.score, game.battery_level,
+            game.level_position, plane.y, plane.velocity_y, plane.velocity_x)
+
+
+def encode_delta(tick, state, sent, events):
+    # DELTA carrying the fields of state that differ from sent (None: all)
+    mask = 0
+    parts = []
+    for i, value in enumerate(state):
+        if sent is None or value != sent[i]:
+            mask |= 1 << i
+            parts.append(FIELD_STRUCTS[i].pack(value))
+    if events:
+        mask |= EVENTS
+        events = events[:MAX_EVENTS]
+        parts.append(struct.pack(f"<B{len(events)}I", len(events), *events))
+    return frame(DELTA_HEADER.pack(DELTA, tick, mask) + b"".join(parts))
+
+
+def decode_delta(payload, state):
+    # Apply a DELTA payload to state (a list, one entry per field); returns
+    # the tick and the row ids of the objects hit or collected
+    _, tick, mask = DELTA_HEADER.unpack_from(payload)
+    pos = DELTA_HEADER.size
+    for i, field in enumerate(FIELD_STRUCTS):
+        if mask & 1 << i:
+            (state[i],) = field.unpack_from(payload, pos)
+            pos += field.size
+    events = ()
+    if mask & EVENTS:
+        count = payload[pos]
+        events = struct.unpack_from(f"<{count}I", payload, pos + 1)
+    return tick, events
+
+
+class ServerGame(sim.Game):
+    def __init__(self, seed, streamer=None):
+        super().__init__(seed, streamer)
+        self.events = []    # row ids switched off since the last delta
+
+    def deactivate(self, indices):
+        super().deactivate(indices)
+        self.events.extend((np.atleast_1d(indices) + self.entities.dropped).tolist())
+
+
+class Session:
+    def __init__(self, session_id, game, transport, writer=None):
+        self.id = session_id
+        self.game = game
+        self.transport = transport
+        self.writer = writer        # ReplayWriter, with --record
+        self.pending = deque()      # (tick, bits) not applied yet
+        self.inputs = 0
+        self.tick = 0
+        self.sent = None
+        self.cpu_ns = 0
+        self.late = 0
+        self.missing = 0
+        self.held_back = 0
+
+    def next_input(self):
+        # Bits for this tick and whether SPACE was pressed since the last one
+        pending = self.pending
+        space = False
+        found = False
+        while pending and pending[0][0] <= self.tick:
+            tick, bits = pending.popleft()
+            self.late += tick < self.tick
+            space |= bool(bits & INPUT_SPACE)
+            self.inputs = bits & ~INPUT_SPACE
+            found = True
+        self.missing += not found
+        return self.inputs, space
+
+
+class GameServer:
+    def __init__(self, tick_rate=TICK_RATE, batch_size=BATCH_SIZE, record_dir=None):
+        self.tick_rate = tick_rate
+        self.batch_size = batch_size
+        self.record_dir = record_dir
+        self.sessions = {}
+        self.next_id = 1
+        self.masks = None           # shared by every precise session
+        self.started = time.perf_counter()
+        self.ticks = 0
+        self.skipped = 0            # ticks dropped to catch up
+        self.overruns = 0           # ticks that took longer than the budget
+        self.tick_times = deque()   # (end, ms, session steps) over METRICS_WINDOW
+        self.closed_cpu_ns = 0
+        self.closed_steps = 0
+        self.packets_in = 0
+        self.bytes_out = 0
+
+    def open_session(self, transport, seed, flags):
+        game = ServerGame(seed, ChunkStreamer() if flags & FLAG_ENDLESS else None)
+        if flags & FLAG_PRECISE:
+            if self.masks is None:
+                from collision import CollisionMasks
+                self.masks = CollisionMasks()
+            game.masks = self.masks
+        session_id = self.next_id
+        self.next_id += 1
+        writer = None
+        if self.record_dir:
+            writer = ReplayWriter(os.path.join(self.record_dir, f"session-{session_id}-{seed}.rpl"), game)
+        session = Session(session_id, game, transport, writer)
+        self.sessions[session_id] = session
+        return session
+
+    def close_session(self, session):
+        if self.sessions.pop(session.id, None) is None:
+            return
+        self.closed_cpu_ns += session.cpu_ns
+        self.closed_steps += session.tick
+        if session.writer is not None:
+            session.writer.close()
+
+    def step(self, session):
+        started = time.thread_time_ns()
+        game = session.game
+        bits, space = session.next_input()
+        if space:
+            game.handle_space()
+            if session.writer is not None:
+                session.writer.record(INPUT_SPACE)
+        game.update(bits)
+        if session.writer is not None:
+            session.writer.record(bits)
+        session.tick += 1
+        state = state_of(game, bits)
+        transport = session.transport
+        if transport.get_write_buffer_size() < SEND_LIMIT:
+            message = encode_delta(session.tick, state, session.sent, game.events)
+            transport.write(message)
+            self.bytes_out += len(message)
+            session.sent = state
+            game.events.clear()
+        else:
+            session.held_back += 1
+            del game.events[:-MAX_EVENTS]
+        session.cpu_ns += time.thread_time_ns() - started
+
+    async def tick(self):
+        started = time.perf_counter()
+        sessions = list(self.sessions.values())
+        for first in range(0, len(sessions), self.batch_size):
+            for session in sessions[first:first + self.batch_size]:
+                if session.id in self.sessions:
+                    self.step(session)
+            # Let packets in between batches
+            await asyncio.sleep(0)
+        now = time.perf_counter()
+        ms = (now - started) * 1000
+        self.ticks += 1
+        self.overruns += ms > 1000 / self.tick_rate
+        self.tick_times.append((now, ms, len(sessions)))
+        while self.tick_times[0][0] < now - METRICS_WINDOW:
+            self.tick_times.popleft()
+
+    async def run(self):
+        interval = 1 / self.tick_rate
+        next_tick = time.perf_counter()
+        while True:
+            now = time.perf_counter()
+            if now < next_tick:
+                await asyncio.sleep(next_tick - now)
+                continue
+            behind = int((now - next_tick) / interval)
+            if behind > MAX_CATCH_UP:
+                self.skipped += behind - MAX_CATCH_UP
+                next_tick += (behind - MAX_CATCH_UP) * interval
+            await self.tick()
+            next_tick += interval
+
+    def metrics(self):
+        window = list(self.tick_times)
+        span = window[-1][0] - window[0][0] if len(window) > 1 else 0
+        durations = [ms for _, ms, _ in window]
+        sessions = list(self.sessions.values())
+        costs = sorted(((session.cpu_ns / session.tick / 1000, session.id)
+                        for session in sessions if session.tick), reverse=True)
+        cpu_ns = self.closed_cpu_ns + sum(session.cpu_ns for session in sessions)
+        steps = self.closed_steps + sum(session.tick for session in sessions)
+        return {
+            "sessions": len(sessions),
+            "uptime_s": round(time.perf_counter() - self.started, 1),
+            "ticks": self.ticks,
+            "ticks_per_s": round((len(window) - 1) / span, 2) if span else 0,
+            "session_ticks_per_s": round(sum(count for _, _, count in window[1:]) / span) if span else 0,
+            "tick_ms": {p: round(percentile(durations, p), 3) for p in (50, 95, 99)} if durations else {},
+            "tick_budget_ms": round(1000 / self.tick_rate, 3),
+            "overruns": self.overruns,
+            "skipped": self.skipped,
+            "session_cpu_us_per_tick": {
+                "mean": round(cpu_ns / steps / 1000, 2) if steps else 0,
+                "p95": round(percentile([us for us, _ in costs], 95), 2) if costs else 0,
+                "top": [[session_id, round(us, 2)] for us, session_id in costs[:5]],
+            },
+            "late_inputs": sum(session.late for session in sessions),
+            "missing_inputs": sum(session.missing for session in sessions),
+            "deltas_held_back": sum(session.held_back for session in sessions),
+            "packets_in": self.packets_in,
+            "bytes_out": self.bytes_out,
+        }
+
+
+class FrameReader:
+    # Splits a byte stream into length-framed payloads
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        self.buffer += data
+        buffer = self.buffer
+        pos = 0
+        payloads = []
+        while len(buffer) - pos >= FRAME.size:
+            (size,) = FRAME.unpack_from(buffer, pos)
+            if len(buffer) - pos - FRAME.size < size:
+                break
+            payloads.append(bytes(buffer[pos + FRAME.size:pos + FRAME.size + size]))
+            pos += FRAME.size + size
+        del buffer[:pos]
+        return payloads
+
+
+class ClientConnection(asyncio.Protocol):
+    def __init__(self, server):
+        self.server = server
+        self.reader = FrameReader()
+        self.transport = None
+        self.session = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        server = self.server
+        for payload in self.reader.feed(data):
+            server.packets_in += 1
+            kind = payload[0] if payload else None
+            if kind == INPUT and self.session is not None and len(payload) == INPUT_BODY.size:
+                _, tick, bits = INPUT_BODY.unpack(payload)
+                pending = self.session.pending
+                if len(pending) < MAX_PENDING:
+                    pending.append((tick, bits))
+            elif kind == HELLO and self.session is None and len(payload) == HELLO_BODY.size:
+                _, seed, flags = HELLO_BODY.unpack(payload)
+                self.session = server.open_session(self.transport, seed, flags)
+                self.transport.write(frame(WELCOME_BODY.pack(WELCOME, self.session.id)))
+            elif kind == METRICS:
+                self.transport.write(frame(bytes((METRICS,)) + json.dumps(server.metrics()).encode()))
+            else:
+                # Anything else is a broken or hostile client
+                self.transport.close()
+                return
+
+    def connection_lost(self, exc):
+        if self.session is not None:
+            self.server.close_session(self.session)
+
+
+async def serve(args):
+    server = GameServer(args.tick_rate, args.batch_size, args.record)
+    loop = asyncio.get_running_loop()
+    if args.unix:
+        listener = await loop.create_unix_server(lambda: ClientConnection(server), args.unix)
+    else:
+        listener = await loop.create_server(lambda: ClientConnection(server), args.host, args.port)
+    where = args.unix or f"{args.host}:{args.port}"
+    print(f"serving on {where} at {args.tick_rate} ticks/s", flush=True)
+
+    async def report():
+        while True:
+            await asyncio.sleep(args.stats)
+            m = server.metrics()
+            print(f"{m['sessions']} sessions, {m['ticks_per_s']} ticks/s, "
+                  f"{m['session_ticks_per_s']} session ticks/s, tick p95 {m['tick_ms'].get(95, 0)} ms, "
+                  f"{m['session_cpu_us_per_tick']['mean']} us CPU per session tick, "
+                  f"{m['overruns']} overruns, {m['skipped']} skipped", flush=True)
+
+    async with listener:
+        tasks = [asyncio.ensure_future(server.run())]
+        if args.stats:
+            tasks.append(asyncio.ensure_future(report()))
+        await asyncio.gather(*tasks)
+
+
+class Bot(asyncio.Protocol):
+    # Flies one session: thrust right and hold a height that wanders slowly,
+    # sending its input for a few ticks ahead of the latest state seen
+    def __init__(self, seed, flags, lead):
+        self.seed = seed
+        self.flags = flags
+        self.lead = lead
+        self.reader = FrameReader()
+        self.transport = None
+        self.session_id = None
+        self.state = [0] * len(FIELDS)
+        self.deltas = 0
+        self.delta_bytes = 0
+        self.metrics = None
+        self.metrics_received = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        transport.write(frame(HELLO_BODY.pack(HELLO, self.seed, self.flags)))
+
+    def data_received(self, data):
+        for payload in self.reader.feed(data):
+            kind = payload[0]
+            if kind == DELTA:
+                tick, _ = decode_delta(payload, self.state)
+                self.deltas += 1
+                self.delta_bytes += FRAME.size + len(payload)
+                self.transport.write(frame(INPUT_BODY.pack(INPUT, tick + self.lead, self.choose(tick))))
+            elif kind == WELCOME:
+                self.session_id = WELCOME_BODY.unpack(payload)[1]
+                self.transport.write(frame(INPUT_BODY.pack(INPUT, 0, INPUT_SPACE)))
+            elif kind == METRICS:
+                self.metrics = json.loads(payload[1:])
+                self.metrics_received.set()
+
+    def choose(self, tick):
+        state = dict(zip((name for name, _ in FIELDS), self.state))
+        if not state['flags'] & ACTIVE:
+            # Continue or start over every second on the menu screens
+            return INPUT_SPACE if tick % sim.FPS == 0 else 0
+        target = sim.SCREEN_HEIGHT / 2 + 150 * ((tick // 240 + self.seed) % 3 - 1)
+        bits = sim.INPUT_RIGHT
+        if state['y'] + state['velocity_y'] * 8 > target:
+            bits |= sim.INPUT_UP
+        return bits
+
+    async def fetch_metrics(self):
+        self.metrics_received = asyncio.Event()
+        self.transport.write(frame(bytes((METRICS,))))
+        await self.metrics_received.wait()
+        return self.metrics
+
+
+async def play_bots(args):
+    # Fly args.sessions bots for args.seconds; returns what the bots saw and
+    # the server's metrics at the end
+    loop = asyncio.get_running_loop()
+    flags = (FLAG_ENDLESS if args.endless else 0) | (0 if args.boxes else FLAG_PRECISE)
+    bots = []
+    for i in range(args.sessions):
+        bot = Bot(args.seed + i, flags, args.lead)
+        if args.unix:
+            await loop.create_unix_connection(lambda: bot, args.unix)
+        else:
+            await loop.create_connection(lambda: bot, args.host, args.port)
+        bots.append(bot)
+    started = time.perf_counter()
+    await asyncio.sleep(args.seconds)
+    elapsed = time.perf_counter() - started
+    metrics = await bots[0].fetch_metrics()
+    deltas = sum(bot.deltas for bot in bots)
+    delta_bytes = sum(bot.delta_bytes for bot in bots)
+    for bot in bots:
+        bot.transport.close()
+    return {
+        "bots": len(bots),
+        "seconds": elapsed,
+        "deltas_per_s": deltas / elapsed,
+        "bytes_per_delta": delta_bytes / max(deltas, 1),
+        "server": metrics,
+    }
+
+
+async def run_bots(args):
+    result = await play_bots(args)
+    print(f"{result['bots']} bots for {result['seconds']:.1f} s: {result['deltas_per_s']:.0f} deltas/s "
+          f"received, {result['bytes_per_delta']:.1f} bytes per delta")
+    print(json.dumps(result["server"], indent=1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Authoritative Sky Navigator server and bot client")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name, help in (("serve", "host game sessions"), ("bot", "connect bot clients to a server")):
+        command = commands.add_parser(name, help=help)
+        command.add_argument("--host", default=HOST)
+        command.add_argument("--port", type=int, default=PORT)
+        command.add_argument("--unix", metavar="PATH", help="use a Unix socket instead of TCP")
+    serve_cmd = commands.choices["serve"]
+    serve_cmd.add_argument("--tick-rate", type=int, default=TICK_RATE)
+    serve_cmd.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="sessions stepped between reads")
+    serve_cmd.add_argument("--record", metavar="DIR", help="write a replay of every session here")
+    serve_cmd.add_argument("--stats", type=float, default=5, help="seconds between metrics lines (0 = none)")
+    serve_cmd.set_defaults(func=serve)
+    bot_cmd = commands.choices["bot"]
+    bot_cmd.add_argument("--sessions", type=int, default=100)
+    bot_cmd.add_argument("--seconds", type=float, default=10)
+    bot_cmd.add_argument("--seed", type=int, default=0, help="bot n plays seed + n")
+    bot_cmd.add_argument("--lead", type=int, default=2, help="ticks ahead of the latest state to send input for")
+    bot_cmd.add_argument("--endless", action="store_true")
+    bot_cmd.add_argument("--boxes", action="store_true", help="box collisions instead of sprite masks")
+    bot_cmd.set_defaults(func=run_bots)
+    args = parser.parse_args()
+    if args.command == "bot":
+        # HELLO carries the seed as a signed 64-bit integer
+        last = args.seed + max(args.sessions, 1) - 1
+        if sim.seed64(args.seed) != args.seed or sim.seed64(last) != last:
+            parser.error("--seed: bot seeds must be signed 64-bit integers")
+
+    if getattr(args, "record", None):
+        os.makedirs(args.record, exist_ok=True)
+    try:
+        asyncio.run(args.func(args))
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        parser.exit(1, f"server.py: {e}\n")
+
+
+if __name__ == "__main__":
+    main()
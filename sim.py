@@ -0,0 +1,453 @@
+"""Headless simulation core for Sky Navigator.
+
+Everything here is pure game rules: no display, no wall clock and no
+keyboard.  Time advances in fixed steps of 1/FPS seconds, input arrives as a
+bitmask of arrow keys and levels are generated from a seed, so the same seed
+and input sequence always produce the same run.  `app2.py` layers rendering
+and the real-time loop on top of this module.
+"""
+import argparse
+import random
+import time
+
+from entities import EntityStore, ASTEROID, FUEL, STAR, FINISH, SCALAR_ROWS
+from profiler import NULL_PROFILER
+from spatial import SlidingWindow
+
+# Constants
+SCREEN_WIDTH = 800
+SCREEN_HEIGHT = 600
+PLANE_WIDTH = 60
+PLANE_HEIGHT = 30
+GRAVITY = 0.2
+FLIGHT_POWER = 0.5
+ASTEROID_SIZE = 40
+MAX_OSCILLATION_AMPLITUDE = 30
+FUEL_SIZE = 30
+STAR_SIZE = 25
+FINISH_WIDTH = 60
+INITIAL_SCROLL_SPEED = 2
+MAX_BATTERY = 100
+BATTERY_DRAIN_RATE = 1      # Battery drain per second
+BATTERY_RECHARGE = 30
+ASTEROID_DAMAGE = 20
+COLLISION_COOLDOWN = 1000   # milliseconds
+SCORE_PER_SECOND = 10
+SCORE_PER_STAR = 100
+FPS = 60
+LEVEL_COUNT = 5             # Total levels
+LEVEL_LENGTH = 5000
+
+# Fixed timestep
+DT = 1 / FPS                # seconds per simulation step
+FRAME_MS = 1000 / FPS       # milliseconds per simulation step
+
+# Input bitmask, one bit per arrow key
+INPUT_UP = 1
+INPUT_DOWN = 2
+INPUT_LEFT = 4
+INPUT_RIGHT = 8
+
+
+class Plane:
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+        self.width = PLANE_WIDTH
+        self.height = PLANE_HEIGHT
+        self.velocity_y = 0
+        self.velocity_x = 0
+        self.max_velocity_x = 5
+        self.min_velocity_x = -2
+        self.inputs = 0
+
+    def update(self, inputs):
+        self.inputs = inputs
+
+        # Apply gravity
+        self.velocity_y += GRAVITY
+
+        # Apply player input
+        if inputs & INPUT_UP:
+            self.velocity_y -= FLIGHT_POWER
+        if inputs & INPUT_DOWN:
+            self.velocity_y += FLIGHT_POWER / 2
+        if inputs & INPUT_RIGHT:
+            self.velocity_x += 0.1
+            if self.velocity_x > self.max_velocity_x:
+                self.velocity_x = self.max_velocity_x
+        elif inputs & INPUT_LEFT:
+            self.velocity_x -= 0.1
+            if self.velocity_x < self.min_velocity_x:
+                self.velocity_x = self.min_velocity_x
+        else:
+            # Gradually return to normal speed
+            if self.velocity_x > 0:
+                self.velocity_x -= 0.05
+            elif self.velocity_x < 0:
+                self.velocity_x += 0.05
+            if abs(self.velocity_x) < 0.1:
+                self.velocity_x = 0
+
+        # Update position
+        self.y += self.velocity_y
+
+        # Keep plane within top bound only; touching the bottom will trigger a crash
+        if self.y < 0:
+            self.y = 0
+            self.velocity_y = 0
+
+
+def seed64(seed):
+    # Any integer as a signed 64-bit seed, the range replays store; seeds
+    # already in that range are unchanged
+    return (seed + 2 ** 63) % 2 ** 64 - 2 ** 63
+
+
+def level_rng(seed, level_num):
+    # Each level gets its own stream so any level can be rebuilt on its own
+    return random.Random(f"{seed}:{level_num}")
+
+
+def level_counts(level_num):
+    # Asteroids, fuel canisters and stars spread over one level
+    return 20 + (level_num * 5), 10 + level_num, 15 + (level_num * 2)
+
+
+def spawn_asteroid(entities, rng, x, moving):
+    y = rng.random() * (SCREEN_HEIGHT - ASTEROID_SIZE)
+    if moving:
+        entities.add(x, y, ASTEROID_SIZE, ASTEROID_SIZE, ASTEROID,
+                     rng.uniform(1, 3), rng.randint(10, MAX_OSCILLATION_AMPLITUDE))
+    else:
+        entities.add(x, y, ASTEROID_SIZE, ASTEROID_SIZE, ASTEROID)
+
+
+def spawn_pickup(entities, rng, x, size, kind):
+    y = rng.random() * (SCREEN_HEIGHT - size)
+    entities.add(x, y, size, size, kind)
+
+
+def generate_level(level_num, seed, length=LEVEL_LENGTH, density=1):
+    # density scales the object counts, e.g. for stress tests
+    rng = level_rng(seed, level_num)
+    entities = EntityStore()
+    asteroid_count, fuel_count, star_count = level_counts(level_num)
+
+    # Create asteroids (obstacles); for levels 3 and above, asteroids start moving
+    for i in range(round(asteroid_count * density)):
+        x = rng.random() * (length - 500) + 500  # Clear first 500px
+        spawn_asteroid(entities, rng, x, level_num >= 3)
+
+    # Create fuel canisters
+    for i in range(round(fuel_count * density)):
+        x = rng.random() * (length - 500) + 500
+        spawn_pickup(entities, rng, x, FUEL_SIZE, FUEL)
+
+    # Create stars (bonus points)
+    for i in range(round(star_count * density)):
+        x = rng.random() * (length - 500) + 500
+        spawn_pickup(entities, rng, x, STAR_SIZE, STAR)
+
+    # Create a finish line object at the end of the level
+    entities.add(length + 200, 0, FINISH_WIDTH, SCREEN_HEIGHT, FINISH)
+    entities.sort_by_x()
+    return entities
+
+
+class Game:
+    def __init__(self, seed=None, streamer=None):
+        # Master RNG: every run started from this game draws its level seed
+        # from here, so a whole session is reproducible from one number.
+        self.seed = seed64(seed) if seed is not None else None
+        self.rng = random.Random(self.seed)
+        # Optional level streamer (see endless.py) replacing fixed levels
+        self.streamer = streamer
+        # Optional rewind buffer (see rewind.py), told of every object collected or hit
+        self.rewind = None
+        # Frame profiler (see profiler.py); a no-op unless profiling is on
+        self.profiler = NULL_PROFILER
+        # Optional sprite masks (see collision.py) refining box hits to pixels
+        self.masks = None
+        # Optional list of run seeds to draw from, e.g. ones solver.py verified
+        self.seed_bank = None
+        # Optional LevelPrefetcher (see prefetch.py) building the next level in the background
+        self.prefetch = None
+        self.reset()
+
+    def reset(self):
+        self.plane = Plane(150, SCREEN_HEIGHT / 2)
+        self.level = 1
+        self.score = 0
+        self.battery_level = MAX_BATTERY
+        self.scroll_speed = INITIAL_SCROLL_SPEED
+        self.game_active = False
+        self.game_over = False
+        self.level_complete = False
+        self.level_position = 0
+        self.is_colliding = False
+        self.last_collision_time = -COLLISION_COOLDOWN
+        self.frame = 0          # simulation steps played this run
+        self.level_frame = 0    # simulation steps played this level
+        self.run_seed = None
+        self.win = False  # Indicates completion of level 5
+        self.set_entities(EntityStore())
+
+    # Plain attributes that, with the plane, the entity store, the master RNG
+    # and the streamer, make up the whole simulation state
+    STATE = ('level', 'score', 'battery_level', 'scroll_speed', 'game_active', 'game_over',
+             'level_complete', 'level_position', 'is_colliding', 'last_collision_time',
+             'frame', 'level_frame', 'run_seed', 'win', 'window_pad')
+
+    def snapshot(self):
+        # Independent copy of the simulation state, for restore()
+        return {
+            'game': {name: getattr(self, name) for name in self.STATE},
+            'plane': dict(vars(self.plane)),
+            'rng': self.rng.getstate(),
+            'entities': self.entities.copy(),
+            'streamer': self.streamer.snapshot() if self.streamer is not None else None,
+        }
+
+    def restore(self, state):
+        # The snapshot is left untouched, so it can be restored again
+        for name, value in state['game'].items():
+            setattr(self, name, value)
+        self.plane = Plane(0, 0)
+        vars(self.plane).update(state['plane'])
+        self.rng.setstate(state['rng'])
+        if self.streamer is not None:
+            self.streamer.restore(state['streamer'])
+        self.set_entities(state['entities'].copy(), self.window_pad)
+
+    @property
+    def time_ms(self):
+        return self.frame * FRAME_MS
+
+    def start_game(self):
+        self.reset()
+        self.game_active = True
+        if self.seed_bank:
+            self.run_seed = self.rng.choice(self.seed_bank)
+        else:
+            self.run_seed = self.rng.getrandbits(32)
+        self.init_level(self.level)
+
+    def next_level(self):
+        if self.level < LEVEL_COUNT:
+            self.level += 1
+            self.plane = Plane(150, SCREEN_HEIGHT / 2)
+            self.battery_level = MAX_BATTERY
+            self.scroll_speed = INITIAL_SCROLL_SPEED + (self.level * 0.5)
+            self.game_active = True
+            self.level_complete = False
+            self.init_level(self.level)
+        else:
+            # Already at final level: mark win (this state is set when finish line is reached)
+            self.win = True
+
+    def handle_space(self):
+        # If game has not started, start it.
+        if not self.game_active and not self.game_over and not self.level_complete and not self.win:
+            self.start_game()
+        # If level is complete (and not the final win), go to next level.
+        elif self.level_complete:
+            self.next_level()
+        # If game over or win, reset and start again.
+        elif self.game_over or self.win:
+            self.start_game()
+
+    def init_level(self, level_num):
+        self.level_position = 0
+        self.level_frame = 0
+        if self.streamer is not None:
+            self.streamer.start(self)
+        elif self.prefetch is not None:
+            self.prefetch.load(self, level_num)
+        else:
+            self.set_entities(generate_level(level_num, self.run_seed))
+
+    def set_entities(self, entities, window_pad=None):
+        # Entities are kept sorted by x so that only the slice near the
+        # screen is touched each frame, however long the level is.
+        # An entity's x is its left edge at rest; the windows are widened by
+        # the largest width and swing so nothing that can reach them is missed.
+        self.entities = entities
+        self.window_pad = entities.window_pad() if window_pad is None else window_pad
+        # Seek the windows to the current position, e.g. after a restore deep
+        # into a level, instead of walking them up from the first row
+        keys = entities.x_keys()
+        plane_x = self.level_position + self.plane.x
+        self.view_window = SlidingWindow()
+        self.view_window.seek(keys, self.level_position - self.window_pad,
+                              self.level_position + SCREEN_WIDTH + self.window_pad)
+        self.collision_window = SlidingWindow()
+        self.collision_window.seek(keys, plane_x - self.window_pad,
+                                   plane_x + self.plane.width + self.window_pad)
+        self.update_objects()
+
+    def update_objects(self):
+        left = self.level_position - self.window_pad
+        right = self.level_position + SCREEN_WIDTH + self.window_pad
+        lo, hi = self.view_window.update(self.entities.x_keys(), left, right)
+        self.entities.update(lo, hi, self.level_position, self.level_frame * DT)
+
+    def update(self, inputs=0):
+        if not self.game_active:
+            return
+
+        self.frame += 1
+        self.level_frame += 1
+
+        # Award whole points for time survived; integer maths keeps the
+        # fractional part of a second from being lost between frames
+        self.score += (self.frame * SCORE_PER_SECOND // FPS
+                       - (self.frame - 1) * SCORE_PER_SECOND // FPS)
+
+        self.plane.update(inputs)
+
+        # Crash if the plane touches the bottom of the screen
+        if self.plane.y + self.plane.height >= SCREEN_HEIGHT:
+            self.game_active = False
+            self.game_over = True
+            return
+
+        # Scroll the level
+        self.level_position += self.scroll_speed + self.plane.velocity_x
+
+        # Update game objects near the screen
+        if self.streamer is not None:
+            self.streamer.advance(self)
+        self.update_objects()
+        self.profiler.mark("update")
+
+        self.check_collisions()
+        self.profiler.mark("collisions")
+
+        # Drain battery over time
+        self.battery_level -= BATTERY_DRAIN_RATE * DT
+        if self.battery_level <= 0:
+            self.battery_level = 0
+            self.game_active = False
+            self.game_over = True
+
+    def check_collisions(self):
+        current_time = self.time_ms
+        if current_time - self.last_collision_time < COLLISION_COOLDOWN:
+            self.is_colliding = False
+            return
+
+        plane = self.plane
+        plane_x = self.level_position + plane.x
+        lo, hi = self.collision_window.update(
+            self.entities.x_keys(), plane_x - self.window_pad, plane_x + plane.width + self.window_pad)
+        hits = self.entities.overlaps(lo, hi, plane.x, plane.y, plane.width, plane.height)
+        if hits and self.masks is not None:
+            hits = self.masks.filter(plane, self.entities, hits)
+        if not hits:
+            return
+
+        # Hits in the same frame are resolved asteroid, fuel, star, finish
+        if ASTEROID in hits and not self.is_colliding:
+            self.is_colliding = True
+            self.last_collision_time = current_time
+            self.battery_level -= ASTEROID_DAMAGE
+            if self.battery_level < 0:
+                self.battery_level = 0
+            self.deactivate(hits[ASTEROID][0])
+        if FUEL in hits:
+            self.battery_level += BATTERY_RECHARGE * len(hits[FUEL])
+            if self.battery_level > MAX_BATTERY:
+                self.battery_level = MAX_BATTERY
+            self.deactivate(hits[FUEL])
+        if STAR in hits:
+            self.score += SCORE_PER_STAR * len(hits[STAR])
+            self.deactivate(hits[STAR])
+        if FINISH in hits:
+            self.game_active = False
+            if self.level < LEVEL_COUNT:
+                self.level_complete = True
+                if self.prefetch is not None and self.streamer is None:
+                    # Build the next level while the level complete screen is up
+                    self.prefetch.request(self.level + 1, self.run_seed)
+            else:
+                self.win = True
+
+    def deactivate(self, indices):
+        # Mark objects collected or hit
+        self.entities.active[indices] = False
+        if self.rewind is not None:
+            self.rewind.deactivated(self.entities, indices)
+
+
+def autopilot(game):
+    # Simple scripted pilot used for headless runs and benchmarks: hold the
+    # middle of the screen and hop over or under the next asteroid ahead.
+    plane = game.plane
+    entities = game.entities
+    lo, hi = game.view_window.lo, game.view_window.hi
+    target_y = SCREEN_HEIGHT / 2
+    obj = None
+    if hi - lo < SCALAR_ROWS:
+        for i, screen_x, (_, top, width, height, kind, _, _) in zip(
+                range(lo, hi), entities.screen_x[lo:hi].tolist(), entities.records(lo, hi)):
+            if (kind == ASTEROID and plane.x - width < screen_x < plane.x + 250
+                    and top - plane.height - 20 < plane.y < top + height + 20 and entities.active[i]):
+                obj = top, height
+                break
+    else:
+        screen_x = entities.screen_x[lo:hi]
+        top = entities.y[lo:hi]
+        height = entities.height[lo:hi]
+        ahead = (
+            entities.active[lo:hi] & (entities.kind[lo:hi] == ASTEROID)
+            & (screen_x > plane.x - entities.width[lo:hi]) & (screen_x < plane.x + 250)
+            & (top - plane.height - 20 < plane.y) & (plane.y < top + height + 20)).nonzero()[0]
+        if ahead.size:
+            obj = top[ahead[0]], height[ahead[0]]
+    if obj is not None:
+        obj_y, obj_height = obj
+        if obj_y + obj_height / 2 > SCREEN_HEIGHT / 2:
+            target_y = obj_y - plane.height - 30
+        else:
+            target_y = obj_y + obj_height + 30
+    inputs = INPUT_RIGHT
+    if plane.y + plane.velocity_y * 8 > target_y:
+        inputs |= INPUT_UP
+    return inputs
+
+
+def run(game, policy=autopilot, max_frames=None):
+    # Play the current run to completion (or max_frames) and return frames stepped
+    frames = 0
+    while max_frames is None or frames < max_frames:
+        if not game.game_active:
+            if game.level_complete:
+                game.next_level()
+            else:
+                break
+        game.update(policy(game))
+        frames += 1
+    return frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run Sky Navigator headless with the autopilot.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    game = Game(args.seed)
+    frames = 0
+    started = time.perf_counter()
+    for i in range(args.runs):
+        game.start_game()
+        frames += run(game)
+        outcome = "win" if game.win else f"game over on level {game.level}"
+        print(f"run {i + 1}: seed {game.run_seed}, score {game.score}, {outcome}")
+    elapsed = time.perf_counter() - started
+    print(f"{frames} frames in {elapsed:.2f}s ({frames / elapsed:.0f} frames/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""Level solvability checker.
+
+Levels are scattered at random, so a seed can produce a level that cannot be
+finished: a wall of asteroids, or too many unavoidable hits for the battery.
+solve_level() plays the real simulation (Plane physics, collisions, battery)
+to find inputs that reach the finish line.  It first lets the autopilot fly
+the whole level, which is enough for most seeds; when that fails, it runs a
+beam search: every DECISION_FRAMES frames each kept state is extended with
+each of ACTIONS, states that crash are dropped, states that land in the same
+coarse cell (height, speed, distance) are merged keeping the one with the
+most battery, and only the BEAM_WIDTH best go on.
+
+A seed is verified when all its levels are solved.  Seeds are checked across
+a process pool and the verdicts are cached by seed, so a growing bank only
+pays for new seeds:
+
+    python solver.py --seeds 0-4999 --bank seeds.json
+
+A level the search does not solve is not proven impossible, only not
+verified; such seeds are simply left out of the bank.
+"""
+import argparse
+import functools
+import json
+import multiprocessing as mp
+import os
+import time
+
+import sim
+from sim import INPUT_UP, INPUT_LEFT, INPUT_RIGHT
+
+SOLVER_VERSION = 1          # bump when level generation or the rules change
+DECISION_FRAMES = 8
+BEAM_WIDTH = 8
+AUTOPILOT = -1              # action: let sim.autopilot choose each frame
+ACTIONS = (AUTOPILOT, 0, INPUT_UP, INPUT_RIGHT, INPUT_UP | INPUT_RIGHT,
+           INPUT_LEFT, INPUT_UP | INPUT_LEFT)
+CELL = (10, 1, 20)          # merge states closer than this in y, velocity_y and distance px
+MAX_FRAMES = 100_000        # search gives up after simulating this many frames for a level
+
+
+def level_game(level, seed, masks=None):
+    # A game positioned at the start of one level of the run with this seed,
+    # as start_game() and next_level() would leave it
+    game = sim.Game()
+    game.masks = masks
+    game.game_active = True
+    game.run_seed = seed
+    game.level = level
+    if level > 1:
+        game.scroll_speed = sim.INITIAL_SCROLL_SPEED + level * 0.5
+    game.init_level(level)
+    return game
+
+
+def save(game):
+    # The parts of the state the search changes: level layout and RNGs stay put
+    return (tuple(getattr(game, name) for name in game.STATE), dict(vars(game.plane)),
+            game.entities.active.copy())
+
+
+def load(game, node):
+    values, plane, active = node
+    for name, value in zip(game.STATE, values):
+        setattr(game, name, value)
+    vars(game.plane).update(plane)
+    game.entities.active[:] = active
+
+
+def play(game, action, frames):
+    # Returns frames actually played (fewer once the level ends)
+    for played in range(frames):
+        if not game.game_active:
+            return played
+        game.update(sim.autopilot(game) if action == AUTOPILOT else action)
+    return frames
+
+
+def finished(game):
+    return game.level_complete or game.win
+
+
+def solve_level(level, seed, masks=None, beam_width=BEAM_WIDTH):
+    # Frames simulated to find a way through, or None if none was found
+    game = level_game(level, seed, masks)
+    simulated = play(game, AUTOPILOT, MAX_FRAMES)
+    if finished(game):
+        return simulated
+
+    game = level_game(level, seed, masks)
+    beam = [save(game)]
+    while beam and simulated < MAX_FRAMES:
+        cells = {}
+        for node in beam:
+            for action in ACTIONS:
+                load(game, node)
+                simulated += play(game, action, DECISION_FRAMES)
+                if finished(game):
+                    return simulated
+                if not game.game_active:
+                    continue
+                plane = game.plane
+                cell = (int(plane.y // CELL[0]), int(plane.velocity_y // CELL[1]),
+                        int(game.level_position // CELL[2]))
+                best = cells.get(cell)
+                if best is None or game.battery_level > best[0]:
+                    cells[cell] = (game.battery_level, game.level_position, save(game))
+        # Most battery first, then furthest along
+        ranked = sorted(cells.values(), key=lambda item: (item[0], item[1]), reverse=True)
+        beam = [node for _, _, node in ranked[:beam_width]]
+    return None
+
+
+_masks = None
+
+
+def check_seed(seed, precise=True):
+    # Verdict for one run seed: frames simulated per level, None where unsolved
+    global _masks
+    if precise and _masks is None:
+        from collision import CollisionMasks
+        _masks = CollisionMasks()
+    masks = _masks if precise else None
+    levels = []
+    for level in range(1, sim.LEVEL_COUNT + 1):
+        frames = solve_level(level, seed, masks)
+        levels.append(frames)
+        if frames is None:
+            break
+    return seed, levels
+
+
+class VerdictCache:
+    # JSON file of seed -> per-level verdicts, thrown away when the solver
+    # version or collision mode changes
+    def __init__(self, path, precise=True):
+        self.path = path
+        self.key = f"v{SOLVER_VERSION}-{'masks' if precise else 'boxes'}"
+        self.verdicts = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+                if data.get("key") == self.key:
+                    self.verdicts = {int(seed): levels for seed, levels in data["seeds"].items()}
+            except (OSError, ValueError):
+                pass
+
+    def solved(self, seed):
+        levels = self.verdicts[seed]
+        return len(levels) == sim.LEVEL_COUNT and None not in levels
+
+    def save(self):
+        if not self.path:
+            return
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"key": self.key, "seeds": self.verdicts}, f)
+        os.replace(tmp, self.path)
+
+
+def check_seeds(seeds, cache, workers=None, precise=True, progress=None):
+    # Fill the cache with verdicts for seeds not already in it
+    todo = [seed for seed in seeds if seed not in cache.verdicts]
+    if not todo:
+        return 0
+    check = functools.partial(check_seed, precise=precise)
+    if workers == 0:
+        results = map(check, todo)
+        pool = None
+    else:
+        pool = mp.Pool(workers)
+        results = pool.imap_unordered(check, todo, chunksize=4)
+    try:
+        for done, (seed, levels) in enumerate(results, 1):
+            cache.verdicts[seed] = levels
+            if progress is not None:
+                progress(done, len(todo))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return len(todo)
+
+
+def parse_seeds(text):
+    # "0-999" or "1,5,9" or a mix of both
+    seeds = []
+    for part in text.split(","):
+        if "-" in part:
+            first, last = part.split("-")
+            seeds.extend(range(int(first), int(last) + 1))
+        elif part:
+            seeds.append(int(part))
+    return seeds
+
+
+def load_bank(path):
+    with open(path) as f:
+        return [int(seed) for seed in json.load(f)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check which run seeds give finishable levels")
+    parser.add_argument("--seeds", default="0-999", help="seeds to check, e.g. 0-4999 or 3,7,11")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes (default: one per CPU; 0 = in-process)")
+    parser.add_argument("--cache", default="solver_cache.json", help="verdict cache file")
+    parser.add_argument("--bank", help="write the verified seeds here, for app2.py --seed-bank")
+    parser.add_argument("--boxes", action="store_true", help="box collisions instead of sprite masks")
+    args = parser.parse_args()
+
+    seeds = parse_seeds(args.seeds)
+    cache = VerdictCache(args.cache, precise=not args.boxes)
+    started = time.perf_counter()
+
+    def progress(done, total):
+        if done % 100 == 0 or done == total:
+            elapsed = time.perf_counter() - started
+            print(f"{done}/{total} seeds checked ({done / elapsed:.1f}/s)", flush=True)
+
+    try:
+        checked = check_seeds(seeds, cache, args.workers, not args.boxes, progress)
+    finally:
+        cache.save()
+    verified = [seed for seed in seeds if cache.solved(seed)]
+    failed = {}
+    for seed in seeds:
+        if not cache.solved(seed):
+            level = len(cache.verdicts[seed])
+            failed[level] = failed.get(level, 0) + 1
+    print(f"{len(verified)}/{len(seeds)} seeds verified ({len(seeds) - checked} from cache) "
+          f"in {time.perf_counter() - started:.1f} s")
+    for level, count in sorted(failed.items()):
+        print(f"  {count} unsolved at level {level}")
+    if args.bank:
+        with open(args.bank, "w") as f:
+            json.dump(verified, f)
+        print(f"bank of {len(verified)} seeds written to {args.bank}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""Sliding window over level objects sorted by x.
+
+Levels scroll in one direction, so the objects near the screen form a
+contiguous run of an x-sorted list that only ever moves forward.  Tracking
+the ends of that run costs work proportional to the objects entering and
+leaving it, not to the length of the level.
+"""
+import bisect
+
+
+class SlidingWindow:
+    def __init__(self):
+        self.lo = 0
+        self.hi = 0
+
+    def shift(self, count):
+        # Keep indices valid after the first count keys were removed
+        self.lo = max(0, self.lo - count)
+        self.hi = max(0, self.hi - count)
+
+    def seek(self, keys, left, right):
+        # Jump straight to a span, e.g. after a restore or a level load
+        self.lo = bisect.bisect_left(keys, left)
+        self.hi = max(self.lo, bisect.bisect_left(keys, right))
+        return self.lo, self.hi
+
+    def update(self, keys, left, right):
+        # Return (lo, hi) such that keys[lo:hi] are exactly the keys in [left, right)
+        n = len(keys)
+        lo = min(self.lo, n)
+        hi = min(self.hi, n)
+        while lo < n and keys[lo] < left:
+            lo += 1
+        while lo > 0 and keys[lo - 1] >= left:
+            lo -= 1
+        if hi < lo:
+            hi = lo
+        while hi < n and keys[hi] < right:
+            hi += 1
+        while hi > lo and keys[hi - 1] >= right:
+            hi -= 1
+        self.lo = lo
+        self.hi = hi
+        return lo, hi
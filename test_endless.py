@@ -0,0 +1,32 @@
+"""Tests for endless mode.
+
+    python -m pytest -q
+"""
+import sim
+from endless import CHUNK_LENGTH, LOOKAHEAD, ChunkStreamer
+from test_sim import SEED, assert_same, play, state
+
+
+def test_same_seed_and_inputs_give_the_same_endless_run():
+    runs = []
+    for _ in range(2):
+        game = sim.Game(SEED, ChunkStreamer())
+        play(game, 3000, sim.autopilot)
+        runs.append(state(game))
+    assert_same(*runs)
+
+
+def test_chunks_are_dropped_behind_the_screen():
+    game = sim.Game(SEED, ChunkStreamer())
+    game.start_game()
+    most = 0
+    while game.game_active and game.level_position < 10 * CHUNK_LENGTH:
+        game.update(sim.autopilot(game))
+        most = max(most, len(game.entities))
+    assert game.level_position >= 10 * CHUNK_LENGTH
+
+    # Only the chunks near the screen stay loaded
+    assert game.entities.dropped > 0
+    streamer = game.streamer
+    assert len(streamer.chunk_sizes) <= (LOOKAHEAD + game.window_pad) // CHUNK_LENGTH + 2
+    assert most < game.entities.dropped + len(game.entities)
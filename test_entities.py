@@ -0,0 +1,30 @@
+"""Tests for the entity store's two code paths.
+
+Windows under SCALAR_ROWS rows run as Python loops, larger ones as NumPy
+passes; both must step the game identically.
+
+    python -m pytest -q
+"""
+import pytest
+
+import entities
+import sim
+from test_sim import assert_same, play, state
+
+
+def flight(seed, density):
+    game = sim.Game(seed)
+    game.start_game()
+    if density != 1:
+        game.set_entities(sim.generate_level(game.level, game.run_seed, density=density))
+    play(game, 1500, sim.autopilot)
+    return state(game)
+
+
+@pytest.mark.parametrize("density", [1, 4, 12])
+@pytest.mark.parametrize("seed", [5, 11, 23])
+def test_scalar_and_vectorized_paths_agree(monkeypatch, seed, density):
+    default = flight(seed, density)
+    monkeypatch.setattr(entities, "SCALAR_ROWS", 0)
+    monkeypatch.setattr(sim, "SCALAR_ROWS", 0)
+    assert_same(default, flight(seed, density))
@@ -0,0 +1,38 @@
+"""Tests for binary level files.
+
+    python -m pytest -q
+"""
+import pytest
+
+import sim
+from levelfile import LevelFile, LevelFileError, LevelFiles, export
+from test_sim import SEED, assert_same, level_files, state
+
+
+def test_level_files_play_like_generated_levels(tmp_path):
+    generated = sim.Game(SEED)
+    generated.start_game()
+    from_files = sim.Game(SEED, LevelFiles(level_files(tmp_path, generated.run_seed)))
+    from_files.start_game()
+
+    levels = set()
+    for _ in range(6000):
+        for game in (generated, from_files):
+            if game.level_complete:
+                game.next_level()
+            game.update(sim.autopilot(game))
+        assert_same(state(generated), state(from_files))
+        levels.add(generated.level)
+        if not generated.game_active and not generated.level_complete:
+            break
+    assert len(levels) > 1
+
+
+def test_unknown_object_type_is_rejected_on_open(tmp_path):
+    path = tmp_path / "level.lvl"
+    export(path, sim.generate_level(1, SEED))
+    data = bytearray(path.read_bytes())
+    data[-1] = 99   # last byte of the kind column
+    path.write_bytes(bytes(data))
+    with pytest.raises(LevelFileError, match="unknown object type"):
+        LevelFile(path)
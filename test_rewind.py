@@ -0,0 +1,52 @@
+"""Tests for rewinding through recorded states.
+
+    python -m pytest -q
+"""
+from collections import deque
+
+import pytest
+
+import sim
+from endless import ChunkStreamer
+from levelfile import LevelFiles
+from rewind import Rewind
+from test_sim import SEED, assert_same, level_files, state
+
+
+def make_game(mode, tmp_path):
+    if mode == "endless":
+        return sim.Game(SEED, ChunkStreamer())
+    if mode == "files":
+        probe = sim.Game(SEED)
+        probe.start_game()
+        return sim.Game(SEED, LevelFiles(level_files(tmp_path, probe.run_seed)))
+    return sim.Game(SEED)
+
+
+def switched_off(values):
+    return values['active'].count(False)
+
+
+@pytest.mark.parametrize("mode", ["plain", "endless", "files"])
+def test_rewind_steps_back_through_recorded_states(tmp_path, mode):
+    game = make_game(mode, tmp_path)
+    rewind = Rewind()
+    rewind.attach(game)
+    game.start_game()
+    rewind.clear(game)
+
+    # Fly until the buffer is full and holds frames where objects were hit
+    # or collected
+    history = deque([state(game)], maxlen=rewind.capacity)
+    while not (len(history) == rewind.capacity and switched_off(history[-1]) > switched_off(history[0])):
+        assert game.game_active
+        game.update(sim.autopilot(game))
+        rewind.record(game)
+        history.append(state(game))
+
+    history.pop()
+    while history:
+        assert rewind.step_back(game)
+        assert_same(state(game), history.pop())
+    assert not rewind.step_back(game)
+
@@ -0,0 +1,119 @@
+"""Cached text and overlay rendering.
+
+Font rendering and full-screen alpha surfaces are the most expensive things
+the HUD and the menu screens do, and their content rarely changes between
+frames.  Rendered text is kept in a bounded LRU cache and each overlay is
+composed once into a single surface for as long as its content stays the same.
+"""
+from collections import OrderedDict
+
+import pygame
+
+TEXT_CACHE_SIZE = 256
+
+
+class TextCache:
+    def __init__(self, capacity=TEXT_CACHE_SIZE):
+        self.capacity = capacity
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, color):
+        key = (font, text, color)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surface
+        self.misses += 1
+        surface = font.render(text, True, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.capacity:
+            self.surfaces.popitem(last=False)
+        return surface
+
+
+def build_overlay(size, fill, lines, text_cache, translucent=True):
+    # Compose a translucent full-screen overlay and its text into one surface.
+    # lines holds (font, text, color, center) tuples.  An opaque overlay
+    # (translucent=False) hides the game but is much cheaper to blit.
+    overlay = pygame.Surface(size, pygame.SRCALPHA if translucent else 0)
+    overlay.fill(fill if translucent else fill[:3])
+    for font, text, color, center in lines:
+        if text:
+            rendered = text_cache.render(font, text, color)
+            overlay.blit(rendered, rendered.get_rect(center=center))
+    if pygame.display.get_surface() is not None:
+        overlay = overlay.convert_alpha() if translucent else overlay.convert()
+    return overlay
+
+
+class OverlayCache:
+    # Holds the overlay for the current screen; only rebuilt when its key changes
+    def __init__(self):
+        self.key = None
+        self.surface = None
+
+    def get(self, key, build):
+        if key != self.key or self.surface is None:
+            self.surface = build()
+            self.key = key
+        return self.surface
+
+
+class ProfilerOverlay:
+    # Rolling frame-time graph with percentiles and per-phase means from a
+    # profiler.FrameProfiler.  The text only changes a few times a second,
+    # and then only the numbers are rendered anew: labels come from text_cache.
+    def __init__(self, profiler, font, rect, budget_ms, refresh=15, text_cache=None):
+        self.profiler = profiler
+        self.font = font
+        self.text_cache = TextCache() if text_cache is None else text_cache
+        self.rect = pygame.Rect(rect)
+        self.budget_ms = budget_ms      # the line drawn across the graph
+        self.refresh = refresh
+        self.countdown = 0
+        self.panel = None
+
+    def build_panel(self):
+        panel = pygame.Surface(self.rect.size, pygame.SRCALPHA)
+        panel.fill((0, 0, 0, 170))
+        summary = self.profiler.summary()
+        if summary is not None:
+            # Each line is (label, value) pairs laid out left to right
+            lines = [[(f"{name:<6}p50 ", f"{times[50]:.1f}"), ("  p95 ", f"{times[95]:.1f}"),
+                      ("  p99 ", f"{times[99]:.1f}"), (" ms", "")]
+                     for name, times in (("frame", summary["frame"]), ("busy", summary["busy"]))]
+            phases = sorted(summary["phases"].items(), key=lambda item: -item[1])
+            lines += [[(f"{name:<11}", f"{ms:6.2f}"), (" ms", "")] for name, ms in phases]
+            for i, line in enumerate(lines):
+                x = 6
+                for label, value in line:
+                    surfaces = [self.text_cache.render(self.font, label, (255, 255, 255))]
+                    if value:
+                        surfaces.append(self.font.render(value, True, (255, 255, 255)))
+                    for text in surfaces:
+                        panel.blit(text, (x, 4 + i * 14))
+                        x += text.get_width()
+        return panel
+
+    def draw(self, surface):
+        if self.countdown <= 0 or self.panel is None:
+            self.panel = self.build_panel()
+            self.countdown = self.refresh
+        self.countdown -= 1
+        surface.blit(self.panel, self.rect)
+
+        # Graph along the bottom of the panel: one column per frame, scaled
+        # so the budget line sits halfway up
+        times = self.profiler.frame_times()
+        graph = pygame.Rect(self.rect.x + 6, self.rect.bottom - 46, self.rect.width - 12, 40)
+        scale = graph.height / (2 * self.budget_ms)
+        budget_y = graph.bottom - self.budget_ms * scale
+        points = [(graph.right - (len(times) - 1 - i) * graph.width / max(len(times) - 1, 1),
+                   max(graph.top, graph.bottom - ms * scale)) for i, ms in enumerate(times)]
+        pygame.draw.line(surface, (255, 215, 0), (graph.left, budget_y), (graph.right, budget_y))
+        if len(points) > 1:
+            pygame.draw.lines(surface, (76, 175, 80), False, points)
+        return self.rect
@@ -0,0 +1,257 @@
+"""Vectorized Sky Navigator environments for bots and RL training.
+
+VectorEnv runs N independent games with a Gym-style API:
+
+    with VectorEnv(256) as env:
+        obs = env.reset(seeds=range(256))
+        obs, rewards, dones, info = env.step(actions)
+
+An action is the simulation's input bitmask (0-15, see sim.INPUT_*).  An
+episode is a whole run: levels advance automatically and an environment is
+reset on the step after it finishes.  Environments are sharded across worker
+processes; observations, rewards and flags are written straight into
+shared-memory arrays, so each step only sends a few bytes down a pipe per
+worker.  The arrays returned by reset() and step() are those shared buffers:
+copy them if they must survive the next step.
+"""
+import multiprocessing as mp
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import sim
+from collision import CollisionMasks
+from entities import TYPE_NAMES
+from sim import SCREEN_WIDTH, SCREEN_HEIGHT, MAX_BATTERY, LEVEL_COUNT, LEVEL_LENGTH
+
+NEAREST_OBJECTS = 8
+PLANE_FEATURES = 6
+OBJECT_FEATURES = 2 + len(TYPE_NAMES)   # dx, dy, one-hot type
+OBS_SIZE = PLANE_FEATURES + NEAREST_OBJECTS * OBJECT_FEATURES
+
+# Reward = score gained + BATTERY_WEIGHT * battery gained, and CRASH_PENALTY
+# when the run ends in a game over
+BATTERY_WEIGHT = 1.0
+CRASH_PENALTY = -float(MAX_BATTERY)
+
+# Shared array name -> (dtype, trailing shape)
+BUFFERS = {
+    'obs': (np.float32, (OBS_SIZE,)),
+    'rewards': (np.float32, ()),
+    'dones': (np.bool_, ()),
+    'actions': (np.uint8, ()),
+    'score': (np.int64, ()),
+    'level': (np.int8, ()),
+    'win': (np.bool_, ()),
+}
+
+
+def observe(games, out):
+    # Observations for a batch of games, one row of out each: plane state,
+    # battery and progress, then the nearest visible objects ordered by
+    # distance, as (dx, dy) from the plane plus a one-hot type.  The objects
+    # near every game's screen are gathered into one set of arrays so the
+    # work is a few vectorized passes for the whole batch.
+    out[:] = 0
+    planes = []
+    columns = ([], [], [], [], [], [])
+    counts = []
+    for game in games:
+        plane = game.plane
+        planes.append((plane.y / SCREEN_HEIGHT, plane.velocity_y / 10,
+                       plane.velocity_x / plane.max_velocity_x,
+                       game.battery_level / MAX_BATTERY,
+                       game.level_position / LEVEL_LENGTH, game.level / LEVEL_COUNT,
+                       plane.x + plane.width / 2, plane.y + plane.height / 2))
+        entities = game.entities
+        lo, hi = game.view_window.lo, game.view_window.hi
+        for column, values in zip(columns, (entities.screen_x, entities.y, entities.width,
+                                            entities.height, entities.kind, entities.active)):
+            column.append(values[lo:hi])
+        counts.append(hi - lo)
+    if not games:
+        return
+    planes = np.array(planes)
+    out[:, :PLANE_FEATURES] = planes[:, :PLANE_FEATURES]
+
+    screen_x, y, width, height, kind, active = (np.concatenate(column) for column in columns)
+    env = np.repeat(np.arange(len(games)), counts)
+    shown = active & (screen_x >= -width) & (screen_x <= SCREEN_WIDTH)
+    env = env[shown]
+    dx = (screen_x[shown] + width[shown] / 2 - planes[env, 6]) / SCREEN_WIDTH
+    dy = (y[shown] + height[shown] / 2 - planes[env, 7]) / SCREEN_HEIGHT
+    kind = kind[shown]
+
+    # Sort by environment, then distance, and rank objects within each environment
+    order = np.lexsort((dx * dx + dy * dy, env))
+    env = env[order]
+    first = np.searchsorted(env, env)
+    rank = np.arange(env.size) - first
+    keep = rank < NEAREST_OBJECTS
+    env, rank, order = env[keep], rank[keep], order[keep]
+    base = PLANE_FEATURES + rank * OBJECT_FEATURES
+    out[env, base] = dx[order]
+    out[env, base + 1] = dy[order]
+    out[env, base + 2 + kind[order]] = 1
+
+
+class EnvShard:
+    # A contiguous block of environments stepped in one process, writing
+    # into the given slices of the shared arrays
+    def __init__(self, buffers, frame_skip=1, precise=True):
+        self.buffers = buffers
+        self.frame_skip = frame_skip
+        # Collide on sprite pixels, as the game does; the masks are shared
+        self.masks = CollisionMasks() if precise else None
+        self.games = []
+
+    def reset(self, seeds):
+        self.games = [sim.Game(seed) for seed in seeds]
+        for game in self.games:
+            game.masks = self.masks
+            game.start_game()
+        self.buffers['rewards'][:] = 0
+        self.buffers['dones'][:] = False
+        self.write()
+
+    def step(self):
+        actions = self.buffers['actions'].tolist()
+        rewards = []
+        dones = []
+        for game, action in zip(self.games, actions):
+            if not (game.game_active or game.level_complete):
+                # Finished on the previous step: start the next episode
+                game.start_game()
+            score = game.score
+            battery = game.battery_level
+            for _ in range(self.frame_skip):
+                if game.level_complete:
+                    game.next_level()
+                game.update(action)
+                if not game.game_active:
+                    break
+            reward = game.score - score + BATTERY_WEIGHT * (game.battery_level - battery)
+            if game.game_over:
+                reward += CRASH_PENALTY
+            rewards.append(reward)
+            dones.append(not (game.game_active or game.level_complete))
+        self.buffers['rewards'][:] = rewards
+        self.buffers['dones'][:] = dones
+        self.write()
+
+    def write(self):
+        buffers = self.buffers
+        observe(self.games, buffers['obs'])
+        buffers['score'][:] = [game.score for game in self.games]
+        buffers['level'][:] = [game.level for game in self.games]
+        buffers['win'][:] = [game.win for game in self.games]
+
+
+def allocate(num_envs, shm=None):
+    # Lay the arrays out back to back in one buffer (shared memory or not)
+    layout = []
+    offset = 0
+    for name, (dtype, shape) in BUFFERS.items():
+        shape = (num_envs,) + shape
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        offset = -(-offset // 8) * 8
+        layout.append((name, dtype, shape, offset))
+        offset += size
+    if shm is None:
+        return offset, layout
+    return {name: np.ndarray(shape, dtype, buffer=shm.buf, offset=start)
+            for name, dtype, shape, start in layout}
+
+
+def worker(conn, shm_name, num_envs, start, stop, frame_skip, precise):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    buffers = {name: array[start:stop] for name, array in allocate(num_envs, shm).items()}
+    shard = EnvShard(buffers, frame_skip, precise)
+    while True:
+        command, payload = conn.recv()
+        if command == 'step':
+            shard.step()
+        elif command == 'reset':
+            shard.reset(payload)
+        elif command == 'close':
+            break
+        conn.send(None)
+    # The arrays must go before the mapping can be closed
+    del buffers, shard
+    shm.close()
+    conn.close()
+
+
+class VectorEnv:
+    def __init__(self, num_envs, num_workers=None, frame_skip=1, precise=True):
+        # num_workers=0 steps every environment in this process; precise=False
+        # collides on bounding boxes instead of sprite pixels
+        self.num_envs = num_envs
+        if num_workers is None:
+            num_workers = min(os.cpu_count() or 1, num_envs)
+        size, _ = allocate(num_envs)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        self.buffers = allocate(num_envs, self.shm)
+        self.local = None
+        self.pipes = []
+        self.processes = []
+        if num_workers == 0:
+            self.local = EnvShard(self.buffers, frame_skip, precise)
+            return
+        # Split the environments into one contiguous slice per worker
+        self.bounds = [(num_envs * w // num_workers, num_envs * (w + 1) // num_workers)
+                       for w in range(num_workers)]
+        for start, stop in self.bounds:
+            parent, child = mp.Pipe()
+            process = mp.Process(target=worker, daemon=True,
+                                 args=(child, self.shm.name, num_envs, start, stop, frame_skip, precise))
+            process.start()
+            child.close()
+            self.pipes.append(parent)
+            self.processes.append(process)
+
+    def call(self, command, payloads):
+        for pipe, payload in zip(self.pipes, payloads):
+            pipe.send((command, payload))
+        for pipe in self.pipes:
+            pipe.recv()
+
+    def reset(self, seeds=None):
+        seeds = list(range(self.num_envs)) if seeds is None else list(seeds)
+        if len(seeds) != self.num_envs:
+            raise ValueError(f"expected {self.num_envs} seeds, got {len(seeds)}")
+        if self.local is not None:
+            self.local.reset(seeds)
+        else:
+            self.call('reset', [seeds[start:stop] for start, stop in self.bounds])
+        return self.buffers['obs']
+
+    def step(self, actions):
+        self.buffers['actions'][:] = actions
+        if self.local is not None:
+            self.local.step()
+        else:
+            self.call('step', [None] * len(self.pipes))
+        buffers = self.buffers
+        info = {'score': buffers['score'], 'level': buffers['level'], 'win': buffers['win']}
+        return buffers['obs'], buffers['rewards'], buffers['dones'], info
+
+    def close(self):
+        if self.shm is None:
+            return
+        for pipe in self.pipes:
+            pipe.send(('close', None))
+        for process in self.processes:
+            process.join()
+        self.buffers = None
+        self.local = None
+        self.shm.close()
+        self.shm.unlink()
+        self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()